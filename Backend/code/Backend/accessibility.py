@@ -0,0 +1,78 @@
+import numpy as np
+import polars as pl
+from django.db import transaction
+from .geo import nearest, weighted_percentile
+from .models import BarrioPopulation, DistrictAccessibility, MedicalCenter
+
+CENTER_TYPES = ["hospital", "health_center", "clinic"]
+
+
+def compute_district_accessibility(demand, centers):
+    """
+    Population-weighted mean and 90th percentile distance to the nearest center of each type.
+
+    Args:
+        demand (pl.DataFrame): city_district, population, latitude, longitude
+            per demand point.
+        centers (pl.DataFrame): type_of_center, latitude, longitude per center.
+
+    Returns:
+        list[dict]: One row per (district, center type).
+    """
+    rows = []
+    if demand.is_empty():
+        return rows
+
+    districts = demand["city_district"].to_numpy()
+    weights = demand["population"].to_numpy().astype(np.float64)
+    lat = demand["latitude"].to_numpy()
+    lon = demand["longitude"].to_numpy()
+
+    for center_type in CENTER_TYPES:
+        targets = centers.filter(pl.col("type_of_center") == center_type)
+        if targets.is_empty():
+            continue
+        _, distances = nearest(lat, lon, targets["latitude"].to_numpy(), targets["longitude"].to_numpy())
+
+        for district in np.unique(districts):
+            mask = districts == district
+            district_weights = weights[mask]
+            total = district_weights.sum()
+            if total <= 0:
+                continue
+            rows.append({
+                "city_district": district,
+                "type_of_center": center_type,
+                "population": int(total),
+                "mean_distance_m": float(np.average(distances[mask], weights=district_weights)),
+                "p90_distance_m": weighted_percentile(distances[mask], district_weights, 0.9),
+            })
+
+    return rows
+
+
+def refresh_district_accessibility():
+    """
+    Recomputes the DistrictAccessibility table from the barrio demand points and the current centers.
+
+    Returns:
+        int: Number of rows written.
+    """
+    latest_year = BarrioPopulation.objects.order_by("-year").values_list("year", flat=True).first()
+    demand = pl.DataFrame(
+        list(BarrioPopulation.objects.filter(year=latest_year, latitude__isnull=False)
+             .values("city_district", "population", "latitude", "longitude")),
+        schema={"city_district": pl.Utf8, "population": pl.Int64, "latitude": pl.Float64, "longitude": pl.Float64},
+    )
+    centers = pl.DataFrame(
+        list(MedicalCenter.objects.filter(is_suggested=False).values("type_of_center", "latitude", "longitude")),
+        schema={"type_of_center": pl.Utf8, "latitude": pl.Float64, "longitude": pl.Float64},
+    )
+
+    rows = compute_district_accessibility(demand, centers)
+
+    with transaction.atomic():
+        DistrictAccessibility.objects.all().delete()
+        DistrictAccessibility.objects.bulk_create([DistrictAccessibility(**row) for row in rows])
+
+    return len(rows)
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import MedicalCenter
+from .models import MedicalCenter, BarrioPopulation
 
 admin.site.register(MedicalCenter)
+admin.site.register(BarrioPopulation)
 # Register your models here.
@@ -0,0 +1,113 @@
+import polars as pl
+from .models import BarrioPopulation
+from .population_store import normalized_code, population_barrios
+from .validation import has_valid_coordinates
+
+# Fields compared to decide whether a stored barrio changed
+BARRIO_FIELDS = ["barrio", "city_district", "population", "population_men", "population_women", "latitude", "longitude"]
+
+
+def transform_barrio_population(df_centers, df_population, year=None):
+    """
+    Aggregates the raw population CSV per barrio and gives every barrio a representative point.
+
+    The population file has no coordinates, so a barrio is placed at the mean
+    of the medical centers inside it, or at the mean of its district's centers
+    when it has none. Centers without usable coordinates (missing, NaN or
+    outside ``VALID_BBOX``) are left out, as validation later rejects them.
+
+    The point is a proxy, not where the residents live: it is pulled towards
+    the existing centers, so coverage and proposals built on it lean towards
+    areas that already have centers. Barrios without any center get their
+    district's point.
+
+    Args:
+        df_centers (pl.DataFrame): The raw medical centers CSV.
+        df_population (pl.DataFrame): The raw population CSV.
+        year (int, optional): Year of the "1 de enero de <year>" snapshot to
+            keep. Every year in the file by default.
+
+    Returns:
+        pl.DataFrame: One row per barrio and year with the BarrioPopulation fields.
+    """
+    barrios = population_barrios(df_population)
+    if year is not None:
+        barrios = barrios.filter(pl.col("year") == year)
+
+    centers = df_centers.select(
+        normalized_code("COD-DISTRITO").alias("cod_distrito"),
+        normalized_code("COD-BARRIO").alias("cod_barrio"),
+        pl.col("DISTRITO").cast(pl.Utf8).alias("city_district"),
+        pl.col("LATITUD").cast(pl.Float64, strict=False).alias("latitude"),
+        pl.col("LONGITUD").cast(pl.Float64, strict=False).alias("longitude"),
+    ).filter(has_valid_coordinates())
+
+    barrio_points = centers.group_by(["cod_distrito", "cod_barrio"]).agg(
+        pl.col("latitude").mean(), pl.col("longitude").mean())
+    district_points = centers.group_by("cod_distrito").agg(
+        pl.col("city_district").drop_nulls().first(),
+        pl.col("latitude").mean().alias("district_latitude"),
+        pl.col("longitude").mean().alias("district_longitude"),
+    )
+
+    return barrios.join(
+        barrio_points, on=["cod_distrito", "cod_barrio"], how="left"
+    ).join(
+        district_points, on="cod_distrito", how="left"
+    ).select(
+        pl.col("year").cast(pl.Int64),
+        "cod_distrito",
+        "cod_barrio",
+        "barrio",
+        # Use the centers' spelling of the district so both tables group the same way
+        pl.coalesce("city_district", "distrito").alias("city_district"),
+        pl.col("population").fill_null(0),
+        pl.col("population_men").fill_null(0),
+        pl.col("population_women").fill_null(0),
+        pl.coalesce("latitude", "district_latitude").alias("latitude"),
+        pl.coalesce("longitude", "district_longitude").alias("longitude"),
+    )
+
+
+def update_barrio_population(df):
+    """
+    Brings BarrioPopulation in line with ``df`` touching only what changed.
+
+    Barrios are matched on (year, cod_distrito, cod_barrio): new ones are
+    created, ones whose aggregates changed are updated, and ones that
+    disappeared from the source for that year are deleted. Unchanged rows are
+    not written at all.
+
+    Returns:
+        dict: Number of created, updated, deleted and unchanged barrios.
+    """
+    counts = {"created": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+    if df.is_empty():
+        return counts
+
+    years = df["year"].unique().to_list()
+    existing = {
+        (b.year, b.cod_distrito, b.cod_barrio): b
+        for b in BarrioPopulation.objects.filter(year__in=years)
+    }
+
+    to_create, to_update = [], []
+    for rec in df.to_dicts():
+        key = (rec["year"], rec["cod_distrito"], rec["cod_barrio"])
+        current = existing.pop(key, None)
+        if current is None:
+            to_create.append(BarrioPopulation(**rec))
+        elif any(getattr(current, field) != rec[field] for field in BARRIO_FIELDS):
+            for field in BARRIO_FIELDS:
+                setattr(current, field, rec[field])
+            to_update.append(current)
+        else:
+            counts["unchanged"] += 1
+
+    BarrioPopulation.objects.bulk_create(to_create, batch_size=500)
+    BarrioPopulation.objects.bulk_update(to_update, BARRIO_FIELDS, batch_size=500)
+    if existing:
+        BarrioPopulation.objects.filter(pk__in=[b.pk for b in existing.values()]).delete()
+
+    counts.update(created=len(to_create), updated=len(to_update), deleted=len(existing))
+    return counts
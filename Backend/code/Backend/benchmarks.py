@@ -0,0 +1,329 @@
+import json
+import os
+import platform
+import tempfile
+
+import numpy as np
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from .models import MedicalCenter
+from .profiling import measure
+from .compression import available_encoders
+from .coverage import CoverageSets, maximal_covering
+from .districts import load_district_boundaries
+from .geo import haversine_m, vincenty_m
+from .renderers import FastJSONRenderer
+from .serializers import MEDICAL_CENTER_FIELDS, MedicalCenterSerializer, medical_center_rows
+from .synthetic_data import MADRID_LAT_RANGE, MADRID_LON_RANGE, district_names, generate_district_boundaries
+from .proposed_hospitals_algorithm import insert_proposed_hospitals_into_object
+from .proposed_hospitals_database import insert_hospitals_into_object
+from .views import get_medical_centers, get_proposed_medical_centers
+
+# Relative slowdown allowed before a step counts as a regression
+DEFAULT_TOLERANCE = 0.25
+# Fields each frontend map layer asks for with ?fields=
+LAYER_FIELDS = {
+    "hospitals": ("latitude", "longitude", "name", "street"),
+    "proposed": ("latitude", "longitude"),
+}
+# The values_list + orjson path has to beat ModelSerializer + JSONRenderer end to end by at least this much
+MIN_SERIALIZATION_SPEEDUP = 5.0
+
+
+def _call_view(view, path):
+    response = view.as_view()(RequestFactory().get(path))
+    response.render()
+    return len(response.content)
+
+
+def run_benchmarks(health_center_file, population_file):
+    """
+    Runs ingestion, the proposal algorithm and both list endpoints against the given sources.
+
+    Everything happens inside a transaction that is rolled back at the end,
+    so benchmarking never leaves rows behind in the database.
+
+    Returns:
+        list[dict]: One measurement per step (seconds, peak RSS, query count, ...).
+    """
+    results = []
+
+    with transaction.atomic():
+        with measure("ingestion") as result:
+            profile = insert_hospitals_into_object(health_center_file, population_file)
+        result["stages"] = profile.as_dict()["stages"]
+        result["rows"] = MedicalCenter.objects.filter(is_suggested=False).count()
+        results.append(result)
+
+        with measure("proposal_algorithm") as result:
+            insert_proposed_hospitals_into_object()
+        result["rows"] = MedicalCenter.objects.filter(is_suggested=True).count()
+        results.append(result)
+
+        with measure("get_medical_centers") as result:
+            result["response_bytes"] = _call_view(get_medical_centers, "/api/get_medical_centers")
+        results.append(result)
+
+        with measure("get_proposed_medical_centers") as result:
+            result["response_bytes"] = _call_view(get_proposed_medical_centers, "/api/get_proposed_medical_centers")
+        results.append(result)
+
+        transaction.set_rollback(True)
+
+    return results
+
+
+def _synthetic_centers(rows, seed):
+    rng = np.random.default_rng(seed)
+    districts = district_names(21)
+    return (
+        MedicalCenter(
+            type_of_center=str(rng.choice(["hospital", "health_center", "clinic"])), accesibility=str(i % 3),
+            name=f"Centro de Salud Sintético {i}", city="Madrid", city_district=districts[i % len(districts)],
+            latitude=float(rng.uniform(*MADRID_LAT_RANGE)), longitude=float(rng.uniform(*MADRID_LON_RANGE)),
+            population_in_district=int(rng.integers(50_000, 250_000)), street=f"CALLE SINTETICA {i % 997}, {i}",
+        )
+        for i in range(rows)
+    )
+
+
+def benchmark_serialization(rows=100_000, seed=0):
+    """
+    Times ModelSerializer + JSONRenderer against the values_list + FastJSONRenderer path on ``rows`` centers.
+
+    ``speedup`` compares both paths end to end, from the queryset to the
+    encoded bytes, as the endpoints run them. Each path is then run again in
+    two timed halves: fetching (model instances for DRF, tuples for the
+    fast path) and serializing what was fetched, which gives
+    ``serialization_speedup``. The rows are created inside a transaction
+    that is rolled back at the end.
+
+    Returns:
+        dict: The measurements, both speedups and whether the encoded bytes are identical.
+    """
+    with transaction.atomic():
+        MedicalCenter.objects.bulk_create(_synthetic_centers(rows, seed), batch_size=5_000)
+        queryset = MedicalCenter.objects.all()
+
+        with measure("end_to_end_drf") as drf:
+            expected = JSONRenderer().render(MedicalCenterSerializer(queryset, many=True).data)
+        with measure("end_to_end_fast") as fast:
+            encoded = FastJSONRenderer().render(medical_center_rows(queryset))
+
+        with measure("fetch_models") as fetch_models:
+            instances = list(queryset.all())
+        with measure("serialize_drf") as serialize_drf:
+            JSONRenderer().render(MedicalCenterSerializer(instances, many=True).data)
+        with measure("fetch_rows") as fetch_rows:
+            values = list(queryset.values_list(*MEDICAL_CENTER_FIELDS))
+        with measure("serialize_fast") as serialize_fast:
+            FastJSONRenderer().render([dict(zip(MEDICAL_CENTER_FIELDS, row)) for row in values])
+
+        transaction.set_rollback(True)
+
+    return {
+        "rows": rows,
+        "steps": [drf, fast, fetch_models, serialize_drf, fetch_rows, serialize_fast],
+        "speedup": drf["seconds"] / fast["seconds"],
+        "serialization_speedup": serialize_drf["seconds"] / serialize_fast["seconds"],
+        "identical": encoded == expected,
+        "bytes": len(encoded),
+    }
+
+
+def payload_sizes(rows=None, seed=0):
+    """
+    Response sizes of the center listing with all fields and with each layer's projection, per content coding.
+
+    With ``rows`` the listing is made of that many synthetic centers (rolled
+    back afterwards), otherwise of whatever is in the database.
+
+    Returns:
+        list[dict]: One entry per variant with the byte count for identity and every available coding.
+    """
+    variants = [("all fields", MEDICAL_CENTER_FIELDS), *((f"{layer} layer", f) for layer, f in LAYER_FIELDS.items())]
+    renderer = FastJSONRenderer()
+    sizes = []
+
+    with transaction.atomic():
+        if rows is not None:
+            MedicalCenter.objects.filter(is_suggested=False).delete()
+            MedicalCenter.objects.bulk_create(_synthetic_centers(rows, seed), batch_size=5_000)
+        queryset = MedicalCenter.objects.filter(is_suggested=False)
+
+        for name, fields in variants:
+            body = renderer.render(medical_center_rows(queryset, fields))
+            entry = {"variant": name, "fields": list(fields), "identity": len(body)}
+            for coding, encoder in available_encoders():
+                entry[coding] = len(encoder(body))
+            sizes.append(entry)
+
+        transaction.set_rollback(True)
+
+    return sizes
+
+
+def benchmark_distances(pairs=1_000_000, geopy_pairs=2_000, seed=0):
+    """
+    Throughput of the vectorized distances against per-pair geopy calls, and their error against geopy.
+
+    geopy is far too slow to run on every pair, so it is timed on the
+    first ``geopy_pairs`` and its rate extrapolated; the errors are
+    measured on those pairs too. Without geopy installed only the
+    vectorized timings are reported.
+
+    Returns:
+        dict: The measurements, pairs per second per method and the max errors in meters.
+    """
+    rng = np.random.default_rng(seed)
+    lat1, lat2 = rng.uniform(*MADRID_LAT_RANGE, (2, pairs))
+    lon1, lon2 = rng.uniform(*MADRID_LON_RANGE, (2, pairs))
+
+    with measure("haversine", count_queries=False) as haversine_step:
+        haversine = haversine_m(lat1, lon1, lat2, lon2)
+    with measure("vincenty", count_queries=False) as vincenty_step:
+        vincenty = vincenty_m(lat1, lon1, lat2, lon2)
+    steps = [haversine_step, vincenty_step]
+    result = {
+        "pairs": pairs,
+        "steps": steps,
+        "pairs_per_second": {
+            "haversine": pairs / haversine_step["seconds"],
+            "vincenty": pairs / vincenty_step["seconds"],
+        },
+    }
+
+    try:
+        from geopy.distance import geodesic
+    except ImportError:
+        return result
+
+    sample = min(geopy_pairs, pairs)
+    with measure("geopy_geodesic", count_queries=False) as geopy_step:
+        expected = np.array([geodesic((lat1[i], lon1[i]), (lat2[i], lon2[i])).meters for i in range(sample)])
+    steps.append(geopy_step)
+    result["pairs_per_second"]["geopy"] = sample / geopy_step["seconds"]
+    result["speedup"] = result["pairs_per_second"]["vincenty"] / result["pairs_per_second"]["geopy"]
+    result["max_error_m"] = {
+        "haversine": float(np.abs(haversine[:sample] - expected).max()),
+        "vincenty": float(np.abs(vincenty[:sample] - expected).max()),
+    }
+    return result
+
+
+def benchmark_districts(points=1_000_000, vertices_per_edge=200, jitter=0.2, seed=0):
+    """
+    Time to locate ``points`` random points in the synthetic district polygons.
+
+    The polygons get bent borders with ``vertices_per_edge`` segments per
+    cell side, so each outline has hundreds of vertices like real
+    administrative boundaries.
+
+    Returns:
+        dict: The measurements, points per second and how many points fell inside a district.
+    """
+    rng = np.random.default_rng(seed)
+    lat = rng.uniform(*MADRID_LAT_RANGE, points)
+    lon = rng.uniform(*MADRID_LON_RANGE, points)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = generate_district_boundaries(os.path.join(tmp, "districts.geojson"),
+                                            vertices_per_edge=vertices_per_edge, jitter=jitter, seed=seed)
+        with measure("load_boundaries", count_queries=False) as load_step:
+            boundaries = load_district_boundaries(path)
+    with measure("locate", count_queries=False) as locate_step:
+        district = boundaries.locate(lat, lon)
+    return {
+        "points": points,
+        "vertices": sum(len(part.x0) for part in boundaries.parts),
+        "steps": [load_step, locate_step],
+        "points_per_second": points / locate_step["seconds"],
+        "located": int((district >= 0).sum()),
+    }
+
+
+def benchmark_coverage(demand=100_000, candidates=10_000, sites=50, radius_m=1500.0, clusters=40, seed=0):
+    """
+    Time to build the coverage bitsets and run the maximal covering greedy.
+
+    Demand points gather around ``clusters`` random centers (like people
+    around barrios) with random populations; candidates are uniform over
+    the same 30 km square. The greedy runs unweighted and weighted.
+
+    Returns:
+        dict: The measurements, the coverage bitset size and the share of weight covered.
+    """
+    rng = np.random.default_rng(seed)
+    side = 30_000.0
+    hubs = rng.uniform(0, side, (clusters, 2))
+    points = hubs[rng.integers(0, clusters, demand)] + rng.normal(0, 2_000.0, (demand, 2))
+    weights = rng.integers(1, 500, demand).astype(np.float64)
+    sites_xy = rng.uniform(0, side, (candidates, 2))
+
+    with measure("coverage_sets", count_queries=False) as sets_step:
+        sets = CoverageSets(points[:, 0], points[:, 1], sites_xy[:, 0], sites_xy[:, 1], radius_m)
+    with measure("greedy_unweighted", count_queries=False) as unweighted_step:
+        unweighted = maximal_covering(sets, sites)
+    with measure("greedy_weighted", count_queries=False) as weighted_step:
+        weighted = maximal_covering(sets, sites, weights)
+    return {
+        "demand": demand,
+        "candidates": candidates,
+        "sites": sites,
+        "steps": [sets_step, unweighted_step, weighted_step],
+        "bitset_mb": sets.bits.nbytes / 1e6,
+        "evaluations": {"unweighted": unweighted["evaluations"], "weighted": weighted["evaluations"]},
+        "covered_share": weighted["covered_weight"] / weighted["total_weight"],
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares a benchmark run with a stored one.
+
+    A step regresses when it got slower than ``tolerance`` allows, or when it
+    issues more queries than before (query counts should not drift at all).
+
+    Returns:
+        list[str]: A human readable line for every regression found.
+    """
+    previous = {step["name"]: step for step in baseline.get("steps", [])}
+    regressions = []
+
+    for step in results:
+        before = previous.get(step["name"])
+        if before is None:
+            continue
+        if step["seconds"] > before["seconds"] * (1 + tolerance):
+            regressions.append(
+                f"{step['name']}: {step['seconds']:.3f}s vs baseline {before['seconds']:.3f}s")
+        if step.get("queries", 0) > before.get("queries", 0):
+            regressions.append(
+                f"{step['name']}: {step['queries']} queries vs baseline {before['queries']}")
+        if step["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(
+                f"{step['name']}: peak RSS {step['peak_rss_mb']:.1f}MB vs baseline {before['peak_rss_mb']:.1f}MB")
+
+    return regressions
+
+
+def load_baseline(path, scale):
+    """Returns the stored baseline for ``scale`` (a dataset size label) or None."""
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f).get(scale)
+
+
+def save_baseline(path, scale, results):
+    baselines = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            baselines = json.load(f)
+
+    baselines[scale] = {"machine": platform.node(), "python": platform.python_version(), "steps": results}
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=2)
@@ -0,0 +1,204 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+from django.conf import settings
+
+from .dataset_version import current_dataset_version
+from .geo import haversine_m
+from .models import MedicalCenter
+from .serializers import MEDICAL_CENTER_FIELDS
+
+# Text columns are stored as references into a shared string table
+STRING_FIELDS = ("type_of_center", "accesibility", "name", "city", "city_district", "street")
+SNAPSHOT_DTYPE = np.dtype([
+    ("id", "<i8"),
+    ("latitude", "<f8"),
+    ("longitude", "<f8"),
+    ("population_in_district", "<i8"),
+    ("is_suggested", "?"),
+    *[(field, "<u4") for field in STRING_FIELDS],
+])
+POINTER = "centers.json"
+
+
+def snapshot_root():
+    return str(settings.CENTER_SNAPSHOT_ROOT)
+
+
+# --- Writing -------------------------------------------------------------
+
+def write_center_snapshot(version=None, root=None, chunk_size=50_000):
+    """
+    Dumps every MedicalCenter row into a new memory-mappable snapshot and publishes it.
+
+    The table is a structured array sorted by id; text columns hold offsets
+    into a deduplicated UTF-8 string table. Like the raster store, each
+    snapshot lives in its own directory and becomes current when the
+    pointer file is atomically replaced.
+
+    Returns:
+        dict: The metadata of the new snapshot.
+    """
+    root = root or snapshot_root()
+    os.makedirs(root, exist_ok=True)
+    if version is None:
+        version = current_dataset_version()
+
+    rows = (MedicalCenter.objects.order_by("pk")
+            .values_list("pk", "latitude", "longitude", "population_in_district", "is_suggested", *STRING_FIELDS)
+            .iterator(chunk_size=chunk_size))
+    string_ids = {}
+    records = [
+        (*row[:5], *(string_ids.setdefault(value, len(string_ids)) for value in row[5:]))
+        for row in rows
+    ]
+    table = np.array(records, dtype=SNAPSHOT_DTYPE)
+
+    encoded = [value.encode("utf-8") for value in string_ids]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+
+    name = f"centers-v{version}-{uuid.uuid4().hex[:8]}"
+    directory = os.path.join(root, name)
+    os.makedirs(directory)
+    np.save(os.path.join(directory, "centers.npy"), table)
+    np.save(os.path.join(directory, "string_offsets.npy"), offsets)
+    with open(os.path.join(directory, "strings.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+
+    metadata = {"name": name, "version": version, "rows": int(table.size), "strings": len(encoded)}
+    with open(os.path.join(directory, "metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+    pointer = os.path.join(root, POINTER)
+    previous = _read_pointer(pointer)
+    tmp_pointer = pointer + ".tmp"
+    with open(tmp_pointer, "w") as f:
+        json.dump({"name": name}, f)
+    os.replace(tmp_pointer, pointer)
+
+    # Workers that already mapped the old files keep them valid until they reload
+    if previous and previous != name:
+        shutil.rmtree(os.path.join(root, previous), ignore_errors=True)
+
+    print(f"Center snapshot {name}: {table.size} rows, {len(encoded)} strings")
+    return metadata
+
+
+# --- Reading -------------------------------------------------------------
+
+def _read_pointer(pointer):
+    try:
+        with open(pointer) as f:
+            return json.load(f)["name"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class CenterSnapshot:
+    """One published snapshot, mapped read-only; every worker shares the same pages."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "metadata.json")) as f:
+            self.metadata = json.load(f)
+        self.table = np.load(os.path.join(directory, "centers.npy"), mmap_mode="r")
+        self._offsets = np.load(os.path.join(directory, "string_offsets.npy"), mmap_mode="r")
+        strings = os.path.join(directory, "strings.bin")
+        # np.memmap refuses empty files
+        self._strings = (np.memmap(strings, dtype=np.uint8, mode="r") if os.path.getsize(strings)
+                         else np.zeros(0, dtype=np.uint8))
+
+    @property
+    def version(self):
+        return self.metadata["version"]
+
+    def __len__(self):
+        return self.table.size
+
+    def string(self, ref):
+        start, end = self._offsets[ref], self._offsets[ref + 1]
+        return self._strings[start:end].tobytes().decode("utf-8")
+
+    def select(self, is_suggested=None):
+        """Row indices, optionally only existing centers (False) or proposals (True)."""
+        if is_suggested is None:
+            return np.arange(self.table.size)
+        return np.flatnonzero(self.table["is_suggested"] == is_suggested)
+
+    def bbox(self, west, south, east, north, is_suggested=None):
+        """Row indices (in id order) of the points inside the box."""
+        lat, lon = self.table["latitude"], self.table["longitude"]
+        mask = (lon >= west) & (lon <= east) & (lat >= south) & (lat <= north)
+        if is_suggested is not None:
+            mask &= self.table["is_suggested"] == is_suggested
+        return np.flatnonzero(mask)
+
+    def where(self, indices, field, value):
+        """The subset of ``indices`` whose text column ``field`` equals ``value``."""
+        refs = self.table[field][indices]
+        wanted = [ref for ref in np.unique(refs).tolist() if self.string(ref) == value]
+        return indices[np.isin(refs, wanted)]
+
+    def nearest(self, latitude, longitude, k=1, is_suggested=None):
+        """
+        The ``k`` rows closest to a point.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Row indices and distances in meters, closest first.
+        """
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        candidates = self.select(is_suggested)
+        if not candidates.size:
+            return candidates, np.zeros(0)
+        distances = haversine_m(latitude, longitude, self.table["latitude"][candidates],
+                                self.table["longitude"][candidates])
+        k = min(k, candidates.size)
+        closest = np.argpartition(distances, k - 1)[:k]
+        closest = closest[np.argsort(distances[closest], kind="stable")]
+        return candidates[closest], distances[closest]
+
+    def records(self, indices, fields=MEDICAL_CENTER_FIELDS):
+        """Rows as dicts with the same keys and value types as MedicalCenterSerializer."""
+        rows = self.table[indices]
+        columns = []
+        for field in fields:
+            if field in STRING_FIELDS:
+                columns.append([self.string(ref) for ref in rows[field].tolist()])
+            else:
+                columns.append(rows[field].tolist())
+        return [dict(zip(fields, values)) for values in zip(*columns)]
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(root=None):
+    """The published snapshot, remapped when the pointer file moves; None before the first one."""
+    root = root or snapshot_root()
+    name = _read_pointer(os.path.join(root, POINTER))
+    if name is None:
+        return None
+    with _snapshots_lock:
+        snapshot = _snapshots.get(root)
+        if snapshot is None or snapshot.metadata["name"] != name:
+            try:
+                snapshot = _snapshots[root] = CenterSnapshot(os.path.join(root, name))
+            except OSError:
+                # Replaced and removed between reading the pointer and mapping it
+                return None
+        return snapshot
+
+
+def current_snapshot():
+    """The published snapshot if it reflects the latest dataset version, else None (read from the ORM)."""
+    snapshot = get_snapshot()
+    if snapshot is None or snapshot.version != current_dataset_version():
+        return None
+    return snapshot
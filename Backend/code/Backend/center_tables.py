@@ -0,0 +1,219 @@
+from django.core.management.color import no_style
+from django.db import connection
+
+from .models import MedicalCenter
+
+# Two physical tables take turns: the live one, and the one the last swap took out (kept for rollback).
+# While an ingestion loads it, the second one is named "staging"; a failed load leaves nothing to roll back to.
+STAGING_SUFFIX = "_staging"
+PREVIOUS_SUFFIX = "_previous"
+# On PostgreSQL a swap waits at most this long for readers holding the live table before giving up
+SWAP_LOCK_TIMEOUT = "5s"
+WRITE_BATCH_SIZE = 500
+
+
+class TableSwapError(ValueError):
+    """Staging table failed validation, the centers changed during the load, or there is nothing to roll back to."""
+
+
+def live_table():
+    return MedicalCenter._meta.db_table
+
+
+def staging_table():
+    return live_table() + STAGING_SUFFIX
+
+
+def previous_table():
+    return live_table() + PREVIOUS_SUFFIX
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _columns():
+    return [field.column for field in MedicalCenter._meta.concrete_fields]
+
+
+def _table_exists(cursor, table):
+    return table in connection.introspection.table_names(cursor)
+
+
+def _index_names(cursor, table):
+    constraints = connection.introspection.get_constraints(cursor, table)
+    return {name for name, info in constraints.items() if info["index"] and not info["primary_key"]}
+
+
+def _index_columns(index):
+    return ", ".join(_quote(MedicalCenter._meta.get_field(field).column) for field in index.fields)
+
+
+def _create_table_like_live(cursor, table):
+    """An empty copy of the live table's columns and primary key, without its secondary indexes."""
+    if connection.vendor == "postgresql":
+        cursor.execute(f"CREATE TABLE {_quote(table)} "
+                       f"(LIKE {_quote(live_table())} INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING CONSTRAINTS)")
+        cursor.execute(f"ALTER TABLE {_quote(table)} ADD PRIMARY KEY ({_quote(MedicalCenter._meta.pk.column)})")
+        return
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [live_table()])
+    (sql,) = cursor.fetchone()
+    cursor.execute(sql.replace(_quote(live_table()), _quote(table), 1))
+
+
+def _move_index(cursor, table, index, old_name, new_name):
+    """Gives ``table`` the index under ``new_name``: renamed where the backend can, otherwise rebuilt."""
+    existing = _index_names(cursor, table)
+    if connection.features.can_rename_index and old_name in existing:
+        cursor.execute(f"ALTER INDEX {_quote(old_name)} RENAME TO {_quote(new_name)}")
+        return
+    if old_name in existing:
+        cursor.execute(f"DROP INDEX {_quote(old_name)}")
+    if new_name not in existing:
+        cursor.execute(f"CREATE INDEX {_quote(new_name)} ON {_quote(table)} ({_index_columns(index)})")
+
+
+def _write_rows(cursor, table, rows):
+    columns = _columns()
+    sql = (f"INSERT INTO {_quote(table)} ({', '.join(_quote(column) for column in columns)}) "
+           f"VALUES ({', '.join(['%s'] * len(columns))})")
+    for start in range(0, len(rows), WRITE_BATCH_SIZE):
+        cursor.executemany(sql, rows[start:start + WRITE_BATCH_SIZE])
+
+
+def _delete_rows(cursor, table, pks):
+    for start in range(0, len(pks), WRITE_BATCH_SIZE):
+        batch = pks[start:start + WRITE_BATCH_SIZE]
+        cursor.execute(f"DELETE FROM {_quote(table)} WHERE {_quote(MedicalCenter._meta.pk.column)} "
+                       f"IN ({', '.join(['%s'] * len(batch))})", batch)
+
+
+def _row(center):
+    return [field.get_db_prep_save(getattr(center, field.attname), connection)
+            for field in MedicalCenter._meta.concrete_fields]
+
+
+def build_staging(to_create, to_update, to_delete):
+    """
+    Loads the centers as they will be after a sync into the staging table, then indexes and validates it.
+
+    The staging table starts as a server-side copy of the live table
+    (``INSERT ... SELECT``) and gets the sync's deletes, updates and
+    inserts; ``to_create`` must already carry their ids. Secondary indexes
+    are built after the load, under temporary names. Nothing here touches
+    the live table beyond reading it, so readers are never blocked.
+
+    Raises:
+        TableSwapError: The staging row count is not the expected one.
+
+    Returns:
+        int: Rows in the staging table.
+    """
+    staging, previous = staging_table(), previous_table()
+    with connection.cursor() as cursor:
+        expected = MedicalCenter.objects.count() + len(to_create) - len(to_delete)
+        # Recycle the previous version's table (giving up the rollback target), or create the second table
+        if not _table_exists(cursor, staging):
+            if _table_exists(cursor, previous):
+                cursor.execute(f"ALTER TABLE {_quote(previous)} RENAME TO {_quote(staging)}")
+            else:
+                _create_table_like_live(cursor, staging)
+        for name in _index_names(cursor, staging):
+            cursor.execute(f"DROP INDEX {_quote(name)}")
+        for sql in connection.ops.sql_flush(no_style(), [staging]):
+            cursor.execute(sql)
+
+        columns = ", ".join(_quote(column) for column in _columns())
+        cursor.execute(f"INSERT INTO {_quote(staging)} ({columns}) SELECT {columns} FROM {_quote(live_table())}")
+        _delete_rows(cursor, staging, [center.pk for center in to_update] + list(to_delete))
+        _write_rows(cursor, staging, [_row(center) for center in [*to_update, *to_create]])
+
+        for index in MedicalCenter._meta.indexes:
+            cursor.execute(f"CREATE INDEX {_quote(index.name + STAGING_SUFFIX)} ON {_quote(staging)} "
+                           f"({_index_columns(index)})")
+
+        cursor.execute(f"SELECT COUNT(*) FROM {_quote(staging)}")
+        (rows,) = cursor.fetchone()
+    if rows != expected:
+        raise TableSwapError(f"Staging table has {rows} centers, expected {expected}")
+    return rows
+
+
+def swap_in(incoming, incoming_suffix):
+    """
+    Makes ``incoming`` the live table and keeps the live one as the previous version.
+
+    Must run inside the transaction that records the new dataset version.
+    Only renames happen here, so the live table is locked for moments: on
+    PostgreSQL the swap waits at most ``SWAP_LOCK_TIMEOUT`` for readers.
+    """
+    live, previous = live_table(), previous_table()
+    parking = live + "_swap"
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+            cursor.execute(f"LOCK TABLE {_quote(live)} IN ACCESS EXCLUSIVE MODE")
+        if incoming != previous and _table_exists(cursor, previous):
+            cursor.execute(f"DROP TABLE {_quote(previous)}")
+
+        cursor.execute(f"ALTER TABLE {_quote(live)} RENAME TO {_quote(parking)}")
+        cursor.execute(f"ALTER TABLE {_quote(incoming)} RENAME TO {_quote(live)}")
+        cursor.execute(f"ALTER TABLE {_quote(parking)} RENAME TO {_quote(previous)}")
+        # The live table always carries the model's index names, so migrations keep finding them.
+        # The outgoing index is parked first: on rollback the incoming one holds the "previous" name.
+        for index in MedicalCenter._meta.indexes:
+            _move_index(cursor, previous, index, index.name, index.name + "_swap")
+            _move_index(cursor, live, index, index.name + incoming_suffix, index.name)
+            _move_index(cursor, previous, index, index.name + "_swap", index.name + PREVIOUS_SUFFIX)
+        for sql in connection.ops.sequence_reset_sql(no_style(), [MedicalCenter]):
+            cursor.execute(sql)
+
+
+def swap_in_staging():
+    swap_in(staging_table(), STAGING_SUFFIX)
+
+
+def drop_spare_tables():
+    """Drops the previous and staging tables, e.g. once the live one was replaced wholesale by a restore."""
+    with connection.cursor() as cursor:
+        for table in (previous_table(), staging_table()):
+            if _table_exists(cursor, table):
+                cursor.execute(f"DROP TABLE {_quote(table)}")
+
+
+def has_previous():
+    with connection.cursor() as cursor:
+        return _table_exists(cursor, previous_table())
+
+
+def previous_changes():
+    """
+    What rolling back would change, as (id, is_suggested, op) per center that differs between the two tables.
+
+    Raises:
+        TableSwapError: No previous version is kept.
+    """
+    if not has_previous():
+        raise TableSwapError("No previous center table to roll back to")
+    columns = ", ".join(_quote(column) for column in _columns())
+    pk, suggested = _columns().index(MedicalCenter._meta.pk.column), _columns().index("is_suggested")
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {columns} FROM {_quote(live_table())}")
+        live = {row[pk]: row for row in cursor.fetchall()}
+        cursor.execute(f"SELECT {columns} FROM {_quote(previous_table())}")
+        previous = {row[pk]: row for row in cursor.fetchall()}
+    changes = [(key, bool(row[suggested]), "delete") for key, row in live.items() if key not in previous]
+    changes += [(key, bool(row[suggested]), "insert" if key not in live else "update")
+                for key, row in previous.items() if live.get(key) != row]
+    return changes
+
+
+def next_center_id():
+    """First id above every center, live or previous, so a swap never reuses an id clients may still hold."""
+    ids = [MedicalCenter.objects.order_by("-pk").values_list("pk", flat=True).first() or 0]
+    with connection.cursor() as cursor:
+        for table in (previous_table(), staging_table()):
+            if _table_exists(cursor, table):
+                cursor.execute(f"SELECT MAX({_quote(MedicalCenter._meta.pk.column)}) FROM {_quote(table)}")
+                ids.append(cursor.fetchone()[0] or 0)
+    return max(ids) + 1
@@ -0,0 +1,224 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+
+from .center_tables import (
+    PREVIOUS_SUFFIX,
+    TableSwapError,
+    build_staging,
+    next_center_id,
+    previous_changes,
+    previous_table,
+    swap_in,
+    swap_in_staging,
+)
+from .dataset_version import bump_dataset_version, current_dataset_version
+from .models import CenterChange, MedicalCenter
+from .serializers import MEDICAL_CENTER_FIELDS, medical_center_rows
+from .summary import refresh_summary
+
+# Columns written by ingestion and proposals (everything but the id)
+CENTER_FIELDS = tuple(field for field in MEDICAL_CENTER_FIELDS if field != "id")
+# How a row from a new run is matched to the stored one. Proposals are one per district.
+CENTER_KEYS = {
+    False: ("type_of_center", "name", "street"),
+    True: ("city_district",),
+}
+DEFAULT_RETENTION_VERSIONS = 20
+# Syncs writing at least this many rows load a staging table and swap it in instead of writing the live one
+DEFAULT_SWAP_MIN_CHANGES = 1_000
+DEFAULT_PAGE_SIZE = 10_000
+
+
+def _record_version(reason, log):
+    """Bumps the dataset version and logs ``log`` ((id, is_suggested, op) per center) with its summary."""
+    version = bump_dataset_version(reason)
+    CenterChange.objects.bulk_create(
+        [CenterChange(center_id=pk, is_suggested=is_suggested, op=op, version=version) for pk, is_suggested, op in log],
+        batch_size=1_000,
+    )
+    refresh_summary(version)
+    return version
+
+
+def sync_centers(records, is_suggested, reason, swap=None):
+    """
+    Makes the stored centers (or proposals) match ``records``, writing only what changed.
+
+    Rows are matched on ``CENTER_KEYS`` (repeated keys pair up in id
+    order): new ones are inserted, ones with different values updated and
+    ones missing from ``records`` deleted. When anything changed, a new
+    dataset version is recorded together with one CenterChange per
+    touched id and the summary of the new version, in the same transaction.
+
+    Large syncs (``CENTER_SWAP_MIN_CHANGES`` rows or more) do not write the
+    live table: the new state is loaded, indexed and counted in a staging
+    table, which then replaces the live one by renames in that short
+    transaction. The replaced table is kept for ``rollback_centers``.
+
+    Args:
+        records (list[dict]): Rows with every field in ``CENTER_FIELDS``.
+        is_suggested (bool): Whether these are proposals or existing centers.
+        reason (str): Stored with the dataset version.
+        swap (bool, optional): Force (True) or rule out (False) the staging
+            table instead of deciding by the number of changes.
+
+    Raises:
+        TableSwapError: The staging table failed validation, or the centers
+            changed while it was loading (the live table is left as it was).
+
+    Returns:
+        tuple[dict, int]: Number of inserted, updated, deleted and unchanged
+        rows, and the dataset version after the sync.
+    """
+    key_fields = CENTER_KEYS[is_suggested]
+    key_index = [CENTER_FIELDS.index(field) for field in key_fields]
+
+    existing = {}
+    for pk, *values in (MedicalCenter.objects.filter(is_suggested=is_suggested).order_by("pk")
+                        .values_list("pk", *CENTER_FIELDS)):
+        existing.setdefault(tuple(values[i] for i in key_index), []).append((pk, values))
+
+    to_create, to_update, unchanged = [], [], 0
+    for rec in records:
+        values = [rec[field] for field in CENTER_FIELDS]
+        matches = existing.get(tuple(values[i] for i in key_index))
+        if not matches:
+            to_create.append(MedicalCenter(**rec))
+            continue
+        pk, current = matches.pop(0)
+        if current != values:
+            to_update.append(MedicalCenter(pk=pk, **rec))
+        else:
+            unchanged += 1
+    to_delete = [pk for matches in existing.values() for pk, _ in matches]
+
+    counts = {"inserted": len(to_create), "updated": len(to_update), "deleted": len(to_delete), "unchanged": unchanged}
+    if not (to_create or to_update or to_delete):
+        return counts, current_dataset_version()
+
+    if swap is None:
+        min_changes = getattr(settings, "CENTER_SWAP_MIN_CHANGES", DEFAULT_SWAP_MIN_CHANGES)
+        swap = len(to_create) + len(to_update) + len(to_delete) >= min_changes
+
+    if swap:
+        loaded_version = current_dataset_version()
+        first_id = next_center_id()
+        for offset, center in enumerate(to_create):
+            center.pk = first_id + offset
+        rows = build_staging(to_create, to_update, to_delete)
+        created = to_create
+    with transaction.atomic():
+        if swap:
+            swap_in_staging()
+            # Checked after taking the live table: a sync that committed meanwhile is not in staging
+            if current_dataset_version() != loaded_version:
+                raise TableSwapError("The centers changed while the staging table was loading; run the sync again")
+            print(f"Swapped in a staging table of {rows} centers")
+        else:
+            created = MedicalCenter.objects.bulk_create(to_create, batch_size=500)
+            MedicalCenter.objects.bulk_update(to_update, CENTER_FIELDS, batch_size=500)
+            for start in range(0, len(to_delete), 500):
+                MedicalCenter.objects.filter(pk__in=to_delete[start:start + 500]).delete()
+
+        log = [(center.pk, is_suggested, "insert") for center in created]
+        log += [(center.pk, is_suggested, "update") for center in to_update]
+        log += [(pk, is_suggested, "delete") for pk in to_delete]
+        version = _record_version(reason, log)
+
+    compact_change_log()
+    return counts, version
+
+
+def rollback_centers():
+    """
+    Swaps the centers back to the table the last staging swap replaced; the current one becomes the previous.
+
+    Recorded as a new dataset version whose change log lists every center
+    that differs between the two tables, so clients patch their copies as
+    after any other sync. Rolling back twice returns to where it started.
+
+    Raises:
+        TableSwapError: No previous table is kept (no swap yet, or a failed load reused it).
+
+    Returns:
+        tuple[int, int]: Centers changed and the new dataset version.
+    """
+    with transaction.atomic():
+        log = previous_changes()
+        swap_in(previous_table(), PREVIOUS_SUFFIX)
+        version = _record_version("rollback", log)
+    compact_change_log()
+    return len(log), version
+
+
+def compact_change_log(keep_versions=None):
+    """
+    Drops the changes of all but the last ``keep_versions`` dataset versions.
+
+    Clients whose cursor falls behind the horizon are told to reset and
+    refetch the full listing.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    if keep_versions is None:
+        keep_versions = getattr(settings, "CHANGE_LOG_RETENTION_VERSIONS", DEFAULT_RETENTION_VERSIONS)
+    horizon = current_dataset_version() - keep_versions
+    if horizon <= 0:
+        return 0
+    deleted, _ = CenterChange.objects.filter(version__lte=horizon).delete()
+    return deleted
+
+
+def latest_change_seq():
+    return CenterChange.objects.aggregate(latest=Max("seq"))["latest"] or 0
+
+
+def changes_since(since, fields=MEDICAL_CENTER_FIELDS, limit=DEFAULT_PAGE_SIZE):
+    """
+    The changes after ``since``, at most one per id, with the current row for inserts and updates.
+
+    A client applies a page by dropping every listed id from its copy and
+    adding back the returned rows, then asks again from ``latest`` while
+    ``more`` is true. ``reset`` means ``since`` is older than the log
+    (compacted) or newer than it (the database was rebuilt): the client
+    has to refetch everything instead.
+    """
+    bounds = CenterChange.objects.aggregate(oldest=Min("seq"), latest=Max("seq"))
+    oldest, latest = bounds["oldest"], bounds["latest"] or 0
+    if since > latest or (oldest is not None and since < oldest - 1):
+        return {"since": since, "latest": latest, "reset": True, "more": False, "changes": []}
+
+    page = list(CenterChange.objects.filter(seq__gt=since).order_by("seq")[:limit])
+    last = {}
+    for change in page:
+        last.pop(change.center_id, None)
+        last[change.center_id] = change  # keeps seq order of the latest change per id
+
+    upserted = [change.center_id for change in last.values() if change.op != "delete"]
+    row_fields = fields if "id" in fields else ("id", *fields)
+    rows = {row["id"]: row for row in medical_center_rows(MedicalCenter.objects.filter(pk__in=upserted), row_fields)}
+    if "id" not in fields:
+        for row in rows.values():
+            del row["id"]
+
+    changes = [
+        {
+            "seq": change.seq,
+            "op": change.op,
+            "id": change.center_id,
+            "is_suggested": change.is_suggested,
+            "version": change.version,
+            # None when a later change (on a next page) deleted the row
+            "row": None if change.op == "delete" else rows.get(change.center_id),
+        }
+        for change in last.values()
+    ]
+    return {
+        "since": since,
+        "latest": page[-1].seq if page else since,
+        "reset": False,
+        "more": len(page) == limit,
+        "changes": changes,
+    }
@@ -0,0 +1,116 @@
+import gzip
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+DEFAULT_MIN_BYTES = 1024
+# Already compressed; recompressing only costs CPU. Raw grids (raster tiles, heatmaps) are not, and shrink a lot.
+SKIP_CONTENT_TYPES = ("image/png",)
+
+
+def _gzip(data):
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _brotli(data):
+    return brotli.compress(data, quality=5)
+
+
+def _zstd(data):
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def available_encoders():
+    """Supported content codings, most preferred first."""
+    encoders = []
+    if zstandard is not None:
+        encoders.append(("zstd", _zstd))
+    if brotli is not None:
+        encoders.append(("br", _brotli))
+    encoders.append(("gzip", _gzip))
+    return encoders
+
+
+def parse_accept_encoding(header):
+    """Maps each coding in an Accept-Encoding header to its q-value."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    return accepted
+
+
+def negotiate_encoding(header):
+    """
+    Picks the coding to use for an Accept-Encoding header, or None for identity.
+
+    The client's q-values win; on a tie the server's preference
+    (zstd, then br, then gzip) decides.
+    """
+    accepted = parse_accept_encoding(header or "")
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding, encoder in available_encoders():
+        q = accepted.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = (coding, encoder), q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with zstd, brotli or gzip, whichever the client accepts and is installed.
+
+    Responses smaller than ``settings.COMPRESSION_MIN_BYTES`` are sent as
+    they are, since the headers would cost more than the bytes saved.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (response.streaming or response.has_header("Content-Encoding")
+                or response.get("Content-Type", "").startswith(SKIP_CONTENT_TYPES)):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if len(response.content) < getattr(settings, "COMPRESSION_MIN_BYTES", DEFAULT_MIN_BYTES):
+            return response
+
+        negotiated = negotiate_encoding(request.META.get("HTTP_ACCEPT_ENCODING"))
+        if negotiated is None:
+            return response
+        coding, encoder = negotiated
+
+        compressed = encoder(response.content)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = coding
+        # The representation changed, so a strong ETag no longer matches it byte for byte
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
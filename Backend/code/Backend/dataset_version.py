@@ -0,0 +1,18 @@
+from django.db import transaction
+
+from .models import DatasetVersion
+
+
+def current_dataset_version():
+    """The latest dataset version, 0 if nothing was ever ingested."""
+    return DatasetVersion.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+
+
+def bump_dataset_version(reason):
+    """Records that the centers changed; caches keyed by the version become stale."""
+    from .events import broadcaster
+
+    version = DatasetVersion.objects.create(reason=reason).pk
+    # Push it to this process' SSE clients as soon as they can read it
+    transaction.on_commit(broadcaster.notify)
+    return version
@@ -0,0 +1,246 @@
+import io
+import json
+import os
+import shutil
+import uuid
+
+import polars as pl
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from .center_snapshot import current_snapshot, write_center_snapshot
+from .center_tables import drop_spare_tables
+from .dataset_version import current_dataset_version
+from .models import (
+    BarrioPopulation,
+    CenterChange,
+    DatasetSummary,
+    DatasetVersion,
+    DistrictAccessibility,
+    MedicalCenter,
+)
+from .population_store import get_population_store, write_population_barrios
+
+POINTER = "db_snapshot.json"
+# Bump when the file layout changes; table schemas are checked column by column
+DB_SNAPSHOT_FORMAT = 1
+# Everything ingestion writes; the change log and versions go along so client cursors stay valid
+SNAPSHOT_MODELS = (DatasetVersion, CenterChange, DatasetSummary, MedicalCenter, BarrioPopulation, DistrictAccessibility)
+COLUMN_DTYPES = {
+    "AutoField": pl.Int64,
+    "BigAutoField": pl.Int64,
+    "IntegerField": pl.Int64,
+    "BigIntegerField": pl.Int64,
+    "FloatField": pl.Float64,
+    "BooleanField": pl.Boolean,
+    "CharField": pl.Utf8,
+    "TextField": pl.Utf8,
+    "DateTimeField": pl.Datetime("us", "UTC"),
+}
+# Values the database adapter cannot take as they come out of Parquet (naive vs aware datetimes, ...)
+PREPARED_TYPES = {"DateTimeField"}
+INSERT_BATCH_SIZE = 2_000
+
+
+class DbSnapshotError(ValueError):
+    """No snapshot, or one that does not fit this database."""
+
+
+def snapshot_root():
+    return str(settings.DB_SNAPSHOT_ROOT)
+
+
+def table_columns(model):
+    """(column, Django field type) of every concrete field, in model order."""
+    return [(field.column, field.get_internal_type()) for field in model._meta.concrete_fields]
+
+
+def table_schema(model):
+    columns = table_columns(model)
+    unknown = [internal_type for _, internal_type in columns if internal_type not in COLUMN_DTYPES]
+    if unknown:
+        raise DbSnapshotError(f"{model._meta.db_table}: no snapshot type for {', '.join(unknown)}")
+    return {column: COLUMN_DTYPES[internal_type] for column, internal_type in columns}
+
+
+# --- Writing -------------------------------------------------------------
+
+def _read_table(model, chunk_size):
+    fields = [field.attname for field in model._meta.concrete_fields]
+    rows = model.objects.order_by("pk").values_list(*fields).iterator(chunk_size=chunk_size)
+    return pl.DataFrame(list(rows), schema=table_schema(model), orient="row")
+
+
+def write_db_snapshot(root=None, chunk_size=50_000):
+    """
+    Dumps the ingested tables to Parquet together with the dataset version they hold, and publishes the snapshot.
+
+    All tables are read in one transaction (repeatable read on PostgreSQL)
+    so they agree with each other and with the version. Like the other
+    stores the snapshot is written to a new directory and becomes current
+    when the pointer file is atomically replaced.
+
+    Returns:
+        dict: The manifest of the new snapshot.
+    """
+    root = root or snapshot_root()
+    os.makedirs(root, exist_ok=True)
+
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        version = current_dataset_version()
+        tables = {model: _read_table(model, chunk_size) for model in SNAPSHOT_MODELS}
+
+    name = f"db-v{version}-{uuid.uuid4().hex[:8]}"
+    directory = os.path.join(root, name)
+    os.makedirs(directory)
+    manifest = {"name": name, "format": DB_SNAPSHOT_FORMAT, "dataset_version": version, "tables": {}}
+    for model, df in tables.items():
+        table = model._meta.db_table
+        df.write_parquet(os.path.join(directory, f"{table}.parquet"), compression="zstd")
+        manifest["tables"][table] = {
+            "file": f"{table}.parquet",
+            "rows": df.height,
+            "columns": [list(column) for column in table_columns(model)],
+        }
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    pointer = os.path.join(root, POINTER)
+    previous = _read_pointer(pointer)
+    tmp_pointer = pointer + ".tmp"
+    with open(tmp_pointer, "w") as f:
+        json.dump({"name": name}, f)
+    os.replace(tmp_pointer, pointer)
+    if previous and previous != name:
+        shutil.rmtree(os.path.join(root, previous), ignore_errors=True)
+
+    rows = sum(entry["rows"] for entry in manifest["tables"].values())
+    print(f"Database snapshot {name}: {rows} rows in {len(tables)} tables")
+    return manifest
+
+
+# --- Restoring -----------------------------------------------------------
+
+def _read_pointer(pointer):
+    try:
+        with open(pointer) as f:
+            return json.load(f)["name"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def get_db_snapshot(root=None):
+    """(directory, manifest) of the published snapshot, or None before the first one."""
+    root = root or snapshot_root()
+    name = _read_pointer(os.path.join(root, POINTER))
+    if name is None:
+        return None
+    directory = os.path.join(root, name)
+    try:
+        with open(os.path.join(directory, "manifest.json")) as f:
+            return directory, json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def check_db_snapshot(manifest):
+    """Raises DbSnapshotError unless ``manifest`` was written with this layout and these table schemas."""
+    if manifest.get("format") != DB_SNAPSHOT_FORMAT:
+        raise DbSnapshotError(f"Snapshot format {manifest.get('format')} is not {DB_SNAPSHOT_FORMAT}")
+    for model in SNAPSHOT_MODELS:
+        entry = manifest["tables"].get(model._meta.db_table)
+        if entry is None or [tuple(column) for column in entry["columns"]] != table_columns(model):
+            raise DbSnapshotError(f"Snapshot schema of {model._meta.db_table} does not match the current models")
+
+
+def _copy_table(cursor, table, df):
+    """Loads ``df`` with a single COPY FROM STDIN (PostgreSQL)."""
+    buffer = io.BytesIO()
+    df.write_csv(buffer, include_header=False, null_value=r"\N", quote_style="non_numeric",
+                 datetime_format="%Y-%m-%d %H:%M:%S%.f%:z")
+    columns = ", ".join(connection.ops.quote_name(column) for column in df.columns)
+    sql = f"COPY {connection.ops.quote_name(table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    buffer.seek(0)
+    raw = cursor.cursor
+    if hasattr(raw, "copy_expert"):  # psycopg2
+        raw.copy_expert(sql, buffer)
+    else:  # psycopg 3
+        with raw.copy(sql) as copy:
+            copy.write(buffer.getvalue())
+
+
+def _insert_table(cursor, model, df):
+    """Loads ``df`` with batched executemany INSERTs (backends without COPY)."""
+    fields = list(model._meta.concrete_fields)
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = ", ".join(["%s"] * len(fields))
+    sql = f"INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) VALUES ({placeholders})"
+    prepared = [i for i, field in enumerate(fields) if field.get_internal_type() in PREPARED_TYPES]
+    for batch in df.iter_slices(INSERT_BATCH_SIZE):
+        rows = batch.rows()
+        if prepared:
+            rows = [list(row) for row in rows]
+            for row in rows:
+                for i in prepared:
+                    row[i] = fields[i].get_db_prep_value(row[i], connection)
+        cursor.executemany(sql, rows)
+
+
+def restore_db_snapshot(root=None, force=False):
+    """
+    Replaces the ingested tables with the published snapshot, in one transaction.
+
+    Skipped (returns None) when the database already has the snapshot's
+    dataset version or a newer one, unless ``force``. PostgreSQL loads each
+    table with COPY; other backends use batched INSERTs. Sequences are
+    moved past the restored ids, the center table kept for rollback is
+    dropped, and the center snapshot and population store are rebuilt from
+    the restored rows when they are missing.
+
+    Raises:
+        DbSnapshotError: No snapshot, or one written for other table schemas.
+
+    Returns:
+        dict | None: The manifest of the restored snapshot.
+    """
+    found = get_db_snapshot(root)
+    if found is None:
+        raise DbSnapshotError("No database snapshot")
+    directory, manifest = found
+    check_db_snapshot(manifest)
+    if not force and current_dataset_version() >= manifest["dataset_version"]:
+        return None
+
+    tables = [model._meta.db_table for model in SNAPSHOT_MODELS]
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in connection.ops.sql_flush(no_style(), tables):
+            cursor.execute(sql)
+        for model in SNAPSHOT_MODELS:
+            entry = manifest["tables"][model._meta.db_table]
+            df = pl.read_parquet(os.path.join(directory, entry["file"])).cast(table_schema(model))
+            if df.is_empty():
+                continue
+            if connection.vendor == "postgresql":
+                _copy_table(cursor, model._meta.db_table, df)
+            else:
+                _insert_table(cursor, model, df)
+        for sql in connection.ops.sequence_reset_sql(no_style(), SNAPSHOT_MODELS):
+            cursor.execute(sql)
+        # A table kept for rollback predates the restored data
+        drop_spare_tables()
+
+    if current_snapshot() is None:
+        write_center_snapshot(manifest["dataset_version"])
+    if get_population_store() is None and BarrioPopulation.objects.exists():
+        barrios = pl.DataFrame(list(BarrioPopulation.objects.values(
+            "year", "cod_distrito", "cod_barrio", "barrio", "city_district",
+            "population", "population_men", "population_women")))
+        write_population_barrios(barrios.rename({"city_district": "distrito"}))
+
+    rows = sum(entry["rows"] for entry in manifest["tables"].values())
+    print(f"Restored database snapshot {manifest['name']}: {rows} rows, dataset version {manifest['dataset_version']}")
+    return manifest
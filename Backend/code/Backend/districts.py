@@ -0,0 +1,291 @@
+import json
+import math
+
+import numpy as np
+import polars as pl
+
+# Feature properties tried, in order, for the district name and code (datos.madrid.es and common exports)
+NAME_PROPERTIES = ("NOMBRE", "nombre", "NOMDIS", "DISTRITO", "distrito", "name")
+CODE_PROPERTIES = ("COD_DIS", "COD_DIS_TX", "CODDIS", "COD-DISTRITO", "cod_distrito", "code")
+# Entries per STR-tree node
+NODE_CAPACITY = 16
+# Average number of edges per horizontal band of a polygon; a point is only tested against its band
+EDGES_PER_BAND = 4
+# Points located per pass; bounds the (point, candidate) pair arrays
+LOCATE_CHUNK = 100_000
+ASSIGNMENT_MODES = ("override", "validate")
+
+
+class DistrictBoundaryError(ValueError):
+    """Unreadable boundary file, or one without usable geometries or properties."""
+
+
+def _expand(starts, counts):
+    """Concatenation of ``range(start, start + count)`` for every pair, without a Python loop."""
+    total = int(counts.sum())
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + np.arange(total) - offsets
+
+
+class STRtree:
+    """
+    Static R-tree over bounding boxes, bulk-loaded with Sort-Tile-Recursive packing.
+
+    Every level is a flat array of boxes whose children are a contiguous
+    range of the level below, so a batch of points walks the tree one level
+    at a time with array operations instead of one traversal per point.
+    """
+
+    def __init__(self, bounds, node_capacity=NODE_CAPACITY):
+        bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+        self.node_capacity = node_capacity
+        order = self._str_order(bounds)
+        self.items = order
+        # levels[0] are the items themselves; each level above packs node_capacity entries of the one below
+        self.levels = [(bounds[order], None, None)]
+        while len(self.levels[-1][0]) > node_capacity:
+            below = self.levels[-1][0]
+            starts = np.arange(0, len(below), node_capacity)
+            node_bounds = np.column_stack([
+                np.minimum.reduceat(below[:, 0], starts), np.minimum.reduceat(below[:, 1], starts),
+                np.maximum.reduceat(below[:, 2], starts), np.maximum.reduceat(below[:, 3], starts),
+            ])
+            ends = np.append(starts[1:], len(below))
+            node_order = self._str_order(node_bounds)
+            self.levels.append((node_bounds[node_order], starts[node_order], ends[node_order]))
+
+    def _str_order(self, bounds):
+        """Sort-Tile-Recursive order: vertical slices by x center, each sorted by y center."""
+        n = len(bounds)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        slices = math.ceil(math.sqrt(math.ceil(n / self.node_capacity)))
+        per_slice = slices * self.node_capacity
+        cx = (bounds[:, 0] + bounds[:, 2]) / 2
+        cy = (bounds[:, 1] + bounds[:, 3]) / 2
+        by_x = np.argsort(cx, kind="stable")
+        slice_of = np.empty(n, dtype=np.int64)
+        slice_of[by_x] = np.arange(n) // per_slice
+        return np.lexsort((cy, slice_of))
+
+    def query_points(self, x, y):
+        """
+        Every (point, item) pair whose item box contains the point.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: Point indices and item indices.
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        top = self.levels[-1][0]
+        points = np.repeat(np.arange(x.size), len(top))
+        entries = np.tile(np.arange(len(top)), x.size)
+        for depth in range(len(self.levels) - 1, -1, -1):
+            box = self.levels[depth][0][entries]
+            inside = (box[:, 0] <= x[points]) & (x[points] <= box[:, 2]) & (box[:, 1] <= y[points]) & (y[points] <= box[:, 3])
+            points, entries = points[inside], entries[inside]
+            if depth == 0:
+                break
+            _, starts, ends = self.levels[depth]
+            counts = ends[entries] - starts[entries]
+            points = np.repeat(points, counts)
+            entries = _expand(starts[entries], counts)
+        return points, self.items[entries]
+
+
+class PolygonEdges:
+    """
+    The edges of one polygon (outer ring plus holes) bucketed into horizontal bands.
+
+    Even-odd ray casting only has to count the edges a horizontal ray from
+    the point crosses, and those all span the point's y, so each point is
+    tested against the few edges of its band rather than the whole outline.
+    """
+
+    def __init__(self, rings):
+        edges = []
+        for ring in rings:
+            ring = np.asarray(ring, dtype=np.float64)[:, :2]
+            edges.append(np.column_stack([ring, np.roll(ring, -1, axis=0)]))
+        edges = np.concatenate(edges)
+        # Horizontal edges never straddle a ray
+        edges = edges[edges[:, 1] != edges[:, 3]]
+        self.x0, self.y0, self.x1, self.y1 = edges.T
+        self.bounds = (float(edges[:, [0, 2]].min()), float(edges[:, [1, 3]].min()),
+                       float(edges[:, [0, 2]].max()), float(edges[:, [1, 3]].max()))
+
+        self.min_y = self.bounds[1]
+        self.bands = max(1, len(edges) // EDGES_PER_BAND)
+        self.band_height = (self.bounds[3] - self.min_y) / self.bands or 1.0
+        low = self._band(np.minimum(self.y0, self.y1))
+        high = self._band(np.maximum(self.y0, self.y1))
+        counts = high - low + 1
+        band_of = _expand(low, counts)
+        edge_of = np.repeat(np.arange(len(edges)), counts)
+        order = np.argsort(band_of, kind="stable")
+        self.band_edges = edge_of[order]
+        self.band_starts = np.searchsorted(band_of[order], np.arange(self.bands + 1))
+
+    def _band(self, y):
+        return np.clip(((y - self.min_y) / self.band_height).astype(np.int64), 0, self.bands - 1)
+
+    def contains(self, x, y):
+        """Boolean mask of the points inside (even-odd rule, so holes are excluded)."""
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        band = self._band(y)
+        counts = self.band_starts[band + 1] - self.band_starts[band]
+        points = np.repeat(np.arange(x.size), counts)
+        edges = self.band_edges[_expand(self.band_starts[band], counts)]
+
+        px, py = x[points], y[points]
+        x0, y0, x1, y1 = self.x0[edges], self.y0[edges], self.x1[edges], self.y1[edges]
+        crosses = ((y0 > py) != (y1 > py)) & (px < x0 + (py - y0) * (x1 - x0) / (y1 - y0))
+        return np.bincount(points[crosses], minlength=x.size) % 2 == 1
+
+
+def _feature_polygons(geometry):
+    if geometry is None:
+        return []
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    if geometry["type"] == "GeometryCollection":
+        return [polygon for part in geometry["geometries"] for polygon in _feature_polygons(part)]
+    return []
+
+
+def _pick_property(properties, wanted, candidates, what):
+    if wanted is not None:
+        return wanted
+    for key in candidates:
+        if key in properties:
+            return key
+    raise DistrictBoundaryError(f"No {what} property among {sorted(properties)}; expected one of {list(candidates)}")
+
+
+class DistrictBoundaries:
+    """District polygons with an STR-tree over their parts, for locating many points at once."""
+
+    def __init__(self, names, codes, polygons):
+        """
+        Args:
+            names (list[str]): District name of each feature.
+            codes (list[str]): District code of each feature, without leading zeros.
+            polygons (list[tuple[int, list]]): (feature index, rings) per polygon part, lon/lat.
+        """
+        self.names = list(names)
+        self.codes = list(codes)
+        self.part_feature = np.array([feature for feature, _ in polygons], dtype=np.int64)
+        self.parts = [PolygonEdges(rings) for _, rings in polygons]
+        self.tree = STRtree([part.bounds for part in self.parts])
+
+    def __len__(self):
+        return len(self.names)
+
+    def locate(self, latitudes, longitudes):
+        """
+        Index of the district containing each point, -1 outside all of them (or without coordinates).
+
+        Where parts overlap the lowest feature index wins.
+        """
+        lat = np.asarray(latitudes, dtype=np.float64)
+        lon = np.asarray(longitudes, dtype=np.float64)
+        result = np.full(lat.size, -1, dtype=np.int64)
+        for start in range(0, lat.size, LOCATE_CHUNK):
+            x, y = lon[start:start + LOCATE_CHUNK], lat[start:start + LOCATE_CHUNK]
+            chunk = result[start:start + LOCATE_CHUNK]
+            points, parts = self.tree.query_points(x, y)
+            order = np.argsort(parts, kind="stable")
+            points, parts = points[order], parts[order]
+            runs = np.flatnonzero(np.diff(parts, prepend=-1, append=len(self.parts)))
+            for first, last in zip(runs[:-1], runs[1:]):
+                candidates = points[first:last]
+                inside = candidates[self.parts[parts[first]].contains(x[candidates], y[candidates])]
+                feature = self.part_feature[parts[first]]
+                hits = inside[(chunk[inside] == -1) | (chunk[inside] > feature)]
+                chunk[hits] = feature
+        return result
+
+
+def load_district_boundaries(path, name_property=None, code_property=None):
+    """
+    Reads district polygons from a GeoJSON FeatureCollection in WGS84 longitude/latitude.
+
+    Polygon, MultiPolygon and GeometryCollection geometries are accepted;
+    the name and code properties are guessed from ``NAME_PROPERTIES`` and
+    ``CODE_PROPERTIES`` unless given.
+
+    Raises:
+        DistrictBoundaryError: Unreadable file, no polygons, missing
+            properties, or projected (non-degree) coordinates.
+    """
+    try:
+        with open(path, "rb") as f:
+            collection = json.load(f)
+    except (OSError, ValueError) as e:
+        raise DistrictBoundaryError(f"Cannot read {path}: {e}") from None
+
+    names, codes, polygons = [], [], []
+    for feature in collection.get("features", []):
+        feature_polygons = _feature_polygons(feature.get("geometry"))
+        if not feature_polygons:
+            continue
+        properties = feature.get("properties") or {}
+        name_key = _pick_property(properties, name_property, NAME_PROPERTIES, "name")
+        code_key = _pick_property(properties, code_property, CODE_PROPERTIES, "code")
+        index = len(names)
+        names.append(str(properties[name_key]).strip())
+        codes.append(str(properties[code_key]).strip().lstrip("0"))
+        polygons += [(index, rings) for rings in feature_polygons]
+
+    if not polygons:
+        raise DistrictBoundaryError(f"No polygons in {path}")
+    outer = np.concatenate([np.asarray(rings[0], dtype=np.float64)[:, :2] for _, rings in polygons])
+    if np.abs(outer[:, 0]).max() > 180 or np.abs(outer[:, 1]).max() > 90:
+        raise DistrictBoundaryError(
+            f"{path} is not in longitude/latitude degrees; reproject it to WGS84 (EPSG:4326) first")
+    return DistrictBoundaries(names, codes, polygons)
+
+
+def assign_districts(df, boundaries, mode="override"):
+    """
+    Checks the free-text district of every raw center against the polygon its coordinates fall in.
+
+    In ``override`` mode, ``COD-DISTRITO`` and ``DISTRITO`` are replaced by
+    the polygon's code and name wherever the center is inside one; centers
+    outside every polygon keep the text. ``validate`` only counts.
+
+    Args:
+        df (pl.DataFrame): Raw centers with LATITUD, LONGITUD, COD-DISTRITO and DISTRITO.
+        boundaries (DistrictBoundaries): The district polygons.
+        mode (str): ``override`` or ``validate``.
+
+    Returns:
+        tuple[pl.DataFrame, dict]: The centers, and how many agreed with,
+        disagreed with (or had no text district) and fell outside the polygons.
+    """
+    if mode not in ASSIGNMENT_MODES:
+        raise DistrictBoundaryError(f"District assignment mode must be one of {', '.join(ASSIGNMENT_MODES)}")
+    district = boundaries.locate(df["LATITUD"].cast(pl.Float64).fill_null(np.nan).to_numpy(),
+                                 df["LONGITUD"].cast(pl.Float64).fill_null(np.nan).to_numpy())
+    inside = district >= 0
+    polygons = pl.DataFrame({
+        "polygon_code": np.where(inside, np.array(boundaries.codes, dtype=object)[np.maximum(district, 0)], None),
+        "polygon_name": np.where(inside, np.array(boundaries.names, dtype=object)[np.maximum(district, 0)], None),
+    }, schema={"polygon_code": pl.Utf8, "polygon_name": pl.Utf8})
+    text_code = df.select(pl.col("COD-DISTRITO").cast(pl.Utf8).str.strip_chars().str.strip_chars_start("0"))
+
+    agrees = (text_code.to_series() == polygons["polygon_code"]).fill_null(False).to_numpy()
+    counts = {
+        "agree": int(agrees.sum()),
+        "disagree": int((inside & ~agrees).sum()),
+        "outside": int((~inside).sum()),
+    }
+    if mode == "override":
+        df = pl.concat([df, polygons], how="horizontal").with_columns(
+            pl.coalesce("polygon_code", pl.col("COD-DISTRITO").cast(pl.Utf8)).alias("COD-DISTRITO"),
+            pl.coalesce("polygon_name", "DISTRITO").alias("DISTRITO"),
+        ).drop("polygon_code", "polygon_name")
+    return df, counts
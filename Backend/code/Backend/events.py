@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .dataset_version import current_dataset_version
+from .models import CenterChange
+
+EVENTS_PATH = "/api/events"
+DEFAULT_POLL_SECONDS = 2.0
+KEEPALIVE_SECONDS = 15.0
+# Only the newest version matters, so a slow client just loses the older events
+SUBSCRIBER_QUEUE_SIZE = 8
+LAYERS = {False: "centers", True: "proposals"}
+
+logger = logging.getLogger(__name__)
+
+
+def dataset_event(since, version):
+    """
+    The event for going from dataset version ``since`` to ``version``.
+
+    ``layers`` lists what changed according to the change log; when the
+    log has nothing for those versions (compacted, or a bump that did not
+    go through it) every layer is reported.
+    """
+    touched = (CenterChange.objects.filter(version__gt=since, version__lte=version)
+               .values_list("is_suggested", flat=True).distinct())
+    layers = sorted({LAYERS[is_suggested] for is_suggested in touched}) or sorted(LAYERS.values())
+    return {"version": version, "previous": since, "layers": layers}
+
+
+class DatasetBroadcaster:
+    """
+    Fans "dataset version changed" events out to every connected SSE client of this process.
+
+    A single poller task watches the DatasetVersion table, so versions
+    committed by other processes (``download_db``) are seen within
+    ``DATASET_EVENTS_POLL_SECONDS``; writes made in this process call
+    ``notify()`` on commit and are pushed right away. The poller only runs
+    while someone is subscribed, and a failed check (e.g. the database
+    going away mid swap) is logged and retried on the next tick.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._subscribers = set()
+        self._loop = None
+        self._wake = None
+        self._poller = None
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._loop is not loop:
+                self._loop, self._wake, self._poller = loop, asyncio.Event(), None
+                self.version = None
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        if self._poller is None or self._poller.done():
+            self._poller = loop.create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def notify(self):
+        """Wakes the poller; safe to call from any thread (e.g. a sync view's on_commit hook)."""
+        with self._lock:
+            loop, wake = self._loop, self._wake
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wake.set)
+
+    def publish(self, event):
+        for queue in list(self._subscribers):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def _poll(self):
+        interval = getattr(settings, "DATASET_EVENTS_POLL_SECONDS", DEFAULT_POLL_SECONDS)
+        while self._subscribers:
+            try:
+                await self._check()
+            except Exception:
+                logger.exception("Dataset events poll failed; retrying in %ss", interval)
+                await sync_to_async(close_old_connections)()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _check(self):
+        version = await sync_to_async(current_dataset_version)()
+        if self.version is None:
+            self.version = version
+        elif version != self.version:
+            event = await sync_to_async(dataset_event)(self.version, version)
+            self.version = version
+            self.publish(event)
+
+
+broadcaster = DatasetBroadcaster()
+
+
+def _sse(event_name, data, event_id=None):
+    lines = [f"event: {event_name}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+async def _until_disconnect(receive):
+    """Drains the request (servers send ``http.request`` messages first, even for a GET) until the client leaves."""
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def dataset_events(scope, receive, send):
+    """
+    ASGI endpoint streaming ``dataset`` events as text/event-stream.
+
+    The first event carries the current version so a client can tell
+    whether what it has is stale; ``Last-Event-ID`` (the version the client
+    last saw) is echoed back as ``previous``.
+    """
+    headers = dict(scope.get("headers") or [])
+    last_seen = headers.get(b"last-event-id", b"").decode("latin-1")
+
+    queue = broadcaster.subscribe()
+    version = await sync_to_async(current_dataset_version)()
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ],
+    })
+
+    if last_seen.isdigit() and int(last_seen) < version:
+        first = await sync_to_async(dataset_event)(int(last_seen), version)
+    else:
+        first = {"version": version, "previous": version, "layers": []}
+    await send({"type": "http.response.body", "body": b"retry: 3000\n" + _sse("dataset", first, version),
+                "more_body": True})
+
+    disconnected = asyncio.ensure_future(_until_disconnect(receive))
+    try:
+        while True:
+            next_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({next_event, disconnected}, timeout=KEEPALIVE_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                next_event.cancel()
+                break
+            if next_event in done:
+                event = next_event.result()
+                body = _sse("dataset", event, event["version"])
+            else:
+                next_event.cancel()
+                body = b": keep-alive\n\n"
+            await send({"type": "http.response.body", "body": body, "more_body": True})
+    except OSError:
+        pass
+    finally:
+        disconnected.cancel()
+        broadcaster.unsubscribe(queue)
+
+
+class DatasetEventsMiddleware:
+    """ASGI wrapper that serves ``EVENTS_PATH`` itself and hands every other request to Django."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == EVENTS_PATH and scope["method"] == "GET":
+            await dataset_events(scope, receive, send)
+            return
+        if scope["type"] == "lifespan":
+            # Django does not speak the lifespan protocol; acknowledge it so servers do not log a failure
+            while True:
+                message = await receive()
+                await send({"type": message["type"] + ".complete"})
+                if message["type"] == "lifespan.shutdown":
+                    return
+        await self.app(scope, receive, send)
@@ -0,0 +1,219 @@
+import csv
+import io
+import itertools
+import json
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from asgiref.sync import sync_to_async
+
+from .models import MedicalCenter
+from .serializers import MEDICAL_CENTER_FIELDS
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to json.dumps
+    orjson = None
+
+EXPORT_FORMATS = {
+    "geojson": ("application/geo+json", "geojson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "geoparquet": ("application/vnd.apache.parquet", "parquet"),
+}
+# ?layers= names and the is_suggested value they stand for, as on the map
+EXPORT_LAYERS = {"centers": False, "proposals": True}
+# Rows fetched from the cursor and encoded at a time; also the GeoParquet row group size
+EXPORT_CHUNK_ROWS = 10_000
+PARQUET_TYPES = {
+    "id": pa.int64(),
+    "latitude": pa.float64(),
+    "longitude": pa.float64(),
+    "population_in_district": pa.int64(),
+    "is_suggested": pa.bool_(),
+}
+# Little-endian WKB Point: byte order, geometry type 1, x (longitude), y (latitude)
+WKB_POINT = np.dtype([("order", "u1"), ("type", "<u4"), ("x", "<f8"), ("y", "<f8")])
+
+
+class ExportError(ValueError):
+    """Bad format, layer or field."""
+
+
+def parse_layers(value):
+    """Layers named in ``?layers=a,b``; only the existing centers when empty."""
+    if not value:
+        return ("centers",)
+    layers = tuple(dict.fromkeys(layer.strip() for layer in value.split(",") if layer.strip()))
+    unknown = set(layers).difference(EXPORT_LAYERS)
+    if unknown:
+        raise ExportError(f"Unknown layers: {', '.join(sorted(unknown))}; use {', '.join(EXPORT_LAYERS)}")
+    return layers
+
+
+def export_queryset(layers, bbox=None):
+    queryset = MedicalCenter.objects.filter(is_suggested__in=[EXPORT_LAYERS[layer] for layer in layers])
+    if bbox is not None:
+        west, south, east, north = bbox
+        queryset = queryset.filter(longitude__gte=west, longitude__lte=east, latitude__gte=south, latitude__lte=north)
+    return queryset.order_by("pk")
+
+
+def export_chunks(queryset, fields, chunk_size=EXPORT_CHUNK_ROWS):
+    """
+    Lists of ``values_list`` tuples, ``chunk_size`` rows at a time.
+
+    ``iterator()`` reads through a server-side cursor on PostgreSQL (and in
+    fetchmany batches elsewhere), so only one chunk is in memory at once.
+    """
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        yield chunk
+
+
+def encode_csv(chunks, fields):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def encode_geojson(chunks, fields):
+    dumps = orjson.dumps if orjson is not None else (lambda value: json.dumps(value, separators=(",", ":")).encode())
+    lat, lon = fields.index("latitude"), fields.index("longitude")
+    properties = [(i, field) for i, field in enumerate(fields) if i not in (lat, lon)]
+    yield b'{"type":"FeatureCollection","features":['
+    separator = b""
+    for chunk in chunks:
+        features = [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [row[lon], row[lat]]},
+                "properties": {field: row[i] for i, field in properties},
+            }
+            for row in chunk
+        ]
+        # Features of one chunk as "a,b,c" without the list brackets
+        yield separator + dumps(features)[1:-1]
+        separator = b","
+    yield b"]}"
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last ``take()``."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def geoparquet_schema(fields):
+    """Arrow schema with the attribute columns, a WKB ``geometry`` column and the GeoParquet 1.0 metadata."""
+    columns = [pa.field(field, PARQUET_TYPES.get(field, pa.string())) for field in fields
+               if field not in ("latitude", "longitude")]
+    columns.append(pa.field("geometry", pa.binary()))
+    geo = {
+        "version": "1.0.0",
+        "primary_column": "geometry",
+        # No "crs": GeoParquet then means OGC:CRS84 (WGS84 longitude, latitude)
+        "columns": {"geometry": {"encoding": "WKB", "geometry_types": ["Point"]}},
+    }
+    return pa.schema(columns, metadata={b"geo": json.dumps(geo).encode()})
+
+
+def wkb_points(longitudes, latitudes):
+    """WKB Points as one Arrow binary array, built from a packed record buffer instead of per-row struct.pack."""
+    points = np.empty(len(longitudes), dtype=WKB_POINT)
+    points["order"], points["type"] = 1, 1
+    points["x"], points["y"] = longitudes, latitudes
+    offsets = np.arange(len(points) + 1, dtype=np.int32) * WKB_POINT.itemsize
+    return pa.Array.from_buffers(pa.binary(), len(points), [None, pa.py_buffer(offsets), pa.py_buffer(points.tobytes())])
+
+
+def encode_geoparquet(chunks, fields):
+    """One row group per chunk; the bytes of each are sent as soon as it is written."""
+    schema = geoparquet_schema(fields)
+    lat, lon = fields.index("latitude"), fields.index("longitude")
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            arrays = [pa.array(columns[i], type=schema.field(field).type) for i, field in enumerate(fields)
+                      if i not in (lat, lon)]
+            arrays.append(wkb_points(np.array(columns[lon], dtype=np.float64), np.array(columns[lat], dtype=np.float64)))
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            yield sink.take()
+    yield sink.take()
+
+
+class AsyncChunks:
+    """
+    Async iterator over a body generator, pulling one chunk at a time in the sync thread.
+
+    Under ASGI a ``StreamingHttpResponse`` reads a sync iterator whole before
+    sending its first byte; this keeps exports streaming there. ``close()``
+    is picked up by the response, so the cursor is released like under WSGI.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self._next = sync_to_async(next)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        chunk = await self._next(self.chunks, None)
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+    def close(self):
+        self.chunks.close()
+
+
+ENCODERS = {"geojson": encode_geojson, "csv": encode_csv, "geoparquet": encode_geoparquet}
+
+
+def export_centers(fmt, layers=("centers",), bbox=None, fields=MEDICAL_CENTER_FIELDS, chunk_size=EXPORT_CHUNK_ROWS):
+    """
+    Streams the centers of ``layers`` inside ``bbox`` encoded as ``fmt``.
+
+    Rows go from the database cursor to the encoder one chunk at a time,
+    so memory stays flat however many rows are exported. GeoJSON and
+    GeoParquet always carry the point geometry; CSV keeps latitude and
+    longitude as columns.
+
+    Returns:
+        tuple[Iterator[bytes], str, str]: The body chunks, content type and file extension.
+    """
+    if fmt not in ENCODERS:
+        raise ExportError(f"format must be one of {', '.join(ENCODERS)}")
+    fields = tuple(fields)
+    if fmt != "csv":
+        fields += tuple(field for field in ("latitude", "longitude") if field not in fields)
+    content_type, extension = EXPORT_FORMATS[fmt]
+    chunks = export_chunks(export_queryset(layers, bbox), fields, chunk_size)
+    return ENCODERS[fmt](chunks, fields), content_type, extension
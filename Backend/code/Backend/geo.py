@@ -0,0 +1,292 @@
+import numpy as np
+
+EARTH_RADIUS_M = 6_371_008.8
+# WGS84 ellipsoid
+WGS84_A = 6_378_137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+# Upper bound on the size of the pairwise distance blocks, to cap memory
+DEFAULT_BLOCK_ELEMENTS = 4_000_000
+
+
+def project_to_meters(latitudes, longitudes, origin_lat=None):
+    """
+    Equirectangular projection to local x/y meters.
+
+    Good to well under 1% at city scale, which is all the nearest-neighbour
+    searches need; exact distances are recomputed with haversine afterwards.
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    if origin_lat is None:
+        origin_lat = float(np.mean(latitudes)) if latitudes.size else 0.0
+    x = np.radians(longitudes) * EARTH_RADIUS_M * np.cos(np.radians(origin_lat))
+    y = np.radians(latitudes) * EARTH_RADIUS_M
+    return x, y
+
+
+def unproject_from_meters(x, y, origin_lat):
+    """Inverse of ``project_to_meters`` for the same ``origin_lat``: (latitudes, longitudes)."""
+    latitudes = np.degrees(np.asarray(y, dtype=np.float64) / EARTH_RADIUS_M)
+    longitudes = np.degrees(np.asarray(x, dtype=np.float64) / (EARTH_RADIUS_M * np.cos(np.radians(origin_lat))))
+    return latitudes, longitudes
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Element-wise great-circle distance in meters (inputs broadcast)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _vincenty_terms(lam, sin_u1, cos_u1, sin_u2, cos_u2):
+    sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+    sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+    cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+    sigma = np.arctan2(sin_sigma, cos_sigma)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+        cos2_alpha = 1 - sin_alpha ** 2
+        # Zero on the equator, where cos2_alpha is 0 too
+        cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+    return sin_sigma, cos_sigma, sigma, sin_alpha, cos2_alpha, cos_2sigma_m
+
+
+def vincenty_m(lat1, lon1, lat2, lon2, max_iterations=200, tolerance=1e-12):
+    """
+    Element-wise distance on the WGS84 ellipsoid in meters (Vincenty's inverse formula, inputs broadcast).
+
+    Matches geopy's geodesic (Karney) to well under a millimeter. Each
+    iteration only recomputes the pairs that have not converged yet. The
+    few nearly antipodal pairs where the method does not converge get the
+    haversine distance instead (off by at most ~0.5%).
+    """
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in (lat1, lon1, lat2, lon2)))
+    f = WGS84_F
+    big_l = np.radians(lon2 - lon1).ravel()
+    u1 = np.arctan((1 - f) * np.tan(np.radians(lat1.ravel())))
+    u2 = np.arctan((1 - f) * np.tan(np.radians(lat2.ravel())))
+    sin_u1, cos_u1, sin_u2, cos_u2 = np.sin(u1), np.cos(u1), np.sin(u2), np.cos(u2)
+
+    lam = big_l.copy()
+    todo = np.arange(big_l.size)
+    for _ in range(max_iterations):
+        if not todo.size:
+            break
+        sin_sigma, cos_sigma, sigma, sin_alpha, cos2_alpha, cos_2sigma_m = _vincenty_terms(
+            lam[todo], sin_u1[todo], cos_u1[todo], sin_u2[todo], cos_u2[todo])
+        c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        new_lam = big_l[todo] + (1 - c) * f * sin_alpha * (
+            sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+        moving = np.abs(new_lam - lam[todo]) > tolerance
+        lam[todo] = new_lam
+        todo = todo[moving]
+
+    sin_sigma, cos_sigma, sigma, _, cos2_alpha, cos_2sigma_m = _vincenty_terms(lam, sin_u1, cos_u1, sin_u2, cos_u2)
+    u_sq = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    big_a = 1 + u_sq / 16384 * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+    meters = WGS84_B * big_a * (sigma - delta_sigma)
+
+    if todo.size:
+        meters[todo] = haversine_m(lat1.ravel()[todo], lon1.ravel()[todo], lat2.ravel()[todo], lon2.ravel()[todo])
+    return meters.reshape(lat1.shape)
+
+
+DISTANCE_METHODS = {
+    "haversine": haversine_m,
+    "vincenty": vincenty_m,
+}
+
+
+def distance_m(lat1, lon1, lat2, lon2, method="haversine"):
+    """Element-wise distance in meters with one of ``DISTANCE_METHODS`` (inputs broadcast)."""
+    try:
+        function = DISTANCE_METHODS[method]
+    except KeyError:
+        raise ValueError(f"Unknown distance method: {method}") from None
+    return function(lat1, lon1, lat2, lon2)
+
+
+def one_to_many(lat, lon, latitudes, longitudes, method="haversine"):
+    """Distances in meters from one point to each of ``latitudes``/``longitudes``."""
+    return distance_m(lat, lon, np.asarray(latitudes, dtype=np.float64),
+                      np.asarray(longitudes, dtype=np.float64), method)
+
+
+def iter_distance_blocks(lat1, lon1, lat2, lon2, method="haversine", block_elements=DEFAULT_BLOCK_ELEMENTS):
+    """
+    Pairwise distances between two point sets, a block of rows at a time.
+
+    Yields ``(start, stop, block)`` where ``block[i, j]`` is the distance
+    from point ``start + i`` of the first set to point ``j`` of the second.
+    A block holds at most ``block_elements`` pairs, so callers that reduce
+    each block (min, count within a radius...) never hold the full matrix.
+    """
+    lat1, lon1 = np.asarray(lat1, dtype=np.float64), np.asarray(lon1, dtype=np.float64)
+    lat2, lon2 = np.asarray(lat2, dtype=np.float64), np.asarray(lon2, dtype=np.float64)
+    block = max(1, block_elements // max(lat2.size, 1))
+    for start in range(0, lat1.size, block):
+        stop = min(start + block, lat1.size)
+        yield start, stop, distance_m(lat1[start:stop, None], lon1[start:stop, None],
+                                      lat2[None, :], lon2[None, :], method)
+
+
+def distance_matrix(lat1, lon1, lat2, lon2, method="haversine", block_elements=DEFAULT_BLOCK_ELEMENTS,
+                    dtype=np.float64):
+    """
+    The full ``len(lat1) x len(lat2)`` distance matrix in meters.
+
+    It is filled block by block, so the temporaries (about twenty arrays
+    per block for Vincenty) stay bounded; use ``dtype=np.float32`` to halve
+    the result itself.
+    """
+    out = np.empty((np.size(lat1), np.size(lat2)), dtype=dtype)
+    for start, stop, block in iter_distance_blocks(lat1, lon1, lat2, lon2, method, block_elements):
+        out[start:stop] = block
+    return out
+
+
+def bbox_around(lat, lon, radius_m):
+    """
+    (west, south, east, north) in degrees that contains every point within ``radius_m`` of (lat, lon).
+
+    Slightly generous (spherical degrees plus 1%), so it can prefilter
+    ellipsoidal distances too. Longitudes are not wrapped at the antimeridian.
+    """
+    radius = radius_m * 1.01
+    dlat = np.degrees(radius / EARTH_RADIUS_M)
+    south, north = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    widest = max(abs(south), abs(north))
+    if widest >= 89.999:
+        return -180.0, south, 180.0, north
+    dlon = np.degrees(radius / (EARTH_RADIUS_M * np.cos(np.radians(widest))))
+    return lon - dlon, south, lon + dlon, north
+
+
+def within_radius(lat, lon, latitudes, longitudes, radius_m, method="haversine"):
+    """
+    Points within ``radius_m`` of (lat, lon).
+
+    A bounding-box comparison discards most points before any
+    trigonometry, then the exact distance is computed for the rest.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Indices (ascending) and distances in meters.
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    west, south, east, north = bbox_around(lat, lon, radius_m)
+    candidates = np.flatnonzero((latitudes >= south) & (latitudes <= north)
+                                & (longitudes >= west) & (longitudes <= east))
+    distances = one_to_many(lat, lon, latitudes[candidates], longitudes[candidates], method)
+    inside = distances <= radius_m
+    return candidates[inside], distances[inside]
+
+
+def nearest(points_lat, points_lon, targets_lat, targets_lon, block_elements=DEFAULT_BLOCK_ELEMENTS):
+    """
+    Index of and distance to the nearest target for every point.
+
+    The search runs on projected coordinates in blocks of points, so memory
+    stays bounded by ``block_elements`` no matter how many points there are.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Nearest target index and haversine
+        distance in meters per point.
+    """
+    points_lat = np.asarray(points_lat, dtype=np.float64)
+    points_lon = np.asarray(points_lon, dtype=np.float64)
+    targets_lat = np.asarray(targets_lat, dtype=np.float64)
+    targets_lon = np.asarray(targets_lon, dtype=np.float64)
+
+    n_points = points_lat.size
+    if targets_lat.size == 0:
+        return np.full(n_points, -1, dtype=np.int64), np.full(n_points, np.inf)
+
+    origin_lat = float(np.mean(targets_lat))
+    px, py = project_to_meters(points_lat, points_lon, origin_lat)
+    tx, ty = project_to_meters(targets_lat, targets_lon, origin_lat)
+
+    index = np.empty(n_points, dtype=np.int64)
+    block = max(1, block_elements // targets_lat.size)
+    for start in range(0, n_points, block):
+        stop = min(start + block, n_points)
+        d2 = (px[start:stop, None] - tx[None, :]) ** 2 + (py[start:stop, None] - ty[None, :]) ** 2
+        index[start:stop] = np.argmin(d2, axis=1)
+
+    return index, haversine_m(points_lat, points_lon, targets_lat[index], targets_lon[index])
+
+
+def weighted_percentile(values, weights, q):
+    """Smallest value below which a fraction ``q`` of the total weight lies."""
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    if values.size == 0 or weights.sum() <= 0:
+        return float("nan")
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    return float(values[order][np.searchsorted(cumulative, q * cumulative[-1])])
+
+
+class GridIndex:
+    """
+    Uniform-grid spatial index over projected (x, y) meters.
+
+    Points are sorted by cell once; a radius query only looks at the cells
+    overlapping the query circle's bounding box, so its cost depends on the
+    local density rather than on the total number of points.
+    """
+
+    def __init__(self, x, y, cell_size=None):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        n = self.x.size
+
+        if n:
+            self.min_x, self.min_y = float(self.x.min()), float(self.y.min())
+            extent = max(float(self.x.max()) - self.min_x, float(self.y.max()) - self.min_y, 1.0)
+        else:
+            self.min_x = self.min_y = 0.0
+            extent = 1.0
+        if cell_size is None:
+            # About four points per cell for uniformly spread data
+            cell_size = extent / max(np.sqrt(max(n, 1) / 4), 1.0)
+        self.cell_size = float(cell_size)
+
+        cx, cy = self._cell(self.x, self.y)
+        self.n_cols = int(cx.max()) + 1 if n else 1
+        self.n_rows = int(cy.max()) + 1 if n else 1
+        keys = cy * self.n_cols + cx
+        self.order = np.argsort(keys, kind="stable")
+        self.cell_keys, self.cell_starts, counts = np.unique(keys[self.order], return_index=True, return_counts=True)
+        self.cell_ends = self.cell_starts + counts
+
+    def _cell(self, x, y):
+        cx = np.floor((np.asarray(x) - self.min_x) / self.cell_size).astype(np.int64)
+        cy = np.floor((np.asarray(y) - self.min_y) / self.cell_size).astype(np.int64)
+        return cx, cy
+
+    def within(self, qx, qy, radius):
+        """Indices of the points within ``radius`` meters of (qx, qy)."""
+        (cx0, cx1), (cy0, cy1) = self._cell([qx - radius, qx + radius], [qy - radius, qy + radius])
+        cx0, cy0 = max(int(cx0), 0), max(int(cy0), 0)
+        cx1, cy1 = min(int(cx1), self.n_cols - 1), min(int(cy1), self.n_rows - 1)
+        if cx0 > cx1 or cy0 > cy1:
+            return np.empty(0, dtype=np.int64)
+
+        wanted = (np.arange(cy0, cy1 + 1)[:, None] * self.n_cols + np.arange(cx0, cx1 + 1)[None, :]).ravel()
+        slots = np.searchsorted(self.cell_keys, wanted)
+        present = slots < self.cell_keys.size
+        slots, wanted = slots[present], wanted[present]
+        slots = slots[self.cell_keys[slots] == wanted]
+        if slots.size == 0:
+            return np.empty(0, dtype=np.int64)
+
+        candidates = np.concatenate([self.order[self.cell_starts[s]:self.cell_ends[s]] for s in slots])
+        d2 = (self.x[candidates] - qx) ** 2 + (self.y[candidates] - qy) ** 2
+        return candidates[d2 <= radius * radius]
@@ -0,0 +1,204 @@
+import hashlib
+import io
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from .center_snapshot import current_snapshot
+from .dataset_version import current_dataset_version
+from .models import BarrioPopulation, MedicalCenter
+from .population_store import get_population_store
+from .validation import VALID_BBOX
+
+LAYERS = ("centers", "population", "need")
+DEFAULT_RESOLUTION = 128
+MAX_RESOLUTION = 1024
+# Gaussian blur (in cells) spreading each barrio's population around its representative point
+DEFAULT_SMOOTHING = 1.5
+CACHE_ENTRIES = 64
+
+
+class HeatmapError(ValueError):
+    """Bad layer, bounding box or resolution."""
+
+
+def parse_bbox(value):
+    """(west, south, east, north) from "w,s,e,n", the Madrid box when empty."""
+    if not value:
+        return VALID_BBOX
+    try:
+        west, south, east, north = (float(v) for v in value.split(","))
+    except ValueError:
+        raise HeatmapError("bbox must be west,south,east,north") from None
+    if not (-180 <= west < east <= 180 and -90 <= south < north <= 90):
+        raise HeatmapError("bbox must be west,south,east,north with west < east and south < north")
+    return west, south, east, north
+
+
+def grid_shape(bbox, resolution):
+    """(rows, cols) with ``resolution`` cells on the longer side and roughly square cells on the ground."""
+    if not 1 <= resolution <= MAX_RESOLUTION:
+        raise HeatmapError(f"resolution must be between 1 and {MAX_RESOLUTION}")
+    west, south, east, north = bbox
+    width = (east - west) * math.cos(math.radians((south + north) / 2))
+    height = north - south
+    if width >= height:
+        return max(1, round(resolution * height / width)), resolution
+    return resolution, max(1, round(resolution * width / height))
+
+
+def bin_points(latitudes, longitudes, bbox, shape, weights=None):
+    """
+    2D histogram of points over ``bbox``, row 0 at the north edge (image order).
+
+    Points outside the box are ignored.
+    """
+    west, south, east, north = bbox
+    grid, _, _ = np.histogram2d(
+        np.asarray(latitudes, dtype=np.float64), np.asarray(longitudes, dtype=np.float64),
+        bins=shape, range=[[south, north], [west, east]], weights=weights,
+    )
+    return grid[::-1].astype(np.float32)
+
+
+def gaussian_blur(grid, sigma):
+    """
+    Separable Gaussian blur that keeps the total (mass leaving the grid excepted) and the shape.
+
+    Each axis is zero-padded by the kernel radius and convolved in "valid"
+    mode: "same" returns the kernel's length when an axis is shorter than it.
+    """
+    if sigma <= 0:
+        return grid
+    radius = max(1, int(3 * sigma))
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+    kernel /= kernel.sum()
+    blurred = grid
+    for axis in (0, 1):
+        padding = [(0, 0), (0, 0)]
+        padding[axis] = (radius, radius)
+        blurred = np.apply_along_axis(np.convolve, axis, np.pad(blurred, padding), kernel, mode="valid")
+    return blurred.astype(np.float32)
+
+
+def _center_points():
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        rows = snapshot.select(is_suggested=False)
+        return snapshot.table["latitude"][rows], snapshot.table["longitude"][rows]
+    points = np.array(MedicalCenter.objects.filter(is_suggested=False).values_list("latitude", "longitude"),
+                      dtype=np.float64).reshape(-1, 2)
+    return points[:, 0], points[:, 1]
+
+
+def _population_points(year):
+    points = np.array(
+        BarrioPopulation.objects.filter(year=year, latitude__isnull=False)
+        .values_list("latitude", "longitude", "population"),
+        dtype=np.float64,
+    ).reshape(-1, 3)
+    return points[:, 0], points[:, 1], points[:, 2]
+
+
+def latest_population_year():
+    return BarrioPopulation.objects.order_by("-year").values_list("year", flat=True).first()
+
+
+def render_heatmap(layer, bbox, resolution, year=None, smoothing=DEFAULT_SMOOTHING):
+    """
+    The binned grid of one layer.
+
+    - centers: number of existing medical centers per cell.
+    - population: residents per cell. Each barrio's population sits at
+      its representative point and is blurred over ``smoothing`` cells.
+    - need: residents per (1 + nearby centers). Both grids are blurred
+      the same way, so the ratio is not dominated by empty cells.
+
+    Returns:
+        np.ndarray: float32 grid, row 0 at the north edge.
+    """
+    shape = grid_shape(bbox, resolution)
+    if layer == "centers":
+        return bin_points(*_center_points(), bbox, shape)
+
+    latitudes, longitudes, population = _population_points(year)
+    people = gaussian_blur(bin_points(latitudes, longitudes, bbox, shape, weights=population), smoothing)
+    if layer == "population":
+        return people
+    centers = gaussian_blur(bin_points(*_center_points(), bbox, shape), smoothing)
+    return (people / (1.0 + centers)).astype(np.float32)
+
+
+def heatmap_png(grid):
+    """Grayscale PNG scaled to the grid's maximum, transparent where the value is zero."""
+    high = float(grid.max()) if grid.size else 0.0
+    gray = np.clip(grid / (high or 1.0) * 255, 0, 255).astype(np.uint8)
+    alpha = np.where(grid > 0, 255, 0).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(np.dstack([gray, alpha])).save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def heatmap_bytes(grid, fmt):
+    """
+    Encodes a grid as ``png``, ``uint8`` (quantized to the maximum) or ``float32``.
+
+    Returns:
+        tuple[bytes, float]: The payload and the value a byte of 255 stands for (the grid maximum).
+    """
+    high = float(grid.max()) if grid.size else 0.0
+    if fmt == "png":
+        return heatmap_png(grid), high
+    if fmt == "uint8":
+        return np.round(grid / (high or 1.0) * 255).astype(np.uint8).tobytes(), high
+    if fmt == "float32":
+        return grid.astype("<f4").tobytes(), high
+    raise HeatmapError("format must be png, uint8 or float32")
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_heatmap(layer, bbox=VALID_BBOX, resolution=DEFAULT_RESOLUTION, fmt="uint8", year=None):
+    """
+    Encoded heatmap, computed once per dataset version, population data, layer, bbox, resolution and format.
+
+    Returns:
+        dict: ``body`` plus what the response headers need (shape, max, bounds, cache key).
+    """
+    if layer not in LAYERS:
+        raise HeatmapError(f"layer must be one of {', '.join(LAYERS)}")
+    if year is None and layer != "centers":
+        year = latest_population_year()
+    store = get_population_store()
+    key = (
+        current_dataset_version(),
+        None if layer == "centers" else (year, store.metadata["name"] if store else None),
+        layer, tuple(bbox), resolution, fmt,
+    )
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    grid = render_heatmap(layer, bbox, resolution, year)
+    body, high = heatmap_bytes(grid, fmt)
+    entry = {
+        "body": body,
+        "format": fmt,
+        "shape": grid.shape,
+        "max": high,
+        "total": float(grid.sum()),
+        "bounds": tuple(bbox),
+        "etag": '"heatmap-' + hashlib.sha1(repr(key).encode()).hexdigest()[:16] + '"',
+    }
+    with _cache_lock:
+        _cache[key] = entry
+        while len(_cache) > CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return entry
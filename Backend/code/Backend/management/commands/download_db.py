@@ -1,10 +1,46 @@
 from django.core.management.base import BaseCommand
+from Backend.db_snapshot import write_db_snapshot
+from Backend.profiling import PipelineProfile
 from Backend.proposed_hospitals_database import insert_hospitals_into_object
+from Backend.vector_tiles import DEFAULT_SEED_MAX_ZOOM, seed_tile_cache
 
 class Command(BaseCommand):
     help = 'Insert hospitals into the database'
 
-    def handle(self, *args, **kwargs):
-        insert_hospitals_into_object()
-        self.stdout.write(self.style.SUCCESS('Successfully inserted hospitals into the database'))
+    def add_arguments(self, parser):
+        parser.add_argument('--report', default='ingestion_profile.json', help='Where to write the JSON stage profile')
+        parser.add_argument('--profile', action='store_true', help='Dump a cProfile trace of the slowest stage')
+        parser.add_argument('--profile-output', default='ingestion_slowest_stage.prof')
+        parser.add_argument('--reject-file', default='ingestion_rejects.csv',
+                            help='Where to write rows rejected by validation and deduplication')
+        parser.add_argument('--population-year', type=int, default=None,
+                            help='Population year attached to the centers (default: the latest in the source)')
+        parser.add_argument('--seed-tiles-max-zoom', type=int, default=DEFAULT_SEED_MAX_ZOOM,
+                            help='Pre-render vector tiles up to this zoom (-1 to skip)')
+        parser.add_argument('--district-boundaries', default=None,
+                            help='GeoJSON of the district polygons (default: settings.DISTRICT_BOUNDARIES_FILE)')
+        parser.add_argument('--no-db-snapshot', action='store_true',
+                            help='Do not dump the ingested tables for restore_db')
+
+    def handle(self, *args, **options):
+        profile = insert_hospitals_into_object(profile=PipelineProfile(trace=options['profile']),
+                                               reject_file=options['reject_file'],
+                                               population_year=options['population_year'],
+                                               district_boundaries=options['district_boundaries'])
+        if options['seed_tiles_max_zoom'] >= 0:
+            with profile.stage("seed_tiles") as stage:
+                stage.rows_out = seed_tile_cache(options['seed_tiles_max_zoom'])
+        if not options['no_db_snapshot']:
+            with profile.stage("db_snapshot") as stage:
+                stage.rows_out = sum(table['rows'] for table in write_db_snapshot()['tables'].values())
 
+        self.stdout.write(profile.summary_table())
+        self.stdout.write(f"Stage profile written to {profile.write_report(options['report'])}")
+        if options['profile']:
+            slowest = profile.dump_slowest_trace(options['profile_output'])
+            if slowest is None:
+                self.stdout.write("No stage was traced, so no cProfile trace was written")
+            else:
+                self.stdout.write(f"cProfile trace of slowest stage '{slowest.name}' written to {options['profile_output']}")
+
+        self.stdout.write(self.style.SUCCESS('Successfully inserted hospitals into the database'))
@@ -0,0 +1,44 @@
+import os
+
+from django.core.management.base import BaseCommand
+from Backend.synthetic_data import (
+    generate_district_boundaries,
+    generate_synthetic_dataset,
+    MADRID_LAT_RANGE,
+    MADRID_LON_RANGE,
+)
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic medical centers and population CSVs in the Madrid source layout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Number of medical center rows (1k to 10M)')
+        parser.add_argument('--districts', type=int, default=21)
+        parser.add_argument('--barrios-per-district', type=int, default=6)
+        parser.add_argument('--years', type=int, nargs='+', default=[2024])
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output-dir', default='synthetic_data')
+        parser.add_argument('--duplicate-share', type=float, default=0.0, help='Share of near-duplicate facilities')
+        parser.add_argument('--invalid-share', type=float, default=0.0, help='Share of rows with (0, 0) coordinates')
+        parser.add_argument('--boundaries', action='store_true', help='Also write districts.geojson with the district cells')
+        parser.add_argument('--boundary-jitter', type=float, default=0.0,
+                            help='Bend the inner district borders by up to this share of a cell')
+
+    def handle(self, *args, **options):
+        health_center_file, population_file = generate_synthetic_dataset(
+            options['output_dir'],
+            options['rows'],
+            n_districts=options['districts'],
+            barrios_per_district=options['barrios_per_district'],
+            years=options['years'],
+            seed=options['seed'],
+            duplicate_share=options['duplicate_share'],
+            invalid_share=options['invalid_share'],
+        )
+        if options['boundaries']:
+            generate_district_boundaries(os.path.join(options['output_dir'], 'districts.geojson'),
+                                         options['districts'], jitter=options['boundary_jitter'], seed=options['seed'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Synthetic dataset written inside lat {MADRID_LAT_RANGE} lon {MADRID_LON_RANGE}: '
+            f'{health_center_file}, {population_file}'))
@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from Backend.rasters import DEFAULT_TILE_SIZE, RasterError, ingest_raster
+from Backend.synthetic_data import generate_raster_fixture
+
+
+class Command(BaseCommand):
+    help = 'Turn a GeoTIFF or NetCDF-style .npz raster into a tiled, memory-mapped layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('layer', help='Layer name, e.g. solar or wind')
+        parser.add_argument('path', nargs='?', help='GeoTIFF (.tif) or NetCDF-style (.npz) input')
+        parser.add_argument('--variable', help='Variable to read from a .npz with several')
+        parser.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE)
+        parser.add_argument('--synthetic', action='store_true', help='Ingest a generated fixture instead of a file')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = options['path']
+            if options['synthetic']:
+                path = generate_raster_fixture(os.path.join(tmp, f"{options['layer']}.tif"), options['layer'])
+            if path is None:
+                raise CommandError('Give a raster path or --synthetic')
+
+            try:
+                metadata = ingest_raster(options['layer'], path, options['variable'], options['tile_size'])
+            except (OSError, RasterError) as e:
+                raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Layer {metadata['layer']} is now {metadata['version']} "
+            f"({metadata['max_zoom'] + 1} zoom levels, bounds {metadata['bounds']})"))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from Backend.db_snapshot import DbSnapshotError, restore_db_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Load the last database snapshot unless the database already has its dataset version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Restore even if the database is as new as the snapshot')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            manifest = restore_db_snapshot(force=options['force'])
+        except DbSnapshotError as e:
+            raise CommandError(str(e))
+
+        if manifest is None:
+            self.stdout.write('Database is already at or past the snapshot; nothing restored')
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Restored {manifest['name']} (dataset version {manifest['dataset_version']}) "
+                f"in {time.perf_counter() - start:.2f}s"))
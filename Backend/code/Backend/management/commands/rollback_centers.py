@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from Backend.accessibility import refresh_district_accessibility
+from Backend.center_snapshot import write_center_snapshot
+from Backend.center_tables import TableSwapError
+from Backend.changes import rollback_centers
+
+
+class Command(BaseCommand):
+    help = 'Swap the medical centers back to the table the last staging swap replaced'
+
+    def handle(self, *args, **options):
+        try:
+            changed, version = rollback_centers()
+        except TableSwapError as e:
+            raise CommandError(str(e))
+
+        refresh_district_accessibility()
+        write_center_snapshot(version)
+        self.stdout.write(self.style.SUCCESS(f"Rolled back {changed} centers; dataset version {version}"))
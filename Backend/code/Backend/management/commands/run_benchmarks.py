@@ -0,0 +1,138 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from Backend.benchmarks import (
+    DEFAULT_TOLERANCE,
+    MIN_SERIALIZATION_SPEEDUP,
+    benchmark_coverage,
+    benchmark_distances,
+    benchmark_districts,
+    benchmark_serialization,
+    payload_sizes,
+    compare_to_baseline,
+    load_baseline,
+    run_benchmarks,
+    save_baseline,
+)
+from Backend.synthetic_data import generate_synthetic_dataset
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ingestion, proposals and the list endpoints on a synthetic dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Synthetic medical center rows')
+        parser.add_argument('--data-dir', default='synthetic_data')
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json'))
+        parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+        parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline')
+        parser.add_argument('--serialization-rows', type=int, default=0,
+                            help='Only compare DRF and fast serialization on this many rows (e.g. 100000)')
+        parser.add_argument('--payload-sizes', action='store_true',
+                            help='Only report listing sizes per field projection and compression')
+        parser.add_argument('--payload-rows', type=int, default=None,
+                            help='Synthetic rows for --payload-sizes (default: the centers in the database)')
+        parser.add_argument('--distance-pairs', type=int, default=0,
+                            help='Only compare vectorized distances with geopy on this many point pairs')
+        parser.add_argument('--district-points', type=int, default=0,
+                            help='Only time point-in-polygon district lookup for this many points')
+        parser.add_argument('--coverage-demand', type=int, default=0,
+                            help='Only time maximal covering placement over this many demand points')
+        parser.add_argument('--coverage-candidates', type=int, default=10000,
+                            help='Candidate sites for --coverage-demand')
+
+    def handle(self, *args, **options):
+        if options['serialization_rows']:
+            return self.handle_serialization(options['serialization_rows'])
+        if options['payload_sizes']:
+            return self.handle_payload_sizes(options['payload_rows'])
+        if options['distance_pairs']:
+            return self.handle_distances(options['distance_pairs'])
+        if options['district_points']:
+            return self.handle_districts(options['district_points'])
+        if options['coverage_demand']:
+            return self.handle_coverage(options['coverage_demand'], options['coverage_candidates'])
+
+        data_dir = os.path.join(options['data_dir'], str(options['rows']))
+        health_center_file = os.path.join(data_dir, 'health_center.csv')
+        population_file = os.path.join(data_dir, 'population.csv')
+        if not (os.path.exists(health_center_file) and os.path.exists(population_file)):
+            generate_synthetic_dataset(data_dir, options['rows'])
+
+        results = run_benchmarks(health_center_file, population_file)
+
+        self.stdout.write(f"{'step':<32}{'seconds':>10}{'peak MB':>10}{'queries':>10}")
+        for step in results:
+            self.stdout.write(
+                f"{step['name']:<32}{step['seconds']:>10.3f}{step['peak_rss_mb']:>10.1f}{step['queries']:>10}")
+
+        scale = str(options['rows'])
+        if options['save_baseline']:
+            save_baseline(options['baseline'], scale, results)
+            self.stdout.write(self.style.SUCCESS(f"Baseline for {scale} rows saved to {options['baseline']}"))
+            return
+
+        baseline = load_baseline(options['baseline'], scale)
+        if baseline is None:
+            self.stdout.write(self.style.WARNING(f'No baseline for {scale} rows, run with --save-baseline first'))
+            return
+
+        regressions = compare_to_baseline(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError('Performance regressions:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def handle_serialization(self, rows):
+        result = benchmark_serialization(rows)
+        for step in result['steps']:
+            self.stdout.write(f"{step['name']:<32}{step['seconds']:>10.3f}{step['peak_rss_mb']:>10.1f}")
+        self.stdout.write(f"{result['bytes']} bytes, {result['speedup']:.1f}x faster end to end, "
+                          f"{result['serialization_speedup']:.1f}x faster serializing already fetched rows")
+
+        if not result['identical']:
+            raise CommandError('Fast serialization output differs from ModelSerializer + JSONRenderer')
+        if result['speedup'] < MIN_SERIALIZATION_SPEEDUP:
+            raise CommandError(f"Fast serialization is only {result['speedup']:.1f}x faster end to end, "
+                               f"{MIN_SERIALIZATION_SPEEDUP - result['speedup']:.1f}x short of the expected "
+                               f"{MIN_SERIALIZATION_SPEEDUP:.0f}x")
+        self.stdout.write(self.style.SUCCESS('Fast serialization is byte-identical and fast enough'))
+
+    def handle_payload_sizes(self, rows):
+        sizes = payload_sizes(rows)
+        codings = [key for key in sizes[0] if key not in ('variant', 'fields')]
+        self.stdout.write(f"{'variant':<20}" + ''.join(f"{coding:>14}" for coding in codings))
+        for entry in sizes:
+            self.stdout.write(f"{entry['variant']:<20}" + ''.join(f"{entry[coding]:>14,}" for coding in codings))
+
+
+    def handle_distances(self, pairs):
+        result = benchmark_distances(pairs)
+        self.stdout.write(f"{'method':<32}{'seconds':>10}{'peak MB':>10}{'pairs/s':>16}")
+        rates = list(result['pairs_per_second'].values())
+        for step, rate in zip(result['steps'], rates):
+            self.stdout.write(f"{step['name']:<32}{step['seconds']:>10.3f}{step['peak_rss_mb']:>10.1f}{rate:>16,.0f}")
+
+        if 'speedup' not in result:
+            self.stdout.write(self.style.WARNING('geopy is not installed, skipped the comparison'))
+            return
+        errors = result['max_error_m']
+        self.stdout.write(f"Vincenty is {result['speedup']:,.0f}x faster than geopy; max error "
+                          f"{errors['vincenty'] * 1000:.4f} mm (haversine {errors['haversine']:.2f} m)")
+
+    def handle_districts(self, points):
+        result = benchmark_districts(points)
+        for step in result['steps']:
+            self.stdout.write(f"{step['name']:<32}{step['seconds']:>10.3f}{step['peak_rss_mb']:>10.1f}")
+        self.stdout.write(f"{result['points']:,} points against {result['vertices']:,} polygon edges: "
+                          f"{result['points_per_second']:,.0f} points/s, {result['located']:,} inside a district")
+
+    def handle_coverage(self, demand, candidates):
+        result = benchmark_coverage(demand, candidates)
+        for step in result['steps']:
+            self.stdout.write(f"{step['name']:<32}{step['seconds']:>10.3f}{step['peak_rss_mb']:>10.1f}")
+        evaluations = result['evaluations']
+        self.stdout.write(f"{result['demand']:,} demand points x {result['candidates']:,} candidates "
+                          f"({result['bitset_mb']:,.0f} MB of bitsets): {result['sites']} sites cover "
+                          f"{result['covered_share']:.1%} of the weight with {evaluations['weighted']:,} gain "
+                          f"evaluations ({evaluations['unweighted']:,} unweighted)")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from Backend.db_snapshot import write_db_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Dump the ingested tables to a Parquet snapshot that restore_db can load'
+
+    def handle(self, *args, **options):
+        manifest = write_db_snapshot()
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot {manifest['name']} written at dataset version {manifest['dataset_version']}"))
@@ -0,0 +1,151 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from rest_framework.views import APIView
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram, one series per label value."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self, label_name):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {label: (list(counts), total, count) for label, (counts, total, count) in self._series.items()}
+
+        for label, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_name}="{label}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_name}="{label}",le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label_name}="{label}"}} {total}')
+            lines.append(f'{self.name}_count{{{label_name}="{label}"}} {count}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    "backend_request_duration_seconds", "Wall time spent in the view.", DURATION_BUCKETS)
+DB_QUERIES = Histogram(
+    "backend_db_queries", "Database queries issued per request.", QUERY_COUNT_BUCKETS)
+DB_DURATION = Histogram(
+    "backend_db_duration_seconds", "Time spent waiting on the database per request.", DURATION_BUCKETS)
+SERIALIZER_DURATION = Histogram(
+    "backend_serializer_duration_seconds", "Time spent serializing the response data.", DURATION_BUCKETS)
+RESPONSE_BYTES = Histogram(
+    "backend_response_bytes", "Size of the response body.", BYTES_BUCKETS)
+
+HISTOGRAMS = [REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZER_DURATION, RESPONSE_BYTES]
+
+
+class RequestTimings:
+    """Per-request accumulator, also used as the DB execute wrapper."""
+
+    __slots__ = ("db_queries", "db_seconds", "serializer_seconds")
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.db_queries += 1
+
+
+@contextmanager
+def serializer_timer(request):
+    """Attributes the wrapped block to serializer time of the current request, if it is being measured."""
+    timings = getattr(request, "_timings", None)
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.serializer_seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Records wall time, DB queries, serializer time and response size for every APIView.
+
+    Set ``SERVER_TIMING_HEADER = True`` to also return the numbers to the
+    client in a ``Server-Timing`` header.
+
+    ``process_view`` only notes which view runs and when; Django still calls
+    it (with ``ATOMIC_REQUESTS``, ``process_exception`` and the lazy render),
+    and the numbers are taken once ``get_response`` returns. Being the last
+    middleware, the time covers the view and its rendering.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = request._timings = RequestTimings()
+        with connection.execute_wrapper(timings):
+            response = self.get_response(request)
+        view_name = getattr(request, "_metrics_view", None)
+        if view_name is None:
+            return response
+        elapsed = time.perf_counter() - request._metrics_started
+
+        REQUEST_DURATION.observe(view_name, elapsed)
+        DB_QUERIES.observe(view_name, timings.db_queries)
+        DB_DURATION.observe(view_name, timings.db_seconds)
+        SERIALIZER_DURATION.observe(view_name, timings.serializer_seconds)
+        if not response.streaming:
+            RESPONSE_BYTES.observe(view_name, len(response.content))
+
+        if settings.SERVER_TIMING_HEADER:
+            response["Server-Timing"] = (
+                f"view;dur={elapsed * 1000:.2f}, "
+                f"db;dur={timings.db_seconds * 1000:.2f};desc=\"{timings.db_queries} queries\", "
+                f"serializer;dur={timings.serializer_seconds * 1000:.2f}"
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "cls", None)
+        if view_class is not None and issubclass(view_class, APIView):
+            request._metrics_view = view_class.__name__
+            request._metrics_started = time.perf_counter()
+        return None
+
+
+def metrics_view(request):
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render("view"))
+    return HttpResponse("\n".join(lines) + "\n", content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Backend', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BarrioPopulation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('cod_distrito', models.CharField()),
+                ('cod_barrio', models.CharField()),
+                ('barrio', models.CharField()),
+                ('city_district', models.CharField()),
+                ('population', models.IntegerField()),
+                ('population_men', models.IntegerField()),
+                ('population_women', models.IntegerField()),
+                ('latitude', models.FloatField(null=True)),
+                ('longitude', models.FloatField(null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('year', 'cod_distrito', 'cod_barrio'), name='unique_barrio_per_year')],
+            },
+        ),
+    ]
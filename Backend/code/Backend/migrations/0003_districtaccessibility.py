@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Backend', '0002_barriopopulation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DistrictAccessibility',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city_district', models.CharField()),
+                ('type_of_center', models.CharField()),
+                ('population', models.IntegerField()),
+                ('mean_distance_m', models.FloatField()),
+                ('p90_distance_m', models.FloatField()),
+                ('computed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('city_district', 'type_of_center'), name='unique_accessibility_per_type')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Backend', '0004_datasetversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CenterChange',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('center_id', models.IntegerField()),
+                ('is_suggested', models.BooleanField()),
+                ('op', models.CharField(choices=[('insert', 'insert'), ('update', 'update'), ('delete', 'delete')])),
+                ('version', models.IntegerField(db_index=True)),
+            ],
+        ),
+    ]
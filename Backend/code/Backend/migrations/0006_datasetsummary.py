@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 04:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Backend', '0005_centerchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.IntegerField(db_index=True)),
+                ('is_suggested', models.BooleanField()),
+                ('city_district', models.CharField()),
+                ('type_of_center', models.CharField()),
+                ('centers', models.IntegerField()),
+                ('population', models.IntegerField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('version', 'is_suggested', 'city_district', 'type_of_center'), name='unique_summary_group')],
+            },
+        ),
+    ]
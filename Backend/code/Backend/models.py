@@ -13,5 +13,93 @@ class   MedicalCenter(models.Model):
     street = models.CharField()
     is_suggested = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # bbox filters for tiles and exports
+            models.Index(fields=["latitude", "longitude"], name="center_lat_lon_idx"),
+        ]
+
+    def __str__(self):
+        return (self.name)
+
+class BarrioPopulation(models.Model):
+    year = models.IntegerField()
+    cod_distrito = models.CharField()
+    cod_barrio = models.CharField()
+    barrio = models.CharField()
+    city_district = models.CharField()
+    population = models.IntegerField()
+    population_men = models.IntegerField()
+    population_women = models.IntegerField()
+    # Representative point: mean of the centers in the barrio, else of the district
+    latitude = models.FloatField(null=True)
+    longitude = models.FloatField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["year", "cod_distrito", "cod_barrio"], name="unique_barrio_per_year"),
+        ]
+
+    def __str__(self):
+        return (f"{self.barrio} ({self.year})")
+
+
+class DistrictAccessibility(models.Model):
+    city_district = models.CharField()
+    type_of_center = models.CharField()
+    population = models.IntegerField()
+    # Population-weighted distance from the district's demand points to the nearest center of this type
+    mean_distance_m = models.FloatField()
+    p90_distance_m = models.FloatField()
+    computed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["city_district", "type_of_center"], name="unique_accessibility_per_type"),
+        ]
+
+    def __str__(self):
+        return (f"{self.city_district} / {self.type_of_center}")
+
+
+class DatasetVersion(models.Model):
+    """One row per committed change to the centers; the id is the dataset version."""
+    reason = models.CharField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return (f"v{self.pk} ({self.reason})")
+
+
+class CenterChange(models.Model):
+    """Log of MedicalCenter writes in commit order; clients sync by asking for everything after a seq."""
+    OPERATIONS = [("insert", "insert"), ("update", "update"), ("delete", "delete")]
+
+    seq = models.BigAutoField(primary_key=True)
+    center_id = models.IntegerField()
+    is_suggested = models.BooleanField()
+    op = models.CharField(choices=OPERATIONS)
+    version = models.IntegerField(db_index=True)
+
+    def __str__(self):
+        return (f"#{self.seq} {self.op} {self.center_id}")
+
+
+class DatasetSummary(models.Model):
+    """Center counts per district and type at one dataset version, written with the version; feeds /api/summary."""
+    version = models.IntegerField(db_index=True)
+    is_suggested = models.BooleanField()
+    city_district = models.CharField()
+    type_of_center = models.CharField()
+    centers = models.IntegerField()
+    # Population of the district (the same on every center of it)
+    population = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["version", "is_suggested", "city_district", "type_of_center"],
+                                    name="unique_summary_group"),
+        ]
+
     def __str__(self):
-        return (self.name)
\ No newline at end of file
+        return (f"v{self.version} {self.city_district} / {self.type_of_center}: {self.centers}")
@@ -0,0 +1,227 @@
+import glob
+import json
+import os
+import re
+import shutil
+import uuid
+
+import polars as pl
+from django.conf import settings
+
+from .validation import normalized_name
+
+POINTER = "population.json"
+STORE_NAME = re.compile(r"population-[0-9a-f]{8}")
+POPULATION_COLUMNS = {
+    "num_personas": "population",
+    "num_personas_hombres": "population_men",
+    "num_personas_mujeres": "population_women",
+}
+# Partition columns live in the directory names, not in the files
+HIVE_SCHEMA = {"year": pl.Int32, "cod_distrito": pl.Utf8}
+BARRIO_SCHEMA = {
+    "year": pl.Int32,
+    "cod_distrito": pl.Utf8,
+    "cod_barrio": pl.Utf8,
+    "distrito": pl.Utf8,
+    "barrio": pl.Utf8,
+    "population": pl.Int64,
+    "population_men": pl.Int64,
+    "population_women": pl.Int64,
+}
+
+
+class PopulationError(ValueError):
+    """Unknown year or district, or nothing ingested yet."""
+
+
+def store_root():
+    return str(settings.POPULATION_ROOT)
+
+
+def normalized_code(column):
+    """District/barrio code as text without leading zeros: "01" in one source and "1" in the other must match."""
+    return pl.col(column).cast(pl.Utf8).str.strip_chars().str.strip_chars_start("0")
+
+
+def fecha_year(column="fecha"):
+    """Year of a "1 de enero de 2024" column."""
+    return pl.col(column).str.extract(r"(\d{4})\s*$").cast(pl.Int32)
+
+
+def population_barrios(df_population):
+    """
+    Barrio rows of the raw population CSV for every year, one row per (year, district, barrio).
+
+    The source has several rows per barrio and date; they are summed. City
+    and district total rows are dropped since they can be derived.
+    """
+    return df_population.filter(
+        (pl.col("cod_distrito") != pl.col("cod_barrio")) & (pl.col("cod_distrito") != "Todos")
+    ).with_columns(
+        fecha_year().alias("year"),
+        normalized_code("cod_distrito").alias("cod_distrito"),
+        normalized_code("cod_barrio").alias("cod_barrio"),
+    ).group_by(["year", "cod_distrito", "cod_barrio"]).agg(
+        pl.col("distrito").first().str.strip_chars(),
+        pl.col("barrio").first().str.strip_chars(),
+        *[pl.col(source).cast(pl.Float64, strict=False).sum().round().cast(pl.Int64).alias(target)
+          for source, target in POPULATION_COLUMNS.items()],
+    ).select(list(BARRIO_SCHEMA)).cast(BARRIO_SCHEMA).sort(["year", "cod_distrito", "cod_barrio"])
+
+
+def district_totals(barrios):
+    return barrios.group_by(["year", "cod_distrito"]).agg(
+        pl.col("distrito").first(),
+        pl.len().cast(pl.Int64).alias("barrios"),
+        *[pl.col(column).sum() for column in POPULATION_COLUMNS.values()],
+    ).sort(["year", "cod_distrito"])
+
+
+# --- Writing -------------------------------------------------------------
+
+def write_population_store(df_population, root=None):
+    """
+    Stores every year of the raw population CSV as Parquet partitioned by year and district, and publishes it.
+
+    Layout: ``barrios/year=<y>/cod_distrito=<d>/part-0.parquet`` plus
+    ``district_totals.parquet`` with the per-year district totals. Like the
+    other stores it is written to a new directory and becomes current when
+    the pointer file is atomically replaced; the store it replaces is kept
+    until the next publish.
+
+    Returns:
+        dict: The metadata of the new store.
+    """
+    return write_population_barrios(population_barrios(df_population), root)
+
+
+def write_population_barrios(barrios, root=None):
+    """Publishes a store from barrio rows already in ``BARRIO_SCHEMA`` (e.g. read back from BarrioPopulation)."""
+    root = root or store_root()
+    os.makedirs(root, exist_ok=True)
+    barrios = barrios.select(list(BARRIO_SCHEMA)).cast(BARRIO_SCHEMA)
+    totals = district_totals(barrios)
+
+    name = f"population-{uuid.uuid4().hex[:8]}"
+    directory = os.path.join(root, name)
+    for (year, cod_distrito), part in barrios.partition_by(["year", "cod_distrito"], as_dict=True).items():
+        partition = os.path.join(directory, "barrios", f"year={year}", f"cod_distrito={cod_distrito}")
+        os.makedirs(partition)
+        part.drop(list(HIVE_SCHEMA)).write_parquet(os.path.join(partition, "part-0.parquet"))
+    os.makedirs(directory, exist_ok=True)
+    totals.write_parquet(os.path.join(directory, "district_totals.parquet"))
+
+    latest = totals.filter(pl.col("year") == totals["year"].max()) if totals.height else totals
+    metadata = {
+        "name": name,
+        "years": sorted(totals["year"].unique().to_list()),
+        "districts": [{"code": code, "name": district} for code, district in latest.select("cod_distrito", "distrito").iter_rows()],
+        "rows": barrios.height,
+    }
+    with open(os.path.join(directory, "metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+    pointer = os.path.join(root, POINTER)
+    previous = _read_pointer(pointer)
+    tmp_pointer = pointer + ".tmp"
+    with open(tmp_pointer, "w") as f:
+        json.dump({"name": name}, f)
+    os.replace(tmp_pointer, pointer)
+    # Readers that loaded the previous store open its partitions lazily, so it goes on the next publish
+    for old in os.listdir(root):
+        if STORE_NAME.fullmatch(old) and old not in (name, previous):
+            shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+
+    print(f"Population store {name}: {barrios.height} barrio rows, years {metadata['years']}")
+    return metadata
+
+
+# --- Reading -------------------------------------------------------------
+
+def _read_pointer(pointer):
+    try:
+        with open(pointer) as f:
+            return json.load(f)["name"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class PopulationStore:
+    """One published population store."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "metadata.json")) as f:
+            self.metadata = json.load(f)
+
+    @property
+    def years(self):
+        return self.metadata["years"]
+
+    @property
+    def latest_year(self):
+        return self.years[-1] if self.years else None
+
+    def resolve_year(self, year=None):
+        """``year`` if the store has it, the latest year when None."""
+        if year is None:
+            year = self.latest_year
+        if year not in self.years:
+            raise PopulationError(f"No population data for {year}; available years: {self.years}")
+        return year
+
+    def resolve_district(self, district):
+        """District code for a code ("01" or "1") or a name (case and accents ignored)."""
+        if district is None:
+            return None
+        district = str(district).strip()
+        codes = {entry["code"]: entry["name"] for entry in self.metadata["districts"]}
+        code = district.lstrip("0")
+        if code in codes:
+            return code
+        names = pl.DataFrame({"code": list(codes), "name": list(codes.values()), "wanted": district}).filter(
+            normalized_name("name") == normalized_name("wanted"))
+        if names.is_empty():
+            raise PopulationError(f"Unknown district: {district}")
+        return names["code"][0]
+
+    def district_totals(self, year=None, district=None):
+        """Per-district totals of ``year`` (latest by default), optionally of one district."""
+        year, code = self.resolve_year(year), self.resolve_district(district)
+        totals = pl.scan_parquet(os.path.join(self.directory, "district_totals.parquet")).filter(pl.col("year") == year)
+        if code is not None:
+            totals = totals.filter(pl.col("cod_distrito") == code)
+        return totals.collect()
+
+    def barrios(self, year=None, district=None):
+        """
+        Barrio rows of ``year`` (latest by default), optionally of one district.
+
+        The partition directories are picked from the arguments, so only
+        the files of that year (and district) are opened.
+        """
+        year, code = self.resolve_year(year), self.resolve_district(district)
+        pattern = os.path.join(self.directory, "barrios", f"year={year}", f"cod_distrito={code or '*'}", "*.parquet")
+        if not glob.glob(pattern):
+            return pl.DataFrame(schema=BARRIO_SCHEMA)
+        return pl.scan_parquet(pattern, hive_partitioning=True, hive_schema=HIVE_SCHEMA).select(
+            list(BARRIO_SCHEMA)).sort(["cod_distrito", "cod_barrio"]).collect()
+
+
+def get_population_store(root=None):
+    """The published population store, or None before the first ingestion."""
+    name = _read_pointer(os.path.join(root or store_root(), POINTER))
+    if name is None:
+        return None
+    try:
+        return PopulationStore(os.path.join(root or store_root(), name))
+    except OSError:
+        return None
+
+
+def require_population_store():
+    store = get_population_store()
+    if store is None:
+        raise PopulationError("No population data ingested yet")
+    return store
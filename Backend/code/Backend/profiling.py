@@ -0,0 +1,176 @@
+import cProfile
+import json
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_bytes():
+    """Resident set size of this process, falling back to the peak when /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakRSSSampler:
+    """
+    Polls the RSS from a background thread and keeps the highest value seen.
+
+    ``ru_maxrss`` only ever grows over the life of the process, so it cannot
+    tell which step of a run reached the peak; sampling can.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.start_rss = 0
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, current_rss_bytes())
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = current_rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, current_rss_bytes())
+        return False
+
+
+@contextmanager
+def measure(name, count_queries=True):
+    """
+    Measures wall time, peak RSS and (optionally) DB queries of the wrapped block.
+
+    Yields a dict that is filled in when the block exits.
+    """
+    result = {"name": name}
+    queries = CaptureQueriesContext(connection) if count_queries else None
+    with PeakRSSSampler() as sampler:
+        if queries is not None:
+            queries.__enter__()
+        started = time.perf_counter()
+        try:
+            yield result
+        finally:
+            result["seconds"] = time.perf_counter() - started
+            if queries is not None:
+                queries.__exit__(None, None, None)
+                result["queries"] = len(queries)
+    result["peak_rss_mb"] = sampler.peak_rss / 2**20
+    result["rss_growth_mb"] = (sampler.peak_rss - sampler.start_rss) / 2**20
+
+
+class StageRecord:
+    """Duration, row counts and memory of one pipeline stage."""
+
+    __slots__ = ("name", "seconds", "rows_in", "rows_out", "peak_rss_mb", "rss_growth_mb", "profiler")
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.seconds = 0.0
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.peak_rss_mb = 0.0
+        self.rss_growth_mb = 0.0
+        self.profiler = None
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "seconds": round(self.seconds, 6),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "peak_rss_mb": round(self.peak_rss_mb, 2),
+            "rss_growth_mb": round(self.rss_growth_mb, 2),
+        }
+
+
+class PipelineProfile:
+    """
+    Collects a StageRecord for every named stage of a pipeline run.
+
+    With ``trace=True`` each stage also runs under its own cProfile
+    profiler, so the trace of the slowest one can be dumped afterwards.
+    """
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        record = StageRecord(name, rows_in)
+        if self.trace:
+            record.profiler = cProfile.Profile()
+
+        with PeakRSSSampler() as sampler:
+            started = time.perf_counter()
+            if record.profiler is not None:
+                record.profiler.enable()
+            try:
+                yield record
+            finally:
+                if record.profiler is not None:
+                    record.profiler.disable()
+                record.seconds = time.perf_counter() - started
+
+        record.peak_rss_mb = sampler.peak_rss / 2**20
+        record.rss_growth_mb = (sampler.peak_rss - sampler.start_rss) / 2**20
+        self.stages.append(record)
+
+    @property
+    def total_seconds(self):
+        return sum(record.seconds for record in self.stages)
+
+    def slowest_stage(self):
+        return max(self.stages, key=lambda record: record.seconds, default=None)
+
+    def summary_table(self):
+        def rows(value):
+            return "-" if value is None else str(value)
+
+        lines = [f"{'stage':<28}{'seconds':>10}{'rows in':>12}{'rows out':>12}{'peak MB':>10}{'+MB':>9}"]
+        for record in self.stages:
+            lines.append(
+                f"{record.name:<28}{record.seconds:>10.3f}{rows(record.rows_in):>12}{rows(record.rows_out):>12}"
+                f"{record.peak_rss_mb:>10.1f}{record.rss_growth_mb:>9.1f}")
+        lines.append(f"{'total':<28}{self.total_seconds:>10.3f}")
+        return "\n".join(lines)
+
+    def as_dict(self):
+        return {"total_seconds": round(self.total_seconds, 6), "stages": [record.as_dict() for record in self.stages]}
+
+    def write_report(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+        return path
+
+    def dump_slowest_trace(self, path):
+        """
+        Writes the cProfile stats of the slowest stage to ``path`` (readable with ``pstats``/snakeviz).
+
+        Returns:
+            StageRecord | None: The stage that was dumped, if any trace was recorded.
+        """
+        slowest = self.slowest_stage()
+        if slowest is None or slowest.profiler is None:
+            return None
+        slowest.profiler.dump_stats(path)
+        return slowest
@@ -1,7 +1,20 @@
 import polars as pl
 import pandas as pd
 import numpy as np
-from .models import MedicalCenter
+from .models import MedicalCenter, BarrioPopulation
+from .changes import sync_centers
+from .center_snapshot import current_snapshot, write_center_snapshot
+from .coverage import CoverageError, candidate_grid, plan_maximal_covering
+from .geo import nearest
+from .scenarios import DEFAULT_COVERAGE_RADIUS_M
+from .population_store import PopulationError, require_population_store
+from .validation import normalized_name
+
+PROPOSAL_METHODS = ("centroid", "mclp")
+DEFAULT_MCLP_SITES = 10
+MAX_MCLP_SITES = 100
+# Candidates are spaced half the radius apart, so a smaller radius quickly means hundreds of thousands of them
+MIN_MCLP_RADIUS_M = 100.0
 
 def load_data_from_django():
     # Query Django ORM
@@ -25,12 +38,18 @@ def load_data_from_django():
     return df
 
 def insert_into_django(df):
+    """
+    Replaces the stored proposals with the ones in ``df``, writing (and logging) only the districts that changed.
+
+    Returns:
+        tuple[dict, int]: The sync counts and the resulting dataset version.
+    """
     # Convert Polars to list of dicts
     records = df.to_dicts()
 
     # Map to Django model fields if column names match
-    objects = [
-        MedicalCenter(
+    rows = [
+        dict(
             latitude=rec["latitude"],
             longitude=rec["longitude"],
             type_of_center="TODO",
@@ -40,27 +59,159 @@ def insert_into_django(df):
             city_district=rec["city_district"],
             population_in_district=0,
             street="MOCK STREET",
-            is_suggested=bool(rec.get("is_suggested", False))  # default if not in df
+            is_suggested=True,
         )
         for rec in records
     ]
 
-    # Bulk insert for efficiency
-    MedicalCenter.objects.bulk_create(objects, batch_size=500)
+    return sync_centers(rows, is_suggested=True, reason="proposals")
+
+def with_population_of_year(df, year):
+    """
+    Replaces the district population stored with every center by the one of ``year`` from the population store.
 
-def insert_proposed_hospitals_into_object():
-    
+    Districts are matched by name (case and accents ignored); centers of a
+    district the store does not know keep their stored population.
+    """
+    totals = require_population_store().district_totals(year).select(
+        normalized_name("distrito").alias("district_key"),
+        pl.col("population").cast(pl.Float64).alias("population_of_year"),
+    )
+    return df.with_columns(normalized_name("city_district").alias("district_key")).join(
+        totals, on="district_key", how="left"
+    ).with_columns(
+        pl.coalesce("population_of_year", pl.col("population_in_district").cast(pl.Float64)).alias("population_in_district")
+    ).drop("district_key", "population_of_year")
+
+def barrio_district_centroids(df, year=None):
+    """
+    District centroids weighted by barrio population instead of by the centers themselves.
+
+    Every barrio contributes its representative point weighted by its
+    population, so a district's centroid shifts towards its populous
+    barrios. The points themselves are means of the centers in each barrio
+    (see ``transform_barrio_population``), so this still leans towards
+    where centers already are. ``year`` defaults to the latest one ingested.
+    """
+    if year is None:
+        year = BarrioPopulation.objects.order_by("-year").values_list("year", flat=True).first()
+    barrios = pl.DataFrame(list(
+        BarrioPopulation.objects.filter(year=year, latitude__isnull=False, population__gt=0)
+        .values("city_district", "population", "latitude", "longitude")
+    ))
+    if barrios.is_empty():
+        raise PopulationError(f"No barrio population for {year}")
+
+    centroids = barrios.group_by("city_district").agg(
+        ((pl.col("latitude") * pl.col("population")).sum() / pl.col("population").sum()).alias("centroid_lat"),
+        ((pl.col("longitude") * pl.col("population")).sum() / pl.col("population").sum()).alias("centroid_lon"),
+        pl.col("population").sum().cast(pl.Float64).alias("total_population"),
+    )
+    current_hospitals = df.group_by("city_district").agg(pl.len().cast(pl.Float64).alias("current_hospitals"))
+
+    return centroids.join(current_hospitals, on="city_district", how="left").with_columns(
+        pl.col("current_hospitals").fill_null(0)
+    ).to_pandas()
+
+def maximal_covering_proposals(df, year=None, sites=DEFAULT_MCLP_SITES, radius_m=DEFAULT_COVERAGE_RADIUS_M):
+    """
+    Places ``sites`` new hospitals where they bring the most residents within ``radius_m`` of a center.
+
+    Demand is the barrio population of ``year`` (the latest by default) at
+    each barrio's representative point; residents already within the
+    radius of an existing center count as covered. Candidate sites are a
+    grid of half the radius over the barrios, and each proposal takes the
+    district of its nearest barrio. Representative points come from the
+    centers themselves, so barrios read as better covered than they are.
+
+    Raises:
+        CoverageError: ``sites`` is not in 1..MAX_MCLP_SITES, ``radius_m``
+            is not a number of at least MIN_MCLP_RADIUS_M, or the candidate
+            grid would be too large.
+
+    Returns:
+        pl.DataFrame: latitude, longitude and city_district of every proposal, in pick order.
+    """
+    if not 1 <= sites <= MAX_MCLP_SITES:
+        raise CoverageError(f"sites must be between 1 and {MAX_MCLP_SITES}")
+    if not np.isfinite(radius_m) or radius_m < MIN_MCLP_RADIUS_M:
+        raise CoverageError(f"radius must be a number of at least {MIN_MCLP_RADIUS_M:g} m")
+    if year is None:
+        year = BarrioPopulation.objects.order_by("-year").values_list("year", flat=True).first()
+    barrios = np.array(
+        BarrioPopulation.objects.filter(year=year, latitude__isnull=False, population__gt=0)
+        .values_list("latitude", "longitude", "population"),
+        dtype=np.float64,
+    ).reshape(-1, 3)
+    if not barrios.size:
+        raise PopulationError(f"No barrio population for {year}")
+    districts = list(
+        BarrioPopulation.objects.filter(year=year, latitude__isnull=False, population__gt=0)
+        .values_list("city_district", flat=True)
+    )
+
+    candidate_lat, candidate_lon = candidate_grid(barrios[:, 0], barrios[:, 1], radius_m / 2, margin_m=radius_m / 2)
+    facility_lat = df["latitude"].to_numpy() if not df.is_empty() else ()
+    facility_lon = df["longitude"].to_numpy() if not df.is_empty() else ()
+    plan = plan_maximal_covering(barrios[:, 0], barrios[:, 1], barrios[:, 2], candidate_lat, candidate_lon,
+                                 sites, radius_m, facility_lat, facility_lon)
+    if not plan["sites"]:
+        return pl.DataFrame(schema={"latitude": pl.Float64, "longitude": pl.Float64, "city_district": pl.Utf8})
+
+    closest, _ = nearest(plan["latitude"], plan["longitude"], barrios[:, 0], barrios[:, 1])
+    return pl.DataFrame({
+        "latitude": plan["latitude"],
+        "longitude": plan["longitude"],
+        "city_district": [districts[i] for i in closest],
+    })
+
+def insert_proposed_hospitals_into_object(demand="district", year=None, method="centroid",
+                                          sites=DEFAULT_MCLP_SITES, radius_m=DEFAULT_COVERAGE_RADIUS_M):
+    """
+    Proposes new hospitals and stores them as suggested MedicalCenters.
+
+    Args:
+        demand (str): "district" weights the centroid with the district
+            population attached to each center; "barrio" uses the finer
+            barrio-level demand points from BarrioPopulation.
+        year (int, optional): Population year to weight with, read from the
+            population store. By default the population ingested with the
+            centers (district) or the latest year (barrio).
+        method (str): "centroid" proposes one hospital per district at its
+            weighted centroid; "mclp" places ``sites`` hospitals to cover the
+            most barrio population within ``radius_m`` (maximal covering,
+            see ``maximal_covering_proposals``; ``demand`` is ignored).
+        sites (int): Hospitals to place with "mclp".
+        radius_m (float): Coverage radius of "mclp", in meters.
+
+    Raises:
+        PopulationError: ``year`` is not in the population store.
+        CoverageError: Unknown ``method`` or bad ``sites`` / ``radius_m``.
+    """
+    if method not in PROPOSAL_METHODS:
+        raise CoverageError(f"method must be one of {', '.join(PROPOSAL_METHODS)}")
     df = load_data_from_django()
 
+    if method == "mclp":
+        _, version = insert_into_django(maximal_covering_proposals(df, year, sites, radius_m))
+        if current_snapshot() is None:
+            write_center_snapshot(version)
+        return
+
     # Step 1: Compute district centroids weighted by population
-    district_centroids = df.to_pandas().groupby('city_district').apply(
-        lambda x: pd.Series({
-            'centroid_lat': np.ma.average(x['latitude'], weights=x['population_in_district'], ),
-            'centroid_lon': np.ma.average(x['longitude'], weights=x['population_in_district']),
-            'total_population': x['population_in_district'].sum(),
-            'current_hospitals': len(x)
-        })
-    ).reset_index()
+    if demand == "barrio" and BarrioPopulation.objects.exists():
+        district_centroids = barrio_district_centroids(df, year)
+    else:
+        if year is not None:
+            df = with_population_of_year(df, year)
+        district_centroids = df.to_pandas().groupby('city_district').apply(
+            lambda x: pd.Series({
+                'centroid_lat': np.ma.average(x['latitude'], weights=x['population_in_district'], ),
+                'centroid_lon': np.ma.average(x['longitude'], weights=x['population_in_district']),
+                'total_population': x['population_in_district'].sum(),
+                'current_hospitals': len(x)
+            })
+        ).reset_index()
 
     # Step 2: Compute a simple score to suggest new hospitals
     # e.g., more population per existing hospital => higher need
@@ -89,4 +240,6 @@ def insert_proposed_hospitals_into_object():
 
 
 
-    insert_into_django(proposals_polars_final)
\ No newline at end of file
+    _, version = insert_into_django(proposals_polars_final)
+    if current_snapshot() is None:
+        write_center_snapshot(version)
\ No newline at end of file
@@ -1,32 +1,17 @@
 from urllib import request
 from urllib.parse import urlparse
-from .models import MedicalCenter
 import polars as pl
 import os
-import pandas as pd
-import chardet
-import numpy as np
-
-# Function to convert file to UTF-8
-def convert_to_utf8(input_file, output_file=None):
-    if output_file is None:
-        output_file = input_file.replace('.csv', '_utf8.csv')
-
-    # Detect encoding
-    with open(input_file, 'rb') as f:
-        raw_data = f.read()
-        encoding = chardet.detect(raw_data)['encoding']
-        print(f"Detected encoding: {encoding}")
-
-    # Read with detected encoding and save as UTF-8
-    with open(input_file, 'r', encoding=encoding, errors='replace') as f:
-        content = f.read()
-
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(content)
-
-    print(f"File converted to UTF-8: {output_file}")
-    return output_file
+from django.conf import settings
+from .profiling import PipelineProfile
+from .barrio_population import transform_barrio_population, update_barrio_population
+from .accessibility import refresh_district_accessibility
+from .changes import sync_centers
+from .center_snapshot import current_snapshot, write_center_snapshot
+from .districts import assign_districts, load_district_boundaries
+from .population_store import get_population_store, normalized_code, write_population_store
+from .staging import scan_staged, stage_source
+from .validation import validate_centers, write_rejects
 
 def download_file_urllib(url: str, local_filename: str = None) -> str:
     """
@@ -59,12 +44,18 @@ def download_file_urllib(url: str, local_filename: str = None) -> str:
         return None
 
 def insert_into_django(df):
+    """
+    Syncs the centers table with ``df``: only new, changed and removed centers are written and logged.
+
+    Returns:
+        tuple[dict, int]: The sync counts and the resulting dataset version.
+    """
     # Convert Polars to list of dicts
     records = df.to_dicts()
 
     # Map to Django model fields if column names match
-    objects = [
-        MedicalCenter(
+    rows = [
+        dict(
             type_of_center=rec["type_of_center"],
             accesibility=rec["accesibility"],
             name=rec["name"],
@@ -72,31 +63,19 @@ def insert_into_django(df):
             city_district=rec["city_district"],
             latitude=rec["latitude"],
             longitude=rec["longitude"],
-            population_in_district=rec["population_in_district"],
+            population_in_district=int(rec["population_in_district"]),
             street=rec["street"],
-            is_suggested=bool(rec.get("is_suggested", False))  # default if not in df
+            is_suggested=False,
         )
         for rec in records
     ]
 
-    # Bulk insert for efficiency
-    MedicalCenter.objects.bulk_create(objects, batch_size=500)
-
-def insert_hospitals_into_object():
-    health_centers_url = f"https://datos.madrid.es/egob/catalogo/212769-0-atencion-medica.csv"
-    population_madrid_url = f"https://datos.madrid.es/egob/catalogo/300557-0-poblacion-distrito-barrio.csv"
-
-    download_file_urllib(health_centers_url, "health_center.csv")
-    download_file_urllib(population_madrid_url, "population.csv")
-
-    utf8_file_health_centers = convert_to_utf8("health_center.csv")
-    utf8_file_population_madrid = convert_to_utf8("population.csv")
-
-    df = pl.read_csv(utf8_file_health_centers, separator=";")
-    df2 = pl.read_csv(utf8_file_population_madrid, separator=";", infer_schema_length=None)
+    return sync_centers(rows, is_suggested=False, reason="ingestion")
 
+def transform_health_centers(df):
+    """Classifies the centers, builds the street and keeps only the columns we store."""
     df = df.with_columns(
-        (pl.col('CLASE-VIAL') + ' ' + pl.col('NOMBRE-VIA') + ' ' + pl.col('NUM')).alias('CALLE')
+        pl.concat_str([pl.col('CLASE-VIAL'), pl.col('NOMBRE-VIA'), pl.col('NUM')], separator=' ').alias('CALLE')
     )
 
     # Corrected code with the right syntax for Polars
@@ -127,32 +106,15 @@ def insert_hospitals_into_object():
     # Drop the specified columns from the DataFrame
     df = df.drop(columns_to_drop)
 
+    return df.with_columns(normalized_code("COD-DISTRITO").alias("cod_distrito"))
 
-    #Segundo data frame
-
-    # Convert the CSV file to UTF-8
-    """csv_file2 = "/content/poblacion_1_enero.csv"
-    utf8_file2 = convert_to_utf8(csv_file2)
-    df2 = pl.read_csv(utf8_file2, separator=";", infer_schema_length=None)"""
-
-    df2 = df2.filter( pl.col("fecha") == "1 de enero de 2024")
-    df2 = df2.filter(pl.col("cod_distrito") == pl.col("cod_barrio"))
-    df2 = df2.filter(pl.col("cod_distrito") != "Todos")
-
-    # List of columns to drop
-    columns_to_drop2 = ["cod_municipio","municipio","num_personas_hombres","num_personas_mujeres","cod_barrio","barrio"] # Add other column names you want to drop to this list
-
-    # Drop the specified columns from the DataFrame
-    df2 = df2.drop(columns_to_drop2)
-
-    #Unión de data frames
-
-    df = df.with_columns(pl.col("COD-DISTRITO").str.to_lowercase().alias("cod_distrito"))
-    df2 = df2.with_columns(
-    pl.col("cod_distrito").str.to_lowercase().str.strip_chars().alias("cod_distrito")).group_by('cod_distrito').agg(
-    pl.col('num_personas').cast(pl.Float32, strict=False).sum().alias('num_personas')
-    )
+def district_population(store, year=None):
+    """Total population per district in ``year`` (the latest one in the store by default), from the precomputed totals."""
+    return store.district_totals(year).select(
+        "cod_distrito", pl.col("population").cast(pl.Float32).alias("num_personas"))
 
+def join_population(df, df2):
+    """Attaches the district population to every center and renames to the model fields."""
     df_unido = df.join(
     df2.select(["cod_distrito", "num_personas"]), how="left", left_on="cod_distrito", right_on="cod_distrito"
     ).with_columns(
@@ -171,13 +133,115 @@ def insert_hospitals_into_object():
     # Drop the specified columns from the DataFrame
     df_unido = df_unido.drop(columns_to_drop)
 
-    df_unido.glimpse()
+    # Centers of districts missing from the population file keep a null population; validate_centers rejects them
+    return df_unido.with_columns(
+        pl.col("population_in_district").cast(pl.Float32).alias("population_in_district")
+    )
 
-    # TODO: examinar porque hay nulos, cuando no debería
+def insert_hospitals_into_object(health_center_file=None, population_file=None, profile=None, reject_file=None,
+                                 population_year=None, district_boundaries=None):
+    """
+    Downloads the Madrid sources and inserts the medical centers.
 
-    df_unido = df_unido.with_columns(
-        pl.col("population_in_district").cast(pl.Float32).alias("population_in_district")
-    ).with_columns(pl.col("population_in_district").fill_null(strategy="zero"))
+    Every step runs as a named stage of ``profile`` so slow runs can be
+    traced to download, staging, parsing, joining or inserting. Each raw
+    CSV is decoded and parsed only the first time its content is seen;
+    after that the typed Parquet copy in ``settings.STAGING_ROOT`` is read.
+
+    Args:
+        health_center_file (str, optional): Local medical centers CSV to use
+            instead of downloading it (e.g. a synthetic dataset).
+        population_file (str, optional): Local population CSV to use instead
+            of downloading it.
+        profile (PipelineProfile, optional): Collects the per-stage timings.
+            A new one is created if not given.
+        reject_file (str, optional): Where to write the rows rejected by
+            validation (invalid or duplicate), with the reason for each.
+        population_year (int, optional): Year whose district population is
+            attached to the centers. The latest year in the file by default;
+            every year is kept in the population store either way.
+        district_boundaries (str, optional): GeoJSON of the district polygons
+            the centers are located in (``settings.DISTRICT_BOUNDARIES_FILE``
+            by default). Without one the text DISTRITO column is trusted.
 
+    Returns:
+        PipelineProfile: The profile of this run.
+    """
+    health_centers_url = f"https://datos.madrid.es/egob/catalogo/212769-0-atencion-medica.csv"
+    population_madrid_url = f"https://datos.madrid.es/egob/catalogo/300557-0-poblacion-distrito-barrio.csv"
 
-    insert_into_django(df_unido)
+    if profile is None:
+        profile = PipelineProfile()
+
+    with profile.stage("download"):
+        if health_center_file is None:
+            health_center_file = "health_center.csv"
+            download_file_urllib(health_centers_url, health_center_file)
+        if population_file is None:
+            population_file = "population.csv"
+            download_file_urllib(population_madrid_url, population_file)
+
+    with profile.stage("stage_sources"):
+        staging_root = str(settings.STAGING_ROOT)
+        staged_health_centers, reused_health_centers = stage_source(health_center_file, "health_centers", staging_root)
+        staged_population, reused_population = stage_source(population_file, "population", staging_root)
+        print(f"Staged sources reused: health centers {reused_health_centers}, population {reused_population}")
+
+    with profile.stage("parse_health_centers") as stage:
+        df = scan_staged(staged_health_centers).collect()
+        stage.rows_out = df.height
+
+    boundaries_file = str(district_boundaries or settings.DISTRICT_BOUNDARIES_FILE)
+    if os.path.exists(boundaries_file):
+        with profile.stage("district_polygons", rows_in=df.height) as stage:
+            df, district_counts = assign_districts(df, load_district_boundaries(boundaries_file),
+                                                   settings.DISTRICT_ASSIGNMENT)
+            stage.rows_out = df.height
+            print(f"District polygons ({settings.DISTRICT_ASSIGNMENT}): {district_counts}")
+
+    with profile.stage("parse_population") as stage:
+        df2 = scan_staged(staged_population).collect()
+        stage.rows_out = df2.height
+
+    with profile.stage("population_store", rows_in=df2.height) as stage:
+        stage.rows_out = write_population_store(df2)["rows"]
+        store = get_population_store()
+
+    with profile.stage("barrio_population", rows_in=df2.height) as stage:
+        barrio_counts = update_barrio_population(transform_barrio_population(df, df2))
+        stage.rows_out = barrio_counts["created"] + barrio_counts["updated"]
+        print(f"Barrio population: {barrio_counts}")
+
+    with profile.stage("transform_health_centers", rows_in=df.height) as stage:
+        df = transform_health_centers(df)
+        stage.rows_out = df.height
+
+    with profile.stage("district_population") as stage:
+        df2 = district_population(store, population_year)
+        stage.rows_out = df2.height
+        print(f"District population of {store.resolve_year(population_year)}")
+
+    with profile.stage("join", rows_in=df.height) as stage:
+        df_unido = join_population(df, df2)
+        stage.rows_out = df_unido.height
+
+    with profile.stage("validate", rows_in=df_unido.height) as stage:
+        df_unido, rejected = validate_centers(df_unido)
+        stage.rows_out = df_unido.height
+        print(f"Rejected rows: {rejected.group_by('reject_reason').len().sort('reject_reason').rows()}")
+        if reject_file is not None:
+            write_rejects(rejected, reject_file)
+
+    with profile.stage("insert", rows_in=df_unido.height) as stage:
+        counts, version = insert_into_django(df_unido)
+        stage.rows_out = counts["inserted"] + counts["updated"] + counts["deleted"]
+        print(f"Medical centers: {counts}")
+
+    with profile.stage("accessibility") as stage:
+        stage.rows_out = refresh_district_accessibility()
+
+    if current_snapshot() is None:
+        with profile.stage("snapshot") as stage:
+            stage.rows_out = write_center_snapshot(version)["rows"]
+
+    return profile
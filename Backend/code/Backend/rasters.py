@@ -0,0 +1,340 @@
+import hashlib
+import io
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .geo import nearest
+
+TIFF_MODEL_PIXEL_SCALE = 33550
+TIFF_MODEL_TIEPOINT = 33922
+TIFF_GDAL_NODATA = 42113
+NETCDF_COORDINATES = {"lat", "lon", "latitude", "longitude", "time"}
+
+DEFAULT_TILE_SIZE = 256
+
+
+class RasterError(Exception):
+    pass
+
+
+def raster_root():
+    return str(settings.RASTER_ROOT)
+
+
+# --- Reading inputs ------------------------------------------------------
+
+def read_geotiff(path):
+    """
+    Reads a single-band GeoTIFF with Pillow.
+
+    Only north-up rasters georeferenced by ModelPixelScale + ModelTiepoint
+    (what GDAL writes for EPSG:4326) are supported.
+
+    Returns:
+        tuple[np.ndarray, tuple]: float32 data with row 0 to the north, and
+        its (west, south, east, north) bounds.
+    """
+    with Image.open(path) as image:
+        tags = image.tag_v2
+        data = np.asarray(image, dtype=np.float32)
+        scale = tags.get(TIFF_MODEL_PIXEL_SCALE)
+        tiepoint = tags.get(TIFF_MODEL_TIEPOINT)
+        nodata = tags.get(TIFF_GDAL_NODATA)
+
+    if scale is None or tiepoint is None:
+        raise RasterError(f"{path} has no ModelPixelScale/ModelTiepoint georeferencing")
+
+    height, width = data.shape
+    west = tiepoint[3] - tiepoint[0] * scale[0]
+    north = tiepoint[4] + tiepoint[1] * scale[1]
+    bounds = (west, north - height * scale[1], west + width * scale[0], north)
+
+    if nodata not in (None, ""):
+        data = np.where(data == np.float32(float(str(nodata).strip("\x00"))), np.nan, data).astype(np.float32)
+    return data, bounds
+
+
+def read_netcdf_like(path, variable=None):
+    """
+    Reads a NetCDF-style ``.npz``: 1-D ``lat``/``lon`` cell-center vectors plus a 2-D variable.
+
+    Returns:
+        tuple[np.ndarray, tuple]: float32 data with row 0 to the north, and
+        its (west, south, east, north) bounds.
+    """
+    with np.load(path) as arrays:
+        lat = arrays["lat"] if "lat" in arrays else arrays["latitude"]
+        lon = arrays["lon"] if "lon" in arrays else arrays["longitude"]
+        if variable is None:
+            candidates = [name for name in arrays.files if name not in NETCDF_COORDINATES]
+            if len(candidates) != 1:
+                raise RasterError(f"{path}: pick one variable out of {candidates}")
+            variable = candidates[0]
+        data = np.asarray(arrays[variable], dtype=np.float32)
+
+    if data.ndim == 3:
+        # (time, lat, lon): keep the long-term mean
+        data = np.nanmean(data, axis=0).astype(np.float32)
+    if lat[0] < lat[-1]:
+        data, lat = data[::-1], lat[::-1]
+
+    half_lat = abs(float(lat[0] - lat[1])) / 2 if lat.size > 1 else 0.0
+    half_lon = abs(float(lon[1] - lon[0])) / 2 if lon.size > 1 else 0.0
+    bounds = (float(lon[0]) - half_lon, float(lat[-1]) - half_lat, float(lon[-1]) + half_lon, float(lat[0]) + half_lat)
+    return np.ascontiguousarray(data), bounds
+
+
+def read_raster(path, variable=None):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".tif", ".tiff"):
+        return read_geotiff(path)
+    if extension == ".npz":
+        return read_netcdf_like(path, variable)
+    raise RasterError(f"Unsupported raster format: {extension}")
+
+
+# --- Building the tiled store --------------------------------------------
+
+def downsample(data):
+    """Halves the resolution with a 2x2 NaN-aware mean."""
+    height, width = data.shape
+    padded = np.full((height + height % 2, width + width % 2), np.nan, dtype=np.float32)
+    padded[:height, :width] = data
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    valid = ~np.isnan(blocks)
+    counts = valid.sum(axis=(1, 3))
+    sums = np.where(valid, blocks, 0).sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan).astype(np.float32)
+
+
+def write_tiled_level(path, data, tile_size):
+    """Stores ``data`` as a (tiles_y, tiles_x, tile, tile) .npy so every tile is one contiguous block."""
+    height, width = data.shape
+    tiles_y, tiles_x = math.ceil(height / tile_size), math.ceil(width / tile_size)
+    tiled = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32,
+                                      shape=(tiles_y, tiles_x, tile_size, tile_size))
+    tiled[:] = np.nan
+    for ty in range(tiles_y):
+        rows = data[ty * tile_size:(ty + 1) * tile_size]
+        for tx in range(tiles_x):
+            block = rows[:, tx * tile_size:(tx + 1) * tile_size]
+            tiled[ty, tx, :block.shape[0], :block.shape[1]] = block
+    tiled.flush()
+    del tiled
+    return tiles_y, tiles_x
+
+
+def build_raster_store(layer, data, bounds, tile_size=DEFAULT_TILE_SIZE, source_checksum=None, root=None):
+    """
+    Writes ``data`` as a tiled pyramid of memory-mappable .npy files and makes it the layer's current version.
+
+    Level ``max_zoom`` is the full resolution and every level below halves
+    it, down to level 0 which fits in a single tile. The new version is
+    built in its own directory and published by atomically replacing the
+    layer's pointer file, so readers never see a half-written store. The
+    previous version is kept until the next publish.
+
+    Returns:
+        dict: The metadata of the new version.
+    """
+    root = root or raster_root()
+    os.makedirs(root, exist_ok=True)
+    version = f"{layer}-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    directory = os.path.join(root, version)
+    os.makedirs(directory)
+
+    data = np.ascontiguousarray(data, dtype=np.float32)
+    max_zoom = max(0, math.ceil(math.log2(max(data.shape) / tile_size)))
+    levels = {}
+    level = data
+    for z in range(max_zoom, -1, -1):
+        tiles_y, tiles_x = write_tiled_level(os.path.join(directory, f"z{z}.npy"), level, tile_size)
+        levels[z] = {"height": level.shape[0], "width": level.shape[1], "tiles_y": tiles_y, "tiles_x": tiles_x}
+        if z:
+            level = downsample(level)
+
+    finite = data[np.isfinite(data)]
+    metadata = {
+        "layer": layer,
+        "version": version,
+        "bounds": list(bounds),
+        "tile_size": tile_size,
+        "max_zoom": max_zoom,
+        "levels": {str(z): info for z, info in levels.items()},
+        "min": float(finite.min()) if finite.size else None,
+        "max": float(finite.max()) if finite.size else None,
+        "source_checksum": source_checksum,
+    }
+    with open(os.path.join(directory, "metadata.json"), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+    pointer = os.path.join(root, f"{layer}.json")
+    previous = _read_pointer(pointer)
+    tmp_pointer = pointer + ".tmp"
+    with open(tmp_pointer, "w") as f:
+        json.dump({"version": version}, f)
+    os.replace(tmp_pointer, pointer)
+
+    # The version just replaced stays: workers may still load it or map its levels lazily
+    _purge_versions(root, layer, keep={version, previous})
+    return metadata
+
+
+def _purge_versions(root, layer, keep):
+    """Deletes the version directories of ``layer`` other than ``keep``."""
+    pattern = re.compile(re.escape(layer) + r"-\d{14}-[0-9a-f]{8}")
+    for name in os.listdir(root):
+        if pattern.fullmatch(name) and name not in keep:
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def ingest_raster(layer, path, variable=None, tile_size=DEFAULT_TILE_SIZE, root=None):
+    with open(path, "rb") as f:
+        checksum = hashlib.sha256(f.read()).hexdigest()
+    data, bounds = read_raster(path, variable)
+    return build_raster_store(layer, data, bounds, tile_size=tile_size, source_checksum=checksum, root=root)
+
+
+# --- Reading the store ---------------------------------------------------
+
+def _read_pointer(pointer):
+    try:
+        with open(pointer) as f:
+            return json.load(f)["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+class RasterStore:
+    """One version of a layer, with its levels mapped lazily and read-only."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "metadata.json")) as f:
+            self.metadata = json.load(f)
+        self._levels = {}
+
+    def level(self, z):
+        if z not in self._levels:
+            if str(z) not in self.metadata["levels"]:
+                raise RasterError(f"Zoom level {z} out of range 0..{self.metadata['max_zoom']}")
+            self._levels[z] = np.load(os.path.join(self.directory, f"z{z}.npy"), mmap_mode="r")
+        return self._levels[z]
+
+    def tile(self, z, x, y):
+        """A view into the mapped file for tile (x, y) of level z; nothing is copied."""
+        level = self.level(z)
+        if not (0 <= y < level.shape[0] and 0 <= x < level.shape[1]):
+            raise RasterError(f"Tile {x}/{y} out of range at zoom {z}")
+        return level[y, x]
+
+    def tile_bounds(self, z, x, y):
+        west, south, east, north = self.metadata["bounds"]
+        info = self.metadata["levels"][str(z)]
+        tile = self.metadata["tile_size"]
+        pixel_w = (east - west) / info["width"]
+        pixel_h = (north - south) / info["height"]
+        return (west + x * tile * pixel_w, north - (y + 1) * tile * pixel_h,
+                west + (x + 1) * tile * pixel_w, north - y * tile * pixel_h)
+
+
+def tile_png(store, tile):
+    """Grayscale PNG of a tile scaled to the layer's value range, transparent where there is no data."""
+    low, high = store.metadata["min"], store.metadata["max"]
+    span = (high - low) or 1.0
+    valid = np.isfinite(tile)
+    gray = np.clip((np.nan_to_num(tile, nan=low) - low) / span * 255, 0, 255).astype(np.uint8)
+    alpha = np.where(valid, 255, 0).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(np.dstack([gray, alpha])).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(layer, root=None):
+    """The current version of ``layer``, reloaded when the pointer file moves to a new version."""
+    root = root or raster_root()
+    version = _read_pointer(os.path.join(root, f"{layer}.json"))
+    if version is None:
+        raise RasterError(f"Unknown raster layer {layer}")
+    with _stores_lock:
+        store = _stores.get((root, layer))
+        if store is None or store.metadata["version"] != version:
+            store = _stores[(root, layer)] = RasterStore(os.path.join(root, version))
+        return store
+
+
+def list_layers(root=None):
+    root = root or raster_root()
+    if not os.path.isdir(root):
+        return []
+    layers = sorted(name[:-len(".json")] for name in os.listdir(root) if name.endswith(".json"))
+    return [get_store(layer, root).metadata for layer in layers]
+
+
+# --- Zonal statistics ----------------------------------------------------
+
+def pixel_centers(store, z):
+    west, south, east, north = store.metadata["bounds"]
+    info = store.metadata["levels"][str(z)]
+    lon = west + (np.arange(info["width"]) + 0.5) * (east - west) / info["width"]
+    lat = north - (np.arange(info["height"]) + 0.5) * (north - south) / info["height"]
+    return lat, lon
+
+
+def untiled_level(store, z):
+    info = store.metadata["levels"][str(z)]
+    level = store.level(z)
+    tiles_y, tiles_x, tile, _ = level.shape
+    # (ty, tx, row, col) -> (ty, row, tx, col) -> rows x cols; trimmed to the real size
+    return level.transpose(0, 2, 1, 3).reshape(tiles_y * tile, tiles_x * tile)[:info["height"], :info["width"]]
+
+
+def zonal_mean(store, point_labels, point_lat, point_lon, max_distance_m=5000, max_pixels=4_000_000):
+    """
+    Mean raster value per zone, assigning every pixel to the zone of its nearest labelled point.
+
+    A zone can have several points (e.g. a district and all its barrio
+    points), which approximates its shape much better than a single
+    centroid. Runs on the finest level with at most ``max_pixels`` pixels;
+    pixels farther than ``max_distance_m`` from every point are ignored.
+
+    Returns:
+        list[dict]: zone, mean and number of pixels.
+    """
+    levels = store.metadata["levels"]
+    z = store.metadata["max_zoom"]
+    while z > 0 and levels[str(z)]["height"] * levels[str(z)]["width"] > max_pixels:
+        z -= 1
+
+    data = untiled_level(store, z)
+    lat, lon = pixel_centers(store, z)
+    grid_lat = np.repeat(lat, lon.size)
+    grid_lon = np.tile(lon, lat.size)
+    values = np.asarray(data, dtype=np.float64).ravel()
+
+    zones, point_zone = np.unique(np.asarray(point_labels), return_inverse=True)
+    point, distance = nearest(grid_lat, grid_lon, point_lat, point_lon)
+    keep = np.isfinite(values) & (distance <= max_distance_m)
+    zone = point_zone[point[keep]]
+    sums = np.bincount(zone, weights=values[keep], minlength=zones.size)
+    counts = np.bincount(zone, minlength=zones.size)
+
+    return [
+        {"zone": str(name), "mean": float(sums[i] / counts[i]) if counts[i] else None, "pixels": int(counts[i])}
+        for i, name in enumerate(zones)
+    ]
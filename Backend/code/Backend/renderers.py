@@ -0,0 +1,42 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to DRF's json.dumps
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    The output is byte-for-byte what DRF's renderer produces for the plain
+    str/int/float/bool payloads of the list endpoints: compact separators,
+    UTF-8 instead of \\u escapes, and U+2028/U+2029 escaped as DRF does.
+    Indented (browsable) output still goes through DRF.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=self.encoder_class().default)
+        # Valid JSON but not valid JavaScript; DRF escapes them for the same reason
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+        return ret
+
+
+class FirstRendererNegotiation(DefaultContentNegotiation):
+    """
+    Always picks the view's first renderer, leaving ``?format=`` to the view.
+
+    For views that build their own (non-JSON) response and take the output
+    encoding from ``?format=``, which DRF would otherwise try to match
+    against a renderer and answer with a 404.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
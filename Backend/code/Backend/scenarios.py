@@ -0,0 +1,248 @@
+import itertools
+import math
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from .center_snapshot import current_snapshot
+from .geo import GridIndex, project_to_meters
+from .models import BarrioPopulation, MedicalCenter
+
+DEFAULT_COVERAGE_RADIUS_M = 1500.0
+# Scenarios live in the worker's memory; keep only the most recently used ones
+MAX_SCENARIOS = 32
+
+
+class ScenarioError(Exception):
+    pass
+
+
+class Scenario:
+    """
+    What-if state: nearest-facility distance for every demand point, kept up to date incrementally.
+
+    Facilities are the existing centers plus editable sites. Adding a site
+    only revisits the demand points the spatial index finds closer to it
+    than their current nearest facility; removing one only revisits the
+    points it was serving. Covered population and mean distance are kept
+    as running sums, so every edit costs O(affected points).
+    """
+
+    def __init__(self, demand_lat, demand_lon, weights, facility_lat, facility_lon, sites=(),
+                 coverage_radius_m=DEFAULT_COVERAGE_RADIUS_M):
+        self.coverage_radius_m = float(coverage_radius_m)
+        if not math.isfinite(self.coverage_radius_m) or self.coverage_radius_m <= 0:
+            raise ScenarioError("coverage_radius_m must be a positive number")
+        self.origin_lat = float(np.mean(demand_lat))
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.total_weight = float(self.weights.sum())
+
+        dx, dy = project_to_meters(demand_lat, demand_lon, self.origin_lat)
+        self.demand_index = GridIndex(dx, dy)
+
+        fx, fy = project_to_meters(facility_lat, facility_lon, self.origin_lat)
+        self.facility_x = list(fx)
+        self.facility_y = list(fy)
+        self.active = [True] * len(self.facility_x)
+        self.sites = {}
+        self._site_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        self.best_distance, self.best_facility = self._nearest_active(np.arange(dx.size))
+        self._recompute_sums()
+        for site in sites:
+            self.add_site(site["latitude"], site["longitude"], site.get("site_id"))
+
+    # --- running metrics -------------------------------------------------
+
+    def _covered(self, distances):
+        return distances <= self.coverage_radius_m
+
+    def _recompute_sums(self):
+        finite = np.isfinite(self.best_distance)
+        self.distance_sum = float(np.dot(self.weights[finite], self.best_distance[finite]))
+        self.served_weight = float(self.weights[finite].sum())
+        self.covered_weight = float(self.weights[self._covered(self.best_distance)].sum())
+
+    def _update(self, points, distances, facilities):
+        old = self.best_distance[points]
+        w = self.weights[points]
+        old_finite, new_finite = np.isfinite(old), np.isfinite(distances)
+        self.distance_sum += float(np.dot(w[new_finite], distances[new_finite]) - np.dot(w[old_finite], old[old_finite]))
+        self.served_weight += float(w[new_finite].sum() - w[old_finite].sum())
+        self.covered_weight += float(w[self._covered(distances)].sum() - w[self._covered(old)].sum())
+        self.best_distance[points] = distances
+        self.best_facility[points] = facilities
+
+    def metrics(self):
+        return {
+            "covered_population": self.covered_weight,
+            "covered_share": self.covered_weight / self.total_weight if self.total_weight else 0.0,
+            "mean_distance_m": self.distance_sum / self.served_weight if self.served_weight else None,
+        }
+
+    # --- nearest-facility maintenance ------------------------------------
+
+    def _nearest_active(self, points):
+        """Nearest active facility and its distance for ``points``, searched from scratch."""
+        active = np.flatnonzero(self.active)
+        if active.size == 0:
+            return np.full(points.size, np.inf), np.full(points.size, -1, dtype=np.int64)
+
+        fx = np.asarray(self.facility_x)[active]
+        fy = np.asarray(self.facility_y)[active]
+        px, py = self.demand_index.x[points], self.demand_index.y[points]
+        nearest = np.empty(points.size, dtype=np.int64)
+        block = max(1, 4_000_000 // active.size)
+        for start in range(0, points.size, block):
+            stop = start + block
+            d2 = (px[start:stop, None] - fx[None, :]) ** 2 + (py[start:stop, None] - fy[None, :]) ** 2
+            nearest[start:stop] = np.argmin(d2, axis=1)
+        return np.hypot(px - fx[nearest], py - fy[nearest]), active[nearest]
+
+    def _insert_facility(self, x, y):
+        facility = len(self.facility_x)
+        self.facility_x.append(x)
+        self.facility_y.append(y)
+        self.active.append(True)
+
+        served = np.isfinite(self.best_distance)
+        reach = float(self.best_distance[served].max()) if served.all() and served.size else np.inf
+        if np.isfinite(reach):
+            candidates = self.demand_index.within(x, y, reach)
+        else:
+            candidates = np.arange(self.best_distance.size)
+        distances = np.hypot(self.demand_index.x[candidates] - x, self.demand_index.y[candidates] - y)
+        closer = distances < self.best_distance[candidates]
+        affected = candidates[closer]
+        self._update(affected, distances[closer], np.full(affected.size, facility))
+        return facility, affected.size
+
+    def _drop_facility(self, facility):
+        self.active[facility] = False
+        affected = np.flatnonzero(self.best_facility == facility)
+        self._update(affected, *self._nearest_active(affected))
+        return affected.size
+
+    # --- public edits ----------------------------------------------------
+
+    def _site(self, site_id):
+        try:
+            return self.sites[site_id]
+        except KeyError:
+            raise ScenarioError(f"Unknown site {site_id}")
+
+    def _edit(self, apply):
+        with self._lock:
+            before = self.metrics()
+            started = time.perf_counter()
+            site_id, affected = apply()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            after = self.metrics()
+
+        result = {"site_id": site_id, "affected_demand_points": int(affected), "elapsed_ms": elapsed_ms}
+        result.update(after)
+        result["covered_population_delta"] = after["covered_population"] - before["covered_population"]
+        if after["mean_distance_m"] is not None and before["mean_distance_m"] is not None:
+            result["mean_distance_delta_m"] = after["mean_distance_m"] - before["mean_distance_m"]
+        else:
+            result["mean_distance_delta_m"] = None
+        return result
+
+    def add_site(self, latitude, longitude, site_id=None):
+        def apply():
+            x, y = project_to_meters(latitude, longitude, self.origin_lat)
+            facility, affected = self._insert_facility(float(x), float(y))
+            new_id = site_id if site_id is not None else f"new-{next(self._site_ids)}"
+            self.sites[new_id] = {"facility": facility, "latitude": float(latitude), "longitude": float(longitude)}
+            return new_id, affected
+        return self._edit(apply)
+
+    def move_site(self, site_id, latitude, longitude):
+        def apply():
+            site = self._site(site_id)
+            affected = self._drop_facility(site["facility"])
+            x, y = project_to_meters(latitude, longitude, self.origin_lat)
+            facility, added = self._insert_facility(float(x), float(y))
+            site.update(facility=facility, latitude=float(latitude), longitude=float(longitude))
+            return site_id, affected + added
+        return self._edit(apply)
+
+    def remove_site(self, site_id):
+        def apply():
+            site = self._site(site_id)
+            affected = self._drop_facility(site["facility"])
+            del self.sites[site_id]
+            return site_id, affected
+        return self._edit(apply)
+
+    def describe(self):
+        sites = [{"site_id": site_id, "latitude": s["latitude"], "longitude": s["longitude"]}
+                 for site_id, s in self.sites.items()]
+        return {"coverage_radius_m": self.coverage_radius_m, "demand_points": int(self.weights.size),
+                "sites": sites, **self.metrics()}
+
+
+def build_scenario(coverage_radius_m=DEFAULT_COVERAGE_RADIUS_M, type_of_center=None):
+    """
+    Baseline scenario from the barrio demand points, the existing centers and the current proposals.
+
+    Proposed hospitals become editable sites keyed by their MedicalCenter id.
+    """
+    latest_year = BarrioPopulation.objects.order_by("-year").values_list("year", flat=True).first()
+    demand = list(BarrioPopulation.objects.filter(year=latest_year, latitude__isnull=False, population__gt=0)
+                  .values_list("latitude", "longitude", "population"))
+    if not demand:
+        raise ScenarioError("No barrio demand points available; run download_db first")
+
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        table = snapshot.table
+        rows = snapshot.select(is_suggested=False)
+        if type_of_center:
+            rows = snapshot.where(rows, "type_of_center", type_of_center)
+        facilities = np.column_stack([table["latitude"][rows], table["longitude"][rows]])
+        suggested = snapshot.select(is_suggested=True)
+        proposals = zip(table["id"][suggested].tolist(), table["latitude"][suggested].tolist(),
+                        table["longitude"][suggested].tolist())
+    else:
+        existing = MedicalCenter.objects.filter(is_suggested=False)
+        if type_of_center:
+            existing = existing.filter(type_of_center=type_of_center)
+        facilities = np.array(list(existing.values_list("latitude", "longitude")), dtype=np.float64).reshape(-1, 2)
+        proposals = MedicalCenter.objects.filter(is_suggested=True).values_list("id", "latitude", "longitude")
+
+    demand = np.array(demand, dtype=np.float64)
+    return Scenario(
+        demand[:, 0], demand[:, 1], demand[:, 2],
+        facilities[:, 0], facilities[:, 1],
+        sites=[{"site_id": str(pk), "latitude": lat, "longitude": lon} for pk, lat, lon in proposals],
+        coverage_radius_m=coverage_radius_m,
+    )
+
+
+_scenarios = OrderedDict()
+_registry_lock = threading.Lock()
+
+
+def create_scenario(**kwargs):
+    scenario = build_scenario(**kwargs)
+    with _registry_lock:
+        # Random, so ids from other workers or before a restart never point at this worker's scenarios
+        scenario_id = uuid.uuid4().hex
+        _scenarios[scenario_id] = scenario
+        while len(_scenarios) > MAX_SCENARIOS:
+            _scenarios.popitem(last=False)
+    return scenario_id, scenario
+
+
+def get_scenario(scenario_id):
+    with _registry_lock:
+        scenario = _scenarios.get(scenario_id)
+        if scenario is None:
+            raise ScenarioError(f"Unknown scenario {scenario_id}")
+        _scenarios.move_to_end(scenario_id)
+        return scenario
@@ -1,7 +1,41 @@
 from rest_framework import serializers
-from .models import MedicalCenter
+from .models import MedicalCenter, DistrictAccessibility
 
 class MedicalCenterSerializer(serializers.ModelSerializer):
     class Meta:
         model = MedicalCenter
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+# Keys (in order) of MedicalCenterSerializer output, shared by the fast paths below and the center snapshot
+MEDICAL_CENTER_FIELDS = ("id", "type_of_center", "accesibility", "name", "city", "city_district", "latitude",
+                         "longitude", "population_in_district", "street", "is_suggested")
+
+def parse_fields(value):
+    """
+    Fields requested with ``?fields=a,b``, in serializer order; all of them when ``value`` is empty.
+
+    Raises:
+        ValueError: If a requested field does not exist.
+    """
+    if not value:
+        return MEDICAL_CENTER_FIELDS
+    requested = {field.strip() for field in value.split(",") if field.strip()}
+    unknown = requested.difference(MEDICAL_CENTER_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(field for field in MEDICAL_CENTER_FIELDS if field in requested)
+
+def medical_center_rows(queryset, fields=MEDICAL_CENTER_FIELDS):
+    """
+    Same data as ``MedicalCenterSerializer(queryset, many=True).data``, built from ``values_list()`` tuples.
+
+    Every field is a plain column whose DB value already is its JSON value,
+    so the per-field DRF machinery can be skipped entirely. Only ``fields``
+    are selected from the database.
+    """
+    return [dict(zip(fields, row)) for row in queryset.values_list(*fields)]
+
+class DistrictAccessibilitySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DistrictAccessibility
+        fields = '__all__'
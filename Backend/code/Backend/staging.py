@@ -0,0 +1,112 @@
+import glob
+import hashlib
+import io
+import os
+
+import chardet
+import polars as pl
+
+# Bump when a schema below changes, so files staged with the old one are not reused
+STAGING_FORMAT = 1
+
+# datos.madrid.es "atención médica": coordinates and the key are numbers, codes stay text ("01")
+HEALTH_CENTER_SCHEMA = {
+    "PK": pl.Int64, "NOMBRE": pl.Utf8, "DESCRIPCION-ENTIDAD": pl.Utf8, "HORARIO": pl.Utf8,
+    "EQUIPAMIENTO": pl.Utf8, "TRANSPORTE": pl.Utf8, "DESCRIPCION": pl.Utf8, "ACCESIBILIDAD": pl.Utf8,
+    "CONTENT-URL": pl.Utf8, "NOMBRE-VIA": pl.Utf8, "CLASE-VIAL": pl.Utf8, "TIPO-NUM": pl.Utf8,
+    "NUM": pl.Utf8, "PLANTA": pl.Utf8, "PUERTA": pl.Utf8, "ESCALERAS": pl.Utf8, "ORIENTACION": pl.Utf8,
+    "LOCALIDAD": pl.Utf8, "PROVINCIA": pl.Utf8, "CODIGO-POSTAL": pl.Utf8, "COD-BARRIO": pl.Utf8,
+    "BARRIO": pl.Utf8, "COD-DISTRITO": pl.Utf8, "DISTRITO": pl.Utf8, "COORDENADA-X": pl.Float64,
+    "COORDENADA-Y": pl.Float64, "LATITUD": pl.Float64, "LONGITUD": pl.Float64, "TELEFONO": pl.Utf8,
+    "FAX": pl.Utf8, "EMAIL": pl.Utf8, "TIPO": pl.Utf8,
+}
+
+# datos.madrid.es "población por distrito y barrio"
+POPULATION_SCHEMA = {
+    "fecha": pl.Utf8, "cod_municipio": pl.Utf8, "municipio": pl.Utf8, "cod_distrito": pl.Utf8,
+    "distrito": pl.Utf8, "cod_barrio": pl.Utf8, "barrio": pl.Utf8, "num_personas": pl.Float64,
+    "num_personas_hombres": pl.Float64, "num_personas_mujeres": pl.Float64,
+}
+
+SOURCE_SCHEMAS = {
+    "health_centers": HEALTH_CENTER_SCHEMA,
+    "population": POPULATION_SCHEMA,
+}
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def utf8_source(raw):
+    """The bytes of a raw CSV as UTF-8: unchanged when they already are, else re-encoded from what chardet detects."""
+    try:
+        raw.decode("utf-8")
+        return raw
+    except UnicodeDecodeError:
+        encoding = chardet.detect(raw)["encoding"] or "latin-1"
+        print(f"Detected encoding: {encoding}")
+        return raw.decode(encoding, errors="replace").encode("utf-8")
+
+
+def parse_source(path, source):
+    """
+    Reads a raw CSV into exactly the columns and types of ``SOURCE_SCHEMAS[source]``.
+
+    Every column is read as text (no inference pass) and then cast; values
+    that do not parse become null, columns missing from the file are null
+    and extra columns are dropped.
+    """
+    schema = SOURCE_SCHEMAS[source]
+    with open(path, "rb") as f:
+        raw = utf8_source(f.read())
+    df = pl.read_csv(io.BytesIO(raw), separator=";", infer_schema=False)
+    df = df.rename({column: column.strip() for column in df.columns})
+
+    def typed(column, dtype):
+        if column not in df.columns:
+            return pl.lit(None, dtype=dtype)
+        if dtype == pl.Utf8:
+            return pl.col(column)
+        return pl.col(column).str.strip_chars().cast(dtype, strict=False)
+
+    return df.select(typed(column, dtype).alias(column) for column, dtype in schema.items())
+
+
+def stage_source(path, source, root):
+    """
+    Converts a raw source CSV to a typed Parquet file once per distinct content.
+
+    The staged file is named after the source and the SHA-256 of the raw
+    bytes, so a re-downloaded but unchanged file reuses it and a changed
+    one gets a new file (older ones of that source are removed).
+
+    Returns:
+        tuple[str, bool]: The staged Parquet path and whether it already existed.
+    """
+    checksum = file_checksum(path)
+    staged = os.path.join(root, f"{source}-f{STAGING_FORMAT}-{checksum[:32]}.parquet")
+    if os.path.exists(staged):
+        return staged, True
+
+    os.makedirs(root, exist_ok=True)
+    df = parse_source(path, source)
+    tmp = f"{staged}.{os.getpid()}.tmp"
+    df.write_parquet(tmp, statistics=True)
+    os.replace(tmp, staged)
+
+    for old in glob.glob(os.path.join(root, f"{source}-*.parquet")):
+        if old != staged:
+            os.remove(old)
+    print(f"Staged {path} as {staged}: {df.height} rows")
+    return staged, False
+
+
+def scan_staged(staged):
+    """Lazy scan of a staged source: only the columns and row groups a query needs are read."""
+    return pl.scan_parquet(staged)
@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models import Count, Max
+
+from .dataset_version import current_dataset_version
+from .models import DatasetSummary, MedicalCenter
+
+# Summarized versions kept: the current one and the one the changes are measured against
+SUMMARY_VERSIONS_KEPT = 2
+
+
+def refresh_summary(version):
+    """
+    Stores the center counts per (is_suggested, district, type) of ``version``, replacing any it had.
+
+    Called in the transaction that creates the version, so the summary
+    always matches the centers it describes. Only the last
+    ``SUMMARY_VERSIONS_KEPT`` summarized versions are kept.
+
+    Returns:
+        int: Number of summary rows written.
+    """
+    groups = (MedicalCenter.objects.values("is_suggested", "city_district", "type_of_center")
+              .annotate(centers=Count("pk"), population=Max("population_in_district"))
+              .order_by())
+    rows = [DatasetSummary(version=version, **group) for group in groups]
+    with transaction.atomic():
+        DatasetSummary.objects.filter(version=version).delete()
+        DatasetSummary.objects.bulk_create(rows, batch_size=1_000)
+        kept = list(DatasetSummary.objects.values_list("version", flat=True).distinct()
+                    .order_by("-version")[:SUMMARY_VERSIONS_KEPT])
+        DatasetSummary.objects.exclude(version__in=kept).delete()
+    return len(rows)
+
+
+def _totals(rows):
+    centers = [row for row in rows if not row["is_suggested"]]
+    by_type, by_district, district_population = {}, {}, {}
+    for row in centers:
+        by_type[row["type_of_center"]] = by_type.get(row["type_of_center"], 0) + row["centers"]
+        by_district[row["city_district"]] = by_district.get(row["city_district"], 0) + row["centers"]
+        district_population[row["city_district"]] = max(district_population.get(row["city_district"], 0),
+                                                         row["population"])
+    total = sum(by_type.values())
+    population = sum(district_population.values())
+    return {
+        "centers": total,
+        "proposals": sum(row["centers"] for row in rows if row["is_suggested"]),
+        "population": population,
+        "population_per_center": round(population / total, 1) if total else None,
+        "by_type": dict(sorted(by_type.items())),
+        "by_district": dict(sorted(by_district.items())),
+    }
+
+
+def dataset_summary():
+    """
+    Headline numbers of the current dataset version and how they moved since the previous summarized one.
+
+    The summary of the current version is computed on the spot when it is
+    missing (a database migrated or restored without one).
+
+    Returns:
+        dict: Counts by type and district, population per center and a
+        ``change`` block (None without an earlier version).
+    """
+    version = current_dataset_version()
+    if not DatasetSummary.objects.filter(version=version).exists():
+        refresh_summary(version)
+
+    fields = ("version", "is_suggested", "city_district", "type_of_center", "centers", "population")
+    rows = list(DatasetSummary.objects.filter(version__lte=version).order_by("-version").values(*fields))
+    current = [row for row in rows if row["version"] == version]
+    previous_version = next((row["version"] for row in rows if row["version"] < version), None)
+
+    summary = {"version": version, "previous_version": previous_version, **_totals(current), "change": None}
+    if previous_version is not None:
+        before = _totals([row for row in rows if row["version"] == previous_version])
+        per_center = (round(summary["population_per_center"] - before["population_per_center"], 1)
+                      if summary["population_per_center"] is not None and before["population_per_center"] is not None
+                      else None)
+        summary["change"] = {
+            "centers": summary["centers"] - before["centers"],
+            "proposals": summary["proposals"] - before["proposals"],
+            "population_per_center": per_center,
+            "by_type": {key: summary["by_type"].get(key, 0) - before["by_type"].get(key, 0)
+                        for key in sorted(summary["by_type"].keys() | before["by_type"].keys())},
+        }
+    return summary
@@ -0,0 +1,286 @@
+import json
+import os
+import numpy as np
+import polars as pl
+
+from .staging import HEALTH_CENTER_SCHEMA, POPULATION_SCHEMA
+
+# Same box the frontend uses for its simulated fallback points
+MADRID_LAT_RANGE = (40.35, 40.50)
+MADRID_LON_RANGE = (-3.80, -3.60)
+
+MADRID_DISTRICTS = [
+    "Centro", "Arganzuela", "Retiro", "Salamanca", "Chamartín", "Tetuán", "Chamberí",
+    "Fuencarral-El Pardo", "Moncloa-Aravaca", "Latina", "Carabanchel", "Usera",
+    "Puente de Vallecas", "Moratalaz", "Ciudad Lineal", "Hortaleza", "Villaverde",
+    "Villa de Vallecas", "Vicálvaro", "San Blas-Canillejas", "Barajas",
+]
+
+# Column layout of the datos.madrid.es "atención médica" CSV
+HEALTH_CENTER_COLUMNS = list(HEALTH_CENTER_SCHEMA)
+
+# Column layout of the datos.madrid.es "población por distrito y barrio" CSV
+POPULATION_COLUMNS = list(POPULATION_SCHEMA)
+
+# Name prefixes the ingestion classifies, plus one it filters out
+CENTER_NAME_PREFIXES = np.array([
+    "Centro de Salud", "CMSc", "Hospital", "Centro de Especialidades", "Centro Deportivo",
+])
+CENTER_NAME_WEIGHTS = np.array([0.55, 0.05, 0.15, 0.15, 0.10])
+
+
+def district_names(n_districts):
+    return [
+        MADRID_DISTRICTS[i] if i < len(MADRID_DISTRICTS) else f"Distrito {i + 1}"
+        for i in range(n_districts)
+    ]
+
+
+def district_grid(n_districts):
+    """Rows and columns of the grid the bounding box is split into, one cell per district."""
+    rows = int(np.floor(np.sqrt(n_districts)))
+    while n_districts % rows:
+        rows -= 1
+    return rows, n_districts // rows
+
+
+def district_of(latitudes, longitudes, n_districts, lat_range=MADRID_LAT_RANGE, lon_range=MADRID_LON_RANGE):
+    """Index of the district cell each coordinate falls into."""
+    rows, cols = district_grid(n_districts)
+    row = ((latitudes - lat_range[0]) / (lat_range[1] - lat_range[0]) * rows).astype(np.int64)
+    col = ((longitudes - lon_range[0]) / (lon_range[1] - lon_range[0]) * cols).astype(np.int64)
+    return np.clip(row, 0, rows - 1) * cols + np.clip(col, 0, cols - 1)
+
+
+def barrio_of(longitudes, district, n_districts, barrios_per_district, lon_range=MADRID_LON_RANGE):
+    """Index (0-based) of the barrio strip each coordinate falls into inside its district cell."""
+    rows, cols = district_grid(n_districts)
+    cell_width = (lon_range[1] - lon_range[0]) / cols
+    offset = (longitudes - lon_range[0]) / cell_width - district % cols
+    return np.clip((offset * barrios_per_district).astype(np.int64), 0, barrios_per_district - 1)
+
+
+def generate_district_boundaries(output_file, n_districts=21, lat_range=MADRID_LAT_RANGE, lon_range=MADRID_LON_RANGE,
+                                 vertices_per_edge=16, jitter=0.0, seed=0):
+    """
+    Writes the synthetic district cells as a GeoJSON FeatureCollection (NOMBRE and COD_DIS properties).
+
+    Every cell side is a polyline of ``vertices_per_edge`` segments; inner
+    sides are shifted sideways by up to ``jitter`` of a cell so the
+    outlines are not plain rectangles. Neighbours share the same polyline,
+    so the polygons still tile the box without gaps or overlaps. With no
+    jitter they match ``district_of`` exactly.
+
+    Returns:
+        str: The path to the written file.
+    """
+    rng = np.random.default_rng(seed)
+    rows, cols = district_grid(n_districts)
+    lats = np.linspace(lat_range[0], lat_range[1], rows + 1)
+    lons = np.linspace(lon_range[0], lon_range[1], cols + 1)
+    steps = np.linspace(0, 1, vertices_per_edge + 1)
+    # Zero at both ends so the corners stay put
+    bump = np.sin(np.pi * steps)
+
+    def side(start, end, inner, cell):
+        points = np.outer(1 - steps, start) + np.outer(steps, end)
+        if inner and jitter:
+            normal = np.array([end[1] - start[1], start[0] - end[0]]) / np.hypot(*(end - start))
+            shift = bump * rng.uniform(-1, 1, steps.size) * jitter * cell
+            points += np.outer(shift, normal)
+        return points.tolist()
+
+    cell = min(lats[1] - lats[0], lons[1] - lons[0])
+    # horizontal[r][c] runs west to east along latitude r, vertical[r][c] south to north along longitude c
+    horizontal = [[side(np.array([lons[c], lats[r]]), np.array([lons[c + 1], lats[r]]), 0 < r < rows, cell)
+                   for c in range(cols)] for r in range(rows + 1)]
+    vertical = [[side(np.array([lons[c], lats[r]]), np.array([lons[c], lats[r + 1]]), 0 < c < cols, cell)
+                 for c in range(cols + 1)] for r in range(rows)]
+
+    names = district_names(n_districts)
+    features = []
+    for r in range(rows):
+        for c in range(cols):
+            ring = (horizontal[r][c][:-1] + vertical[r][c + 1][:-1]
+                    + horizontal[r + 1][c][::-1][:-1] + vertical[r][c][::-1])
+            index = r * cols + c
+            features.append({
+                "type": "Feature",
+                "properties": {"NOMBRE": names[index], "COD_DIS": f"{index + 1:02d}"},
+                "geometry": {"type": "Polygon", "coordinates": [ring]},
+            })
+
+    with open(output_file, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    print(f"Generated {len(features)} synthetic district boundaries: {output_file}")
+    return output_file
+
+
+def generate_health_centers_csv(output_file, rows, n_districts=21, barrios_per_district=6, lat_range=MADRID_LAT_RANGE,
+                                lon_range=MADRID_LON_RANGE, seed=0, chunk_size=500_000, duplicate_share=0.0,
+                                invalid_share=0.0):
+    """
+    Writes a synthetic medical centers CSV with the same layout as the Madrid source.
+
+    Rows are produced in chunks so that generating millions of them keeps
+    memory flat. Like the real source, a ``duplicate_share`` of rows can
+    repeat the previous facility a couple of meters away, and an
+    ``invalid_share`` can have (0, 0) coordinates.
+
+    Returns:
+        str: The path to the written file.
+    """
+    rng = np.random.default_rng(seed)
+    names = np.array(district_names(n_districts))
+
+    with open(output_file, "wb") as f:
+        for start in range(0, rows, chunk_size):
+            size = min(chunk_size, rows - start)
+            pk = np.arange(start, start + size)
+            lat = rng.uniform(lat_range[0], lat_range[1], size)
+            lon = rng.uniform(lon_range[0], lon_range[1], size)
+            prefix = rng.choice(CENTER_NAME_PREFIXES, size, p=CENTER_NAME_WEIGHTS)
+            name_id = pk.copy()
+
+            duplicate = np.flatnonzero(rng.random(size) < duplicate_share)
+            duplicate = duplicate[duplicate > 0]
+            source = duplicate - 1
+            lat[duplicate] = lat[source] + rng.normal(0, 1e-5, duplicate.size)
+            lon[duplicate] = lon[source] + rng.normal(0, 1e-5, duplicate.size)
+            prefix[duplicate] = prefix[source]
+            name_id[duplicate] = name_id[source]
+
+            district = district_of(lat, lon, n_districts, lat_range, lon_range)
+            barrio = barrio_of(lon, district, n_districts, barrios_per_district, lon_range) + 1
+            invalid = rng.random(size) < invalid_share
+            lat[invalid] = 0.0
+            lon[invalid] = 0.0
+            number = rng.integers(1, 200, size).astype(str)
+            empty = np.full(size, "")
+
+            chunk = pl.DataFrame({
+                "PK": pk,
+                "NOMBRE": np.char.add(np.char.add(prefix, " Sintético "), name_id.astype(str)),
+                "DESCRIPCION-ENTIDAD": empty,
+                "HORARIO": empty,
+                "EQUIPAMIENTO": empty,
+                "TRANSPORTE": np.char.add("Metro: Línea ", rng.integers(1, 13, size).astype(str)),
+                "DESCRIPCION": empty,
+                "ACCESIBILIDAD": rng.integers(0, 3, size).astype(str),
+                "CONTENT-URL": empty,
+                "NOMBRE-VIA": np.char.add("SINTETICA ", (pk % 997).astype(str)),
+                "CLASE-VIAL": np.full(size, "CALLE"),
+                "TIPO-NUM": np.full(size, "NUM"),
+                "NUM": number,
+                "PLANTA": empty,
+                "PUERTA": empty,
+                "ESCALERAS": empty,
+                "ORIENTACION": empty,
+                "LOCALIDAD": np.full(size, "MADRID"),
+                "PROVINCIA": np.full(size, "MADRID"),
+                "CODIGO-POSTAL": (28001 + district).astype(str),
+                "COD-BARRIO": np.char.add((district + 1).astype(str), barrio.astype(str)),
+                "BARRIO": np.char.add(np.char.add(names[district], " Barrio "), barrio.astype(str)),
+                "COD-DISTRITO": (district + 1).astype(str),
+                "DISTRITO": names[district],
+                "COORDENADA-X": empty,
+                "COORDENADA-Y": empty,
+                "LATITUD": lat,
+                "LONGITUD": lon,
+                "TELEFONO": empty,
+                "FAX": empty,
+                "EMAIL": empty,
+                "TIPO": empty,
+            })
+            chunk.write_csv(f, separator=";", include_header=(start == 0))
+
+    print(f"Generated {rows} synthetic medical centers: {output_file}")
+    return output_file
+
+
+def generate_population_csv(output_file, n_districts=21, barrios_per_district=6, years=(2024,), seed=0):
+    """
+    Writes a synthetic population CSV with the same layout as the Madrid source.
+
+    For every year there is one city total row ("Todos"), one total row per
+    district (``cod_barrio == cod_distrito``) and one row per barrio.
+
+    Returns:
+        str: The path to the written file.
+    """
+    rng = np.random.default_rng(seed)
+    names = district_names(n_districts)
+    records = []
+
+    for year in years:
+        fecha = f"1 de enero de {year}"
+        barrio_people = rng.integers(5_000, 60_000, (n_districts, barrios_per_district))
+        barrio_men = (barrio_people * rng.uniform(0.45, 0.5, barrio_people.shape)).astype(np.int64)
+
+        records.append((fecha, "079", "Madrid", "Todos", "Todos", "Todos", "Todos",
+                        int(barrio_people.sum()), int(barrio_men.sum()), int((barrio_people - barrio_men).sum())))
+        for d in range(n_districts):
+            cod_distrito = str(d + 1)
+            people = int(barrio_people[d].sum())
+            men = int(barrio_men[d].sum())
+            records.append((fecha, "079", "Madrid", cod_distrito, names[d], cod_distrito, names[d],
+                            people, men, people - men))
+            for b in range(barrios_per_district):
+                people = int(barrio_people[d, b])
+                men = int(barrio_men[d, b])
+                records.append((fecha, "079", "Madrid", cod_distrito, names[d], f"{cod_distrito}{b + 1}",
+                                f"{names[d]} Barrio {b + 1}", people, men, people - men))
+
+    pl.DataFrame(records, schema=POPULATION_COLUMNS, orient="row").write_csv(output_file, separator=";")
+
+    print(f"Generated {len(records)} synthetic population rows: {output_file}")
+    return output_file
+
+
+def generate_synthetic_dataset(output_dir, rows, n_districts=21, barrios_per_district=6, years=(2024,), seed=0,
+                               duplicate_share=0.0, invalid_share=0.0):
+    """
+    Writes both synthetic sources into ``output_dir``.
+
+    Returns:
+        tuple[str, str]: Paths to the medical centers and population files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    health_center_file = generate_health_centers_csv(
+        os.path.join(output_dir, "health_center.csv"), rows, n_districts=n_districts,
+        barrios_per_district=barrios_per_district, seed=seed, duplicate_share=duplicate_share,
+        invalid_share=invalid_share)
+    population_file = generate_population_csv(
+        os.path.join(output_dir, "population.csv"), n_districts=n_districts,
+        barrios_per_district=barrios_per_district, years=years, seed=seed)
+    return health_center_file, population_file
+
+
+def generate_raster_fixture(output_file, layer="solar", width=600, height=450, lat_range=MADRID_LAT_RANGE,
+                            lon_range=MADRID_LON_RANGE, seed=0):
+    """
+    Writes a synthetic single-band float32 GeoTIFF covering the bounding box.
+
+    "solar" grows smoothly towards the south-west; any other layer gets
+    smooth noise, closer to what a wind-speed field looks like.
+
+    Returns:
+        str: The path to the written file.
+    """
+    from PIL import Image, TiffImagePlugin
+
+    rng = np.random.default_rng(seed)
+    rows, cols = np.mgrid[0:height, 0:width].astype(np.float32)
+    if layer == "solar":
+        data = 1600 + 150 * (rows / height) + 50 * (1 - cols / width) + rng.normal(0, 5, (height, width))
+    else:
+        coarse = rng.uniform(2, 8, (height // 50 + 2, width // 50 + 2))
+        data = coarse[(rows // 50).astype(int), (cols // 50).astype(int)] + rng.normal(0, 0.2, (height, width))
+
+    tags = TiffImagePlugin.ImageFileDirectory_v2()
+    tags[33550] = ((lon_range[1] - lon_range[0]) / width, (lat_range[1] - lat_range[0]) / height, 0.0)
+    tags[33922] = (0.0, 0.0, 0.0, lon_range[0], lat_range[1], 0.0)
+    Image.fromarray(data.astype(np.float32)).save(output_file, tiffinfo=tags)
+
+    print(f"Generated {height}x{width} synthetic {layer} raster: {output_file}")
+    return output_file
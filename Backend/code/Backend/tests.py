@@ -1,3 +1,1144 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import OperationalError, close_old_connections, connection
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from .accessibility import compute_district_accessibility
+from .barrio_population import transform_barrio_population, update_barrio_population
+from .benchmarks import benchmark_serialization, compare_to_baseline, run_benchmarks
+from .models import (
+    BarrioPopulation,
+    CenterChange,
+    DatasetSummary,
+    DatasetVersion,
+    DistrictAccessibility,
+    MedicalCenter,
+)
+from .proposed_hospitals_algorithm import insert_proposed_hospitals_into_object
+from .proposed_hospitals_database import insert_hospitals_into_object
+from .rasters import get_store, ingest_raster, raster_root, read_raster
+from .renderers import FastJSONRenderer
+from .scenarios import Scenario
+from .serializers import MEDICAL_CENTER_FIELDS, MedicalCenterSerializer, medical_center_rows
+from .center_snapshot import current_snapshot, write_center_snapshot
+from .center_tables import TableSwapError, build_staging
+from .changes import (
+    CENTER_FIELDS,
+    changes_since,
+    compact_change_log,
+    latest_change_seq,
+    rollback_centers,
+    sync_centers,
+)
+from .compression import negotiate_encoding
+from .export import export_centers, export_chunks
+from .coverage import CoverageError, CoverageSets, candidate_grid, maximal_covering
+from .events import DatasetEventsMiddleware, dataset_event
+from .metrics import MetricsMiddleware
+from .profiling import PipelineProfile, measure
+from .views import get_medical_centers
+from .population_store import get_population_store, store_root, write_population_barrios
+from .heatmap import gaussian_blur
+from .staging import HEALTH_CENTER_SCHEMA, POPULATION_SCHEMA, scan_staged, stage_source
+from .geo import distance_matrix, haversine_m, one_to_many, vincenty_m, within_radius
+from .validation import VALID_BBOX, validate_centers
+from .synthetic_data import (
+    MADRID_LAT_RANGE,
+    MADRID_LON_RANGE,
+    district_names,
+    district_of,
+    generate_district_boundaries,
+    generate_health_centers_csv,
+    generate_population_csv,
+    generate_raster_fixture,
+    generate_synthetic_dataset,
+)
+from .dataset_version import bump_dataset_version, current_dataset_version
+from .districts import STRtree, assign_districts, load_district_boundaries
+from .db_snapshot import DbSnapshotError, SNAPSHOT_MODELS, restore_db_snapshot, write_db_snapshot
+from .vector_tiles import EXTENT, encode_layer, get_tile, layer_features, seed_tile_cache, tile_path
+
+
+class StorageTestCase(TestCase):
+    """
+    Points the on-disk stores (rasters, snapshots, tile cache, population, staging) at a per-test directory.
+
+    Dataset versions restart with the test database, so files left by one
+    test would otherwise look current to the next.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = self.settings(
+            RASTER_ROOT=os.path.join(self.tmp.name, "rasters"),
+            CENTER_SNAPSHOT_ROOT=os.path.join(self.tmp.name, "snapshots"),
+            TILE_CACHE_ROOT=os.path.join(self.tmp.name, "tile_cache"),
+            POPULATION_ROOT=os.path.join(self.tmp.name, "population"),
+            STAGING_ROOT=os.path.join(self.tmp.name, "staging"),
+            DB_SNAPSHOT_ROOT=os.path.join(self.tmp.name, "db_snapshot"),
+            # Only tests that write a boundary file get polygon district assignment
+            DISTRICT_BOUNDARIES_FILE=os.path.join(self.tmp.name, "districts.geojson"),
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class SyntheticDatasetTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.health_center_file, self.population_file = generate_synthetic_dataset(self.tmp.name, 1000)
+
+    def test_ingestion_reads_synthetic_sources(self):
+        insert_hospitals_into_object(self.health_center_file, self.population_file)
+
+        centers = MedicalCenter.objects.all()
+        self.assertGreater(centers.count(), 0)
+        self.assertLess(centers.count(), 1000)  # "Centro Deportivo" rows are filtered out
+        self.assertEqual(
+            set(centers.values_list("type_of_center", flat=True).distinct()),
+            {"hospital", "health_center", "clinic"},
+        )
+        self.assertFalse(centers.filter(population_in_district=0).exists())
+
+    def test_benchmark_run_leaves_no_rows_behind(self):
+        results = run_benchmarks(self.health_center_file, self.population_file)
+
+        self.assertEqual(
+            [step["name"] for step in results],
+            ["ingestion", "proposal_algorithm", "get_medical_centers", "get_proposed_medical_centers"],
+        )
+        self.assertFalse(MedicalCenter.objects.exists())
+
+    def test_compare_to_baseline_flags_slower_steps(self):
+        baseline = {"steps": [{"name": "ingestion", "seconds": 1.0, "queries": 10, "peak_rss_mb": 100.0}]}
+        results = [{"name": "ingestion", "seconds": 2.0, "queries": 10, "peak_rss_mb": 100.0}]
+
+        self.assertEqual(len(compare_to_baseline(results, baseline)), 1)
+        self.assertEqual(compare_to_baseline(results, baseline, tolerance=1.5), [])
+
+
+class ProfilingTests(StorageTestCase):
+    def test_stages_record_time_rows_and_memory(self):
+        profile = PipelineProfile()
+        with profile.stage("allocate", rows_in=10) as stage:
+            block = np.ones(64 * 2**20 // 8)
+            stage.rows_out = 5
+        with profile.stage("sleep"):
+            time.sleep(0.02)
+
+        allocate, sleep = profile.stages
+        self.assertEqual((allocate.rows_in, allocate.rows_out), (10, 5))
+        self.assertGreater(allocate.rss_growth_mb, 32)
+        self.assertGreaterEqual(allocate.peak_rss_mb, allocate.rss_growth_mb)
+        self.assertGreaterEqual(sleep.seconds, 0.02)
+        self.assertIs(profile.slowest_stage(), max(profile.stages, key=lambda record: record.seconds))
+        self.assertAlmostEqual(profile.total_seconds, allocate.seconds + sleep.seconds)
+        del block
+
+    def test_measure_counts_queries(self):
+        with measure("count") as result:
+            MedicalCenter.objects.count()
+        self.assertEqual((result["name"], result["queries"]), ("count", 1))
+        self.assertGreater(result["seconds"], 0)
+        self.assertGreater(result["peak_rss_mb"], 0)
+
+    def test_report_and_slowest_trace(self):
+        profile = PipelineProfile(trace=True)
+        with profile.stage("quick"):
+            pass
+        with profile.stage("slow", rows_in=3):
+            time.sleep(0.02)
+
+        table = profile.summary_table().splitlines()
+        self.assertEqual([line.split()[0] for line in table], ["stage", "quick", "slow", "total"])
+        with open(profile.write_report(os.path.join(self.tmp.name, "report.json"))) as f:
+            report = json.load(f)
+        self.assertEqual([stage["stage"] for stage in report["stages"]], ["quick", "slow"])
+        self.assertEqual(report["stages"][1]["rows_in"], 3)
+
+        trace = os.path.join(self.tmp.name, "slowest.prof")
+        self.assertEqual(profile.dump_slowest_trace(trace).name, "slow")
+        self.assertGreater(pstats.Stats(trace).total_calls, 0)
+        self.assertIsNone(PipelineProfile().dump_slowest_trace(trace))
+
+    def test_download_db_profile_without_stages(self):
+        output = io.StringIO()
+        with mock.patch("Backend.management.commands.download_db.insert_hospitals_into_object",
+                        return_value=PipelineProfile(trace=True)):
+            call_command("download_db", "--profile", "--seed-tiles-max-zoom", "-1", "--no-db-snapshot",
+                         "--report", os.path.join(self.tmp.name, "report.json"),
+                         "--profile-output", os.path.join(self.tmp.name, "slowest.prof"), stdout=output)
+        self.assertIn("no cProfile trace was written", output.getvalue())
+
+
+class MetricsMiddlewareTests(StorageTestCase):
+    def test_api_views_are_recorded_and_exposed(self):
+        self.client.get("/api/get_medical_centers")
+
+        body = self.client.get("/metrics").content.decode()
+        self.assertIn('backend_request_duration_seconds_count{view="get_medical_centers"}', body)
+        self.assertIn('backend_db_queries_bucket{view="get_medical_centers",le="1"}', body)
+
+    def test_server_timing_header_is_opt_in(self):
+        self.assertNotIn("Server-Timing", self.client.get("/api/get_medical_centers"))
+
+        with self.settings(SERVER_TIMING_HEADER=True):
+            response = self.client.get("/api/get_medical_centers")
+        self.assertIn("db;dur=", response["Server-Timing"])
+
+    def test_views_are_left_to_django_to_call(self):
+        view = mock.Mock(cls=get_medical_centers)
+        request = RequestFactory().get("/api/get_medical_centers")
+        self.assertIsNone(MetricsMiddleware(lambda request: None).process_view(request, view, (), {}))
+        view.assert_not_called()
+
+
+class BarrioPopulationTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.health_center_file, self.population_file = generate_synthetic_dataset(
+            self.tmp.name, 2000, barrios_per_district=4)
+
+    def test_barrios_are_ingested_with_coordinates(self):
+        insert_hospitals_into_object(self.health_center_file, self.population_file)
+
+        self.assertEqual(BarrioPopulation.objects.count(), 21 * 4)
+        self.assertFalse(BarrioPopulation.objects.filter(latitude__isnull=True).exists())
+
+    def test_reingestion_only_touches_changed_barrios(self):
+        df_centers = pl.read_csv(self.health_center_file, separator=";")
+        df_population = pl.read_csv(self.population_file, separator=";", infer_schema_length=None)
+        barrios = transform_barrio_population(df_centers, df_population)
+        update_barrio_population(barrios)
+
+        changed = barrios.with_columns(
+            pl.when(pl.col("cod_barrio") == "11").then(pl.col("population") + 1).otherwise(pl.col("population"))
+            .alias("population")
+        ).filter(pl.col("cod_barrio") != "12")
+        counts = update_barrio_population(changed)
+
+        self.assertEqual(counts, {"created": 0, "updated": 1, "deleted": 1, "unchanged": 21 * 4 - 2})
+
+    def test_proposals_can_use_barrio_demand(self):
+        insert_hospitals_into_object(self.health_center_file, self.population_file)
+        insert_proposed_hospitals_into_object(demand="barrio")
+
+        self.assertEqual(MedicalCenter.objects.filter(is_suggested=True).count(), 21)
+
+
+class AccessibilityTests(StorageTestCase):
+    def test_weighted_distances_per_district_and_type(self):
+        demand = pl.DataFrame({
+            "city_district": ["Centro", "Centro", "Retiro"],
+            "population": [100, 900, 500],
+            "latitude": [40.0, 40.01, 40.0],
+            "longitude": [-3.7, -3.7, -3.6],
+        })
+        centers = pl.DataFrame({
+            "type_of_center": ["hospital", "clinic"],
+            "latitude": [40.0, 40.01],
+            "longitude": [-3.7, -3.6],
+        })
+
+        rows = {(r["city_district"], r["type_of_center"]): r for r in compute_district_accessibility(demand, centers)}
+
+        centro = rows[("Centro", "hospital")]
+        self.assertAlmostEqual(centro["mean_distance_m"], 0.9 * 1111.95, delta=1)
+        self.assertAlmostEqual(centro["p90_distance_m"], 1111.95, delta=1)
+        self.assertEqual(centro["population"], 1000)
+        self.assertNotIn(("Centro", "health_center"), rows)
+
+    def test_ingestion_materializes_accessibility(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            insert_hospitals_into_object(*generate_synthetic_dataset(tmp, 1000))
+
+        response = self.client.get("/api/get_accessibility")
+        self.assertEqual(len(response.json()), 21 * 3)
+
+
+class ScenarioTests(StorageTestCase):
+    def random_scenario(self, n_demand=5000, n_facilities=50, seed=1):
+        rng = np.random.default_rng(seed)
+        demand_lat, demand_lon = rng.uniform(40.35, 40.5, n_demand), rng.uniform(-3.8, -3.6, n_demand)
+        facility_lat, facility_lon = rng.uniform(40.35, 40.5, n_facilities), rng.uniform(-3.8, -3.6, n_facilities)
+        return rng, Scenario(demand_lat, demand_lon, rng.integers(1, 100, n_demand),
+                             facility_lat, facility_lon, coverage_radius_m=800)
+
+    def test_incremental_edits_match_a_full_recompute(self):
+        rng, scenario = self.random_scenario()
+        site_ids = [scenario.add_site(40.42, -3.70)["site_id"], scenario.add_site(40.40, -3.65)["site_id"]]
+        scenario.move_site(site_ids[0], 40.45, -3.75)
+        scenario.remove_site(site_ids[1])
+        for _ in range(20):
+            scenario.add_site(rng.uniform(40.35, 40.5), rng.uniform(-3.8, -3.6))
+
+        incremental = scenario.metrics()
+        distances, _ = scenario._nearest_active(np.arange(scenario.weights.size))
+        np.testing.assert_allclose(scenario.best_distance, distances)
+        scenario._recompute_sums()
+        for key, value in scenario.metrics().items():
+            self.assertAlmostEqual(incremental[key], value, places=3)
+
+    def test_adding_a_site_only_touches_nearby_demand(self):
+        _, scenario = self.random_scenario()
+        result = scenario.add_site(40.42, -3.70)
+
+        self.assertLess(result["affected_demand_points"], 5000 / 10)
+        self.assertGreaterEqual(result["covered_population_delta"], 0)
+        self.assertLessEqual(result["mean_distance_delta_m"], 0)
+
+    def test_scenario_api(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            insert_hospitals_into_object(*generate_synthetic_dataset(tmp, 500))
+
+        scenario = self.client.post("/api/scenarios", {"coverage_radius_m": 1000}, content_type="application/json").json()
+        self.assertRegex(scenario["scenario_id"], r"^[0-9a-f]{32}$")
+        for radius in (0, -5, "NaN", "inf"):
+            response = self.client.post("/api/scenarios", {"coverage_radius_m": radius}, content_type="application/json")
+            self.assertEqual(response.status_code, 400, radius)
+        url = f"/api/scenarios/{scenario['scenario_id']}/sites"
+        added = self.client.post(url, {"latitude": 40.42, "longitude": -3.7}, content_type="application/json").json()
+        moved = self.client.put(f"{url}/{added['site_id']}", {"latitude": 40.4, "longitude": -3.65},
+                                content_type="application/json")
+        for body in ({"latitude": 40.4}, {"latitude": "north", "longitude": -3.65},
+                     {"latitude": "NaN", "longitude": -3.65}, {"latitude": 40.4, "longitude": "inf"}):
+            self.assertEqual(self.client.put(f"{url}/{added['site_id']}", body,
+                                             content_type="application/json").status_code, 400, body)
+            self.assertEqual(self.client.post(url, body, content_type="application/json").status_code, 400, body)
+        removed = self.client.delete(f"{url}/{added['site_id']}")
+
+        self.assertEqual(moved.status_code, 200)
+        self.assertAlmostEqual(removed.json()["covered_population"], scenario["covered_population"])
+        self.assertEqual(self.client.delete(f"{url}/{added['site_id']}").status_code, 404)
+
+
+class RasterTests(StorageTestCase):
+    def test_tiles_are_views_into_the_mapped_pyramid(self):
+        path = generate_raster_fixture(os.path.join(self.tmp.name, "solar.tif"), "solar", width=600, height=450)
+        source, _ = read_raster(path)
+        metadata = ingest_raster("solar", path)
+
+        self.assertEqual(metadata["max_zoom"], 2)
+        store = get_store("solar")
+        tile = store.tile(2, 1, 0)
+        self.assertIsInstance(tile.base, np.memmap)
+        np.testing.assert_array_equal(tile[:, :256], source[:256, 256:512])
+        self.assertEqual(store.level(0).shape, (1, 1, 256, 256))
+
+        response = self.client.get("/api/rasters/solar/2/1/0")
+        self.assertEqual(len(response.content), 256 * 256 * 4)
+        self.assertEqual(self.client.get("/api/rasters/solar/2/9/9").status_code, 404)
+
+    def test_previous_version_stays_readable_until_the_next_publish(self):
+        path = generate_raster_fixture(os.path.join(self.tmp.name, "solar.tif"), "solar", width=600, height=450)
+        first = ingest_raster("solar", path)
+        store = get_store("solar")
+        second = ingest_raster("solar", path)
+
+        self.assertEqual(store.level(2).shape[:2], (2, 3))  # mapped lazily, after the swap
+        self.assertEqual(get_store("solar").metadata["version"], second["version"])
+        third = ingest_raster("solar", path)
+        versions = {name for name in os.listdir(raster_root()) if name.startswith("solar-")}
+        self.assertEqual(versions, {second["version"], third["version"]})
+        self.assertNotIn(first["version"], versions)
+
+    def test_netcdf_like_input_is_flipped_north_up(self):
+        lat = np.linspace(40.35, 40.5, 10)
+        path = os.path.join(self.tmp.name, "wind.npz")
+        np.savez(path, lat=lat, lon=np.linspace(-3.8, -3.6, 20), wind_speed=np.repeat(lat[:, None], 20, axis=1))
+
+        data, bounds = read_raster(path)
+
+        self.assertGreater(data[0, 0], data[-1, 0])
+        self.assertGreater(bounds[3], 40.5)
+
+    def test_zonal_mean_per_district(self):
+        ingest_raster("solar", generate_raster_fixture(os.path.join(self.tmp.name, "solar.tif"), "solar"))
+        with tempfile.TemporaryDirectory() as tmp:
+            insert_hospitals_into_object(*generate_synthetic_dataset(tmp, 500))
+
+        districts = self.client.get("/api/rasters/solar/zonal").json()["districts"]
+
+        self.assertEqual(len(districts), 21)
+        self.assertTrue(all(1600 < d["mean_potential"] < 1800 for d in districts))
+
+
+def _center(**fields):
+    defaults = dict(type_of_center="hospital", accesibility="0", name="Center", city="Madrid", city_district="Centro",
+                    latitude=40.4168, longitude=-3.7038, population_in_district=1000, street="Calle Mayor 1")
+    defaults.update(fields)
+    return MedicalCenter.objects.create(**defaults)
+
+
+class VectorTileTests(StorageTestCase):
+    def test_layer_encoding(self):
+        layer = encode_layer("medical_centers", [(7, 10, 20, {"name": "A", "point_count": 1})])
+
+        self.assertEqual(layer[0], 0x1A)  # Tile.layers, length delimited
+        self.assertIn(b"medical_centers", layer)
+        self.assertIn(b"\x78\x02", layer)  # version = 2
+        self.assertIn(b"\x22\x03\x09\x14\x28", layer)  # MoveTo(10, 20) zigzag encoded
+        self.assertTrue(layer.endswith(b"\x28\x80\x20"))  # extent = 4096
+
+    def test_points_in_the_same_cell_are_thinned(self):
+        for i in range(5):
+            _center(name=f"Near {i}", longitude=-3.7038 + i * 1e-6)
+        _center(name="Far", latitude=40.40, longitude=-3.60)
+
+        features = layer_features(10, 501, 386, is_suggested=False)
+
+        self.assertEqual(sorted(f[3]["point_count"] for f in features), [1, 5])
+        self.assertTrue(all(0 <= f[1] <= EXTENT and 0 <= f[2] <= EXTENT for f in features))
+
+    def test_tiles_are_cached_per_dataset_version(self):
+        _center()
+        version, tile = get_tile(10, 501, 386)
+        self.assertTrue(os.path.exists(tile_path(version, 10, 501, 386)))
+
+        _center(name="Proposed", is_suggested=True)
+        self.assertEqual(get_tile(10, 501, 386)[1], tile)
+
+        new_version = bump_dataset_version("test")
+        response = self.client.get("/api/tiles/10/501/386.mvt")
+        self.assertEqual(response["Content-Type"], "application/vnd.mapbox-vector-tile")
+        self.assertIn(b"proposed_sites", response.content)
+        self.assertNotEqual(response.content, tile)
+        response = self.client.get("/api/tiles/10/501/386.mvt", HTTP_ORIGIN="http://localhost:8501")
+        self.assertEqual(response["Access-Control-Allow-Origin"], "http://localhost:8501")
+
+        self.assertGreater(seed_tile_cache(max_zoom=3), 0)
+        self.assertEqual(os.listdir(os.path.join(self.tmp.name, "tile_cache")), [f"v{new_version}"])
+
+
+class CenterSnapshotTests(StorageTestCase):
+    def test_snapshot_serves_the_same_rows_as_the_orm(self):
+        insert_hospitals_into_object(*generate_synthetic_dataset(self.tmp.name, 1000))
+        from_snapshot = self.client.get("/api/get_medical_centers").json()
+        with self.settings(CENTER_SNAPSHOT_ROOT=os.path.join(self.tmp.name, "missing")):
+            self.assertEqual(self.client.get("/api/get_medical_centers").json(), from_snapshot)
+
+        snapshot = current_snapshot()
+        self.assertIsInstance(snapshot.table, np.memmap)
+        self.assertEqual(len(snapshot), MedicalCenter.objects.count())
+
+        inside = snapshot.bbox(-3.75, 40.40, -3.70, 40.45, is_suggested=False)
+        expected = MedicalCenter.objects.filter(
+            is_suggested=False, longitude__gte=-3.75, longitude__lte=-3.70, latitude__gte=40.40, latitude__lte=40.45)
+        self.assertEqual(snapshot.table["id"][inside].tolist(), list(expected.order_by("pk").values_list("pk", flat=True)))
+
+    def test_nearest_lookup_and_version_swap(self):
+        near = _center(name="Near", latitude=40.4170, longitude=-3.7040)
+        _center(name="Far", latitude=40.45, longitude=-3.65)
+        write_center_snapshot(bump_dataset_version("test"))
+
+        response = self.client.get("/api/get_nearest_medical_centers", {"lat": 40.4168, "lon": -3.7038, "k": 1})
+        self.assertEqual([row["id"] for row in response.json()], [near.pk])
+        self.assertLess(response.json()[0]["distance_m"], 50)
+        for k in (0, -1, 1.5, "two"):
+            response = self.client.get("/api/get_nearest_medical_centers", {"lat": 40.4168, "lon": -3.7038, "k": k})
+            self.assertEqual(response.status_code, 400, k)
+
+        bump_dataset_version("test")
+        self.assertIsNone(current_snapshot())
+        self.assertEqual(self.client.get("/api/get_nearest_medical_centers", {"lat": 40.4, "lon": -3.7}).status_code, 503)
+
+
+class FastSerializationTests(StorageTestCase):
+    def test_output_is_byte_identical_to_drf(self):
+        _center(name="Centro de Salud Ñandú \u2028", street="Calle de Alcalá, 1", latitude=40.123456789012)
+        _center(name="Hospital \"Gregorio\"", is_suggested=True)
+        queryset = MedicalCenter.objects.order_by("pk")
+
+        self.assertEqual(MEDICAL_CENTER_FIELDS, tuple(MedicalCenterSerializer().fields))
+        self.assertEqual(
+            FastJSONRenderer().render(medical_center_rows(queryset)),
+            JSONRenderer().render(MedicalCenterSerializer(queryset, many=True).data),
+        )
+
+    def test_benchmark_compares_both_paths(self):
+        result = benchmark_serialization(rows=500)
+
+        self.assertTrue(result["identical"])
+        self.assertEqual([step["name"] for step in result["steps"]],
+                         ["end_to_end_drf", "end_to_end_fast", "fetch_models", "serialize_drf", "fetch_rows",
+                          "serialize_fast"])
+        self.assertGreater(result["speedup"], 1)
+        self.assertFalse(MedicalCenter.objects.exists())
+
+
+class SparseFieldsetTests(StorageTestCase):
+    def test_fields_projection(self):
+        center = _center()
+
+        response = self.client.get("/api/get_medical_centers", {"fields": "longitude,latitude"})
+        self.assertEqual(response.json(), [{"latitude": center.latitude, "longitude": center.longitude}])
+        self.assertEqual(self.client.get("/api/get_medical_centers", {"fields": "latitude,password"}).status_code, 400)
+
+    def test_large_responses_are_compressed(self):
+        for i in range(50):
+            _center(name=f"Center {i}")
+
+        plain = self.client.get("/api/get_medical_centers")
+        compressed = self.client.get("/api/get_medical_centers", HTTP_ACCEPT_ENCODING="gzip")
+        small = self.client.get("/api/get_medical_centers", {"fields": "id"}, HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertEqual(compressed["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertIn("Accept-Encoding", compressed["Vary"])
+        self.assertNotIn("Content-Encoding", small)  # below COMPRESSION_MIN_BYTES
+
+    def test_encoding_negotiation(self):
+        self.assertEqual(negotiate_encoding("deflate, gzip;q=0.5")[0], "gzip")
+        self.assertIsNone(negotiate_encoding("gzip;q=0, identity"))
+        self.assertIsNone(negotiate_encoding(""))
+
+
+class ValidationTests(StorageTestCase):
+    def centers(self, rows):
+        return pl.DataFrame(rows, schema=["name", "type_of_center", "latitude", "longitude", "population_in_district"],
+                            orient="row")
+
+    def test_invalid_and_duplicate_rows_are_rejected(self):
+        df = self.centers([
+            ("Hospital La Paz", "hospital", 40.4810, -3.6870, 1000.0),
+            ("HOSPITAL LA PAZ.", "hospital", 40.48101, -3.68701, 1000.0),  # ~1 m away, same facility
+            ("Hospital La Paz", "clinic", 40.4810, -3.6870, 1000.0),  # other type, kept
+            ("Hospital La Paz", "hospital", 40.4900, -3.6870, 1000.0),  # 1 km away, kept
+            ("Centro de Salud Sol", "health_center", 0.0, 0.0, 1000.0),
+            ("Centro de Salud Alcalá", "health_center", None, -3.70, 1000.0),
+            ("Centro de Salud Alcala", "health_center", 40.42, -3.70, None),
+        ])
+
+        accepted, rejected = validate_centers(df)
+
+        self.assertEqual(accepted.height, 3)
+        self.assertEqual(
+            sorted(rejected["reject_reason"].to_list()),
+            ["duplicate", "missing_coordinates", "missing_population", "out_of_bbox"],
+        )
+
+    def test_duplicates_straddling_a_cell_edge_are_merged(self):
+        # 25 m cells in latitude: 40.4 * 110540 / 25 = 178616.0 exactly, so these sit 5 m either side of an edge
+        edge = 178616 * 25.0 / 110540.0
+        df = self.centers([
+            ("Hospital La Paz", "hospital", edge - 5 / 110540.0, -3.6870, 1000.0),
+            ("Hospital La Paz", "hospital", edge + 5 / 110540.0, -3.6870, 1000.0),
+            ("Hospital La Paz", "hospital", edge + 40 / 110540.0, -3.6870, 1000.0),  # 45 m from the first, kept
+        ])
+
+        accepted, rejected = validate_centers(df)
+
+        self.assertEqual(accepted["latitude"].to_list(), [edge - 5 / 110540.0, edge + 40 / 110540.0])
+        self.assertEqual(rejected["reject_reason"].to_list(), ["duplicate"])
+
+    def test_ingestion_writes_reject_file(self):
+        health_center_file = generate_health_centers_csv(
+            os.path.join(self.tmp.name, "health_center.csv"), 2000, duplicate_share=0.05, invalid_share=0.02)
+        population_file = generate_population_csv(os.path.join(self.tmp.name, "population.csv"))
+        reject_file = os.path.join(self.tmp.name, "rejects.csv")
+
+        insert_hospitals_into_object(health_center_file, population_file, reject_file=reject_file)
+
+        reasons = set(pl.read_csv(reject_file, separator=";")["reject_reason"].to_list())
+        self.assertEqual(reasons, {"duplicate", "out_of_bbox"})
+        self.assertFalse(MedicalCenter.objects.filter(latitude__lt=40.30).exists())
+        # Invalid rows must not drag the barrio representative points out of Madrid either
+        west, south, east, north = VALID_BBOX
+        self.assertFalse(BarrioPopulation.objects.exclude(latitude__range=(south, north))
+                         .exclude(latitude__isnull=True).exists())
+        self.assertFalse(BarrioPopulation.objects.exclude(longitude__range=(west, east))
+                         .exclude(longitude__isnull=True).exists())
+
+
+class ChangeFeedTests(StorageTestCase):
+    def row(self, name, **fields):
+        row = dict(type_of_center="hospital", accesibility="0", name=name, city="Madrid", city_district="Centro",
+                   latitude=40.4168, longitude=-3.7038, population_in_district=1000, street="Calle Mayor 1",
+                   is_suggested=False)
+        row.update(fields)
+        return row
+
+    def test_sync_logs_only_what_changed(self):
+        counts, first_version = sync_centers([self.row("A"), self.row("B"), self.row("C")], False, "test")
+        self.assertEqual(counts["inserted"], 3)
+        cursor = self.client.get("/api/get_medical_centers")["X-Change-Seq"]
+
+        counts, version = sync_centers([self.row("A"), self.row("B", latitude=40.42), self.row("D")], False, "test")
+        self.assertEqual(counts, {"inserted": 1, "updated": 1, "deleted": 1, "unchanged": 1})
+        self.assertEqual(version, first_version + 1)
+        self.assertEqual(sync_centers([self.row("A"), self.row("B", latitude=40.42), self.row("D")], False, "test"),
+                         ({"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 3}, version))
+
+        feed = self.client.get("/api/changes", {"since": cursor, "fields": "id,latitude"}).json()
+        ops = {change["op"]: change for change in feed["changes"]}
+        self.assertEqual(set(ops), {"insert", "update", "delete"})
+        self.assertEqual(ops["update"]["row"]["latitude"], 40.42)
+        self.assertIsNone(ops["delete"]["row"])
+        self.assertEqual(changes_since(feed["latest"])["changes"], [])
+
+    def test_compacted_cursor_must_reset(self):
+        sync_centers([self.row("A")], False, "test")
+        sync_centers([self.row("A"), self.row("B")], False, "test")
+
+        self.assertEqual(compact_change_log(keep_versions=1), 1)
+        self.assertTrue(changes_since(0)["reset"])
+        self.assertFalse(changes_since(1)["reset"])
+        self.assertTrue(changes_since(99)["reset"])
+
+    def test_repeated_proposals_replace_the_previous_set(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            insert_hospitals_into_object(*generate_synthetic_dataset(tmp, 500))
+        insert_proposed_hospitals_into_object()
+        insert_proposed_hospitals_into_object()
+
+        self.assertEqual(MedicalCenter.objects.filter(is_suggested=True).count(), 21)
+        self.assertFalse(CenterChange.objects.filter(is_suggested=True).exclude(op="insert").exists())
+
+    def test_swapped_sync_can_be_rolled_back(self):
+        sync_centers([self.row("A"), self.row("B"), self.row("C")], False, "test")
+        sync_centers([self.row("P", is_suggested=True)], True, "test")
+        with self.assertRaises(TableSwapError):
+            rollback_centers()
+        cursor = latest_change_seq()
+
+        counts, version = sync_centers([self.row("A"), self.row("B", latitude=40.42), self.row("D")], False, "test",
+                                       swap=True)
+        self.assertEqual(counts, {"inserted": 1, "updated": 1, "deleted": 1, "unchanged": 1})
+        self.assertEqual(sorted(MedicalCenter.objects.values_list("name", flat=True)), ["A", "B", "D", "P"])
+        self.assertEqual(MedicalCenter.objects.get(name="D").pk, 5)
+        with connection.cursor() as db:
+            indexes = connection.introspection.get_constraints(db, MedicalCenter._meta.db_table)
+        self.assertIn("center_lat_lon_idx", indexes)
+        feed = changes_since(cursor)
+        self.assertEqual(sorted(change["op"] for change in feed["changes"]), ["delete", "insert", "update"])
+        self.assertEqual(_center(name="E").pk, 6)
+
+        changed, rollback_version = rollback_centers()
+        self.assertEqual((changed, rollback_version), (4, version + 1))
+        self.assertEqual(sorted(MedicalCenter.objects.values_list("name", flat=True)), ["A", "B", "C", "P"])
+        self.assertEqual(MedicalCenter.objects.get(name="B").latitude, 40.4168)
+        rollback_centers()
+        self.assertEqual(sorted(MedicalCenter.objects.values_list("name", flat=True)), ["A", "B", "D", "E", "P"])
+
+    def test_swap_is_abandoned_when_centers_change_during_the_load(self):
+        sync_centers([self.row("A")], False, "test")
+
+        def load_then_race(*args):
+            rows = build_staging(*args)
+            sync_centers([self.row("P", is_suggested=True)], True, "test")
+            return rows
+
+        with mock.patch("Backend.changes.build_staging", side_effect=load_then_race):
+            with self.assertRaises(TableSwapError):
+                sync_centers([self.row("B")], False, "test", swap=True)
+        self.assertEqual(sorted(MedicalCenter.objects.values_list("name", flat=True)), ["A", "P"])
+
+
+
+@override_settings(DATASET_EVENTS_POLL_SECONDS=0.05)
+class DatasetEventsTests(StorageTestCase):
+    def _first_two_events(self):
+        """The event a new client gets, and the one after a sync of one center."""
+        async def django_app(scope, receive, send):
+            raise AssertionError("/api/events must not reach Django")
+
+        async def scenario():
+            incoming, sent = asyncio.Queue(), asyncio.Queue()
+            app = DatasetEventsMiddleware(django_app)
+            scope = {"type": "http", "method": "GET", "path": "/api/events", "headers": []}
+            stream = asyncio.ensure_future(app(scope, incoming.get, sent.put))
+            # What a real server sends first for a GET; the stream has to stay open after it
+            await incoming.put({"type": "http.request", "body": b"", "more_body": False})
+
+            async def next_event():
+                while True:
+                    body = (await asyncio.wait_for(sent.get(), timeout=5)).get("body", b"").decode()
+                    data = [line[6:] for line in body.splitlines() if line.startswith("data: ")]
+                    if data:
+                        return json.loads(data[0])
+
+            first = await next_event()
+            row = dict(type_of_center="hospital", accesibility="0", name="A", city="Madrid", city_district="Centro",
+                       latitude=40.4168, longitude=-3.7038, population_in_district=1000, street="Calle Mayor 1",
+                       is_suggested=False)
+            await sync_to_async(sync_centers)([row], False, "test")
+            second = await next_event()
+            await incoming.put({"type": "http.disconnect"})
+            await asyncio.wait_for(stream, timeout=5)
+            return first, second
+
+        return async_to_sync(scenario)()
+
+    def test_stream_announces_new_versions(self):
+        first, second = self._first_two_events()
+        self.assertEqual(first["layers"], [])
+        self.assertEqual(second, {"version": first["version"] + 1, "previous": first["version"],
+                                  "layers": ["centers"]})
+
+    def test_poller_survives_a_failed_check(self):
+        failures = [OperationalError("server closed the connection unexpectedly")]
+
+        def flaky_dataset_event(since, version):
+            if failures:
+                raise failures.pop()
+            return dataset_event(since, version)
+
+        with self.settings(DATASET_EVENTS_POLL_SECONDS=0.05), \
+                mock.patch("Backend.events.dataset_event", flaky_dataset_event), \
+                mock.patch("Backend.events.close_old_connections") as close, \
+                self.assertLogs("Backend.events", "ERROR"):
+            first, second = self._first_two_events()
+        self.assertEqual(failures, [])
+        close.assert_called()
+        self.assertEqual(second["version"], first["version"] + 1)
+
+
+class GeoTests(StorageTestCase):
+    def points(self, n, seed=0):
+        rng = np.random.default_rng(seed)
+        return rng.uniform(40.3, 40.6, n), rng.uniform(-3.85, -3.55, n)
+
+    def test_matches_geopy(self):
+        try:
+            from geopy.distance import geodesic
+        except ImportError:
+            self.skipTest("geopy is not installed")
+
+        rng = np.random.default_rng(1)
+        # City scale plus continental and near-polar pairs
+        (city_lat1, city_lon1), (city_lat2, city_lon2) = self.points(50), self.points(50, seed=2)
+        lat1, lat2 = np.r_[city_lat1, rng.uniform(-85, 85, 50)], np.r_[city_lat2, rng.uniform(-85, 85, 50)]
+        lon1, lon2 = np.r_[city_lon1, rng.uniform(-180, 180, 50)], np.r_[city_lon2, rng.uniform(-180, 180, 50)]
+        expected = np.array([geodesic(a, b).meters for a, b in zip(zip(lat1, lon1), zip(lat2, lon2))])
+
+        np.testing.assert_allclose(vincenty_m(lat1, lon1, lat2, lon2), expected, rtol=0, atol=1e-3)
+        np.testing.assert_allclose(haversine_m(lat1, lon1, lat2, lon2), expected, rtol=6e-3)
+        self.assertEqual(vincenty_m(40.4168, -3.7038, 40.4168, -3.7038), 0.0)
+
+    def test_blocked_matrix_matches_direct(self):
+        lat1, lon1 = self.points(37)
+        lat2, lon2 = self.points(23, seed=1)
+        direct = vincenty_m(lat1[:, None], lon1[:, None], lat2[None, :], lon2[None, :])
+
+        np.testing.assert_allclose(distance_matrix(lat1, lon1, lat2, lon2, "vincenty", block_elements=100), direct)
+        np.testing.assert_allclose(one_to_many(lat1[0], lon1[0], lat2, lon2, "vincenty"), direct[0])
+
+    def test_within_radius_prefilter_is_exact(self):
+        lat, lon = self.points(5_000)
+        indices, distances = within_radius(40.45, -3.70, lat, lon, 2_000, method="vincenty")
+
+        expected = np.flatnonzero(vincenty_m(40.45, -3.70, lat, lon) <= 2_000)
+        np.testing.assert_array_equal(indices, expected)
+        self.assertTrue((distances <= 2_000).all())
+
+
+class PopulationStoreTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        insert_hospitals_into_object(*generate_synthetic_dataset(
+            self.tmp.name, 2000, barrios_per_district=4, years=(2022, 2023, 2024)))
+
+    def test_every_year_is_kept(self):
+        self.assertEqual(get_population_store().years, [2022, 2023, 2024])
+        self.assertEqual(BarrioPopulation.objects.count(), 21 * 4 * 3)
+
+        latest = self.client.get("/api/population").json()
+        self.assertEqual((latest["year"], len(latest["rows"])), (2024, 21))
+        by_code = self.client.get("/api/population", {"year": 2022, "district": "01"}).json()["rows"]
+        by_name = self.client.get("/api/population", {"year": 2022, "district": by_code[0]["distrito"].upper()}).json()["rows"]
+        self.assertEqual(by_code, by_name)
+        barrios = self.client.get("/api/population", {"year": 2022, "district": "1", "level": "barrio"}).json()["rows"]
+        self.assertEqual(sum(b["population"] for b in barrios), by_code[0]["population"])
+
+        self.assertEqual(self.client.get("/api/population", {"year": 1999}).status_code, 400)
+        self.assertEqual(self.client.get("/api/population", {"district": "Atlantis"}).status_code, 400)
+
+    def test_reading_one_year_only_opens_its_partitions(self):
+        store = get_population_store()
+        for year in (2022, 2023):
+            shutil.rmtree(os.path.join(store.directory, "barrios", f"year={year}"))
+
+        barrios = store.barrios(2024)
+        self.assertEqual(barrios.height, 21 * 4)
+        self.assertEqual(barrios["population"].sum(), store.district_totals(2024)["population"].sum())
+
+    def test_previous_store_stays_readable_until_the_next_publish(self):
+        first = get_population_store()
+        barrios = first.barrios(2024)
+        second = write_population_barrios(barrios)
+
+        self.assertEqual(first.barrios(2022).height, 21 * 4)  # partitions opened after the swap
+        self.assertEqual(get_population_store().years, [2024])
+        third = write_population_barrios(barrios)
+        stores = {name for name in os.listdir(store_root()) if name.startswith("population-")}
+        self.assertEqual(stores, {second["name"], third["name"]})
+
+    def test_proposals_for_a_year(self):
+        insert_proposed_hospitals_into_object(year=2022)
+        insert_proposed_hospitals_into_object(demand="barrio", year=2023)
+
+        self.assertEqual(MedicalCenter.objects.filter(is_suggested=True).count(), 21)
+        self.assertEqual(self.client.get("/api/get_proposed_medical_centers", {"year": 1999}).status_code, 400)
+
+
+class StagingTests(StorageTestCase):
+    def test_sources_are_parsed_once_per_content(self):
+        health_center_file, population_file = generate_synthetic_dataset(self.tmp.name, 300)
+        root = os.path.join(self.tmp.name, "staging")
+
+        staged, reused = stage_source(health_center_file, "health_centers", root)
+        self.assertFalse(reused)
+        self.assertEqual(scan_staged(staged).collect_schema(), pl.Schema(HEALTH_CENTER_SCHEMA))
+        self.assertEqual(stage_source(health_center_file, "health_centers", root), (staged, True))
+
+        # A Latin-1 copy of the population file with an extra column
+        df = pl.read_csv(population_file, separator=";", infer_schema=False).with_columns(
+            pl.lit("x").alias("extra"), pl.lit("Chamartín").alias("distrito"))
+        latin1 = os.path.join(self.tmp.name, "population_latin1.csv")
+        with open(latin1, "wb") as f:
+            f.write(df.write_csv(separator=";").encode("latin-1"))
+        first, _ = stage_source(population_file, "population", root)
+        second, reused = stage_source(latin1, "population", root)
+
+        self.assertFalse(reused)
+        self.assertFalse(os.path.exists(first))
+        population = scan_staged(second).collect()
+        self.assertEqual(population.schema, pl.Schema(POPULATION_SCHEMA))
+        self.assertEqual(population["distrito"].unique().to_list(), ["Chamartín"])
+
+
+class HeatmapTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        insert_hospitals_into_object(*generate_synthetic_dataset(self.tmp.name, 3000, barrios_per_district=4))
+
+    def test_grids_add_up_to_the_data(self):
+        response = self.client.get("/api/heatmap", {"layer": "centers", "output": "float32", "resolution": 64})
+        rows, cols = (int(v) for v in response["X-Heatmap-Shape"].split(","))
+        grid = np.frombuffer(response.content, dtype="<f4").reshape(rows, cols)
+        self.assertEqual(max(rows, cols), 64)
+        self.assertEqual(grid.sum(), MedicalCenter.objects.filter(is_suggested=False).count())
+
+        population = self.client.get("/api/heatmap", {"layer": "population", "output": "uint8"})
+        total = sum(BarrioPopulation.objects.values_list("population", flat=True))
+        self.assertAlmostEqual(float(population["X-Heatmap-Total"]) / total, 1.0, places=2)
+        self.assertLess(len(population.content), 32 * 1024)
+        compressed = self.client.get("/api/heatmap", {"layer": "population"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertLess(len(compressed.content), 4 * 1024)
+        self.assertTrue(compressed["ETag"].startswith("W/"))
+        self.assertEqual(self.client.get("/api/heatmap", {"layer": "population"}, HTTP_ACCEPT_ENCODING="gzip",
+                                         HTTP_IF_NONE_MATCH=compressed["ETag"]).status_code, 304)
+
+        png = self.client.get("/api/heatmap", {"layer": "need", "output": "png"})
+        self.assertEqual(png["Content-Type"], "image/png")
+        self.assertEqual(self.client.get("/api/heatmap", {"layer": "need", "output": "png"},
+                                         HTTP_IF_NONE_MATCH=png["ETag"]).status_code, 304)
+
+    def test_cache_follows_the_dataset_version(self):
+        before = self.client.get("/api/heatmap", {"layer": "centers"})
+        self.assertEqual(self.client.get("/api/heatmap", {"layer": "centers"})["ETag"], before["ETag"])
+        _center(latitude=40.45, longitude=-3.70)
+        bump_dataset_version("test")
+        self.assertNotEqual(self.client.get("/api/heatmap", {"layer": "centers"})["ETag"], before["ETag"])
+
+    def test_bad_parameters(self):
+        for params in ({"layer": "roads"}, {"bbox": "1,2,3"}, {"resolution": 5000}, {"output": "gif"}):
+            self.assertEqual(self.client.get("/api/heatmap", params).status_code, 400)
+
+    def test_blur_keeps_the_total(self):
+        grid = np.zeros((20, 20), dtype=np.float32)
+        grid[10, 10] = 100
+        self.assertAlmostEqual(float(gaussian_blur(grid, 1.5).sum()), 100, places=3)
+
+    def test_low_resolution_keeps_the_requested_shape(self):
+        self.assertEqual(gaussian_blur(np.ones((5, 6), dtype=np.float32), 1.5).shape, (5, 6))
+        for layer in ("centers", "population", "need"):
+            response = self.client.get("/api/heatmap", {"layer": layer, "output": "float32", "resolution": 4})
+            rows, cols = (int(v) for v in response["X-Heatmap-Shape"].split(","))
+            self.assertEqual(max(rows, cols), 4, layer)
+            self.assertEqual(len(response.content), rows * cols * 4, layer)
+
+
+class DbSnapshotTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        insert_hospitals_into_object(*generate_synthetic_dataset(self.tmp.name, 500, years=(2023, 2024)))
+        insert_proposed_hospitals_into_object()
+
+    def table_rows(self):
+        return {model: list(model.objects.order_by("pk").values_list()) for model in SNAPSHOT_MODELS}
+
+    def test_restore_brings_back_every_table(self):
+        manifest = write_db_snapshot()
+        self.assertEqual(manifest["dataset_version"], current_dataset_version())
+        before = self.table_rows()
+        for model in SNAPSHOT_MODELS:
+            model.objects.all().delete()
+        for store in ("snapshots", "population"):
+            shutil.rmtree(os.path.join(self.tmp.name, store))
+
+        self.assertEqual(restore_db_snapshot()["name"], manifest["name"])
+        self.assertEqual(self.table_rows(), before)
+        self.assertEqual(current_dataset_version(), manifest["dataset_version"])
+        self.assertEqual(len(current_snapshot()), MedicalCenter.objects.count())
+        self.assertEqual(get_population_store().years, [2023, 2024])
+        # Ids keep counting after the restored ones
+        self.assertGreater(bump_dataset_version("test"), manifest["dataset_version"])
+
+    def test_skipped_when_current_and_refused_when_stale(self):
+        write_db_snapshot()
+        self.assertIsNone(restore_db_snapshot())
+
+        DatasetVersion.objects.all().delete()
+        manifest_path = os.path.join(self.tmp.name, "db_snapshot", write_db_snapshot()["name"], "manifest.json")
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        manifest["tables"][DistrictAccessibility._meta.db_table]["columns"].pop()
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+        with self.assertRaises(DbSnapshotError):
+            restore_db_snapshot(force=True)
+
+
+class DistrictPolygonTests(StorageTestCase):
+    def test_locate_matches_brute_force_ray_casting(self):
+        path = generate_district_boundaries(os.path.join(self.tmp.name, "districts.geojson"),
+                                            vertices_per_edge=30, jitter=0.3)
+        boundaries = load_district_boundaries(path)
+        rng = np.random.default_rng(1)
+        lat, lon = rng.uniform(*MADRID_LAT_RANGE, 5000), rng.uniform(*MADRID_LON_RANGE, 5000)
+
+        expected = np.full(lat.size, -1)
+        with open(path) as f:
+            features = json.load(f)["features"]
+        for index, feature in enumerate(features):
+            ring = np.array(feature["geometry"]["coordinates"][0])
+            inside = np.zeros(lat.size, dtype=bool)
+            for (x0, y0), (x1, y1) in zip(ring, np.roll(ring, -1, axis=0)):
+                if y0 != y1:
+                    inside ^= ((y0 > lat) != (y1 > lat)) & (lon < x0 + (lat - y0) * (x1 - x0) / (y1 - y0))
+            expected[inside & (expected == -1)] = index
+        self.assertEqual(boundaries.locate(lat, lon).tolist(), expected.tolist())
+        self.assertEqual(boundaries.locate([40.0, np.nan], [-3.7, -3.7]).tolist(), [-1, -1])
+
+    def test_holes_multipolygons_and_the_tree(self):
+        square = [[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]]
+        hole = [[1, 1], [3, 1], [3, 3], [1, 3], [1, 1]]
+        path = os.path.join(self.tmp.name, "shapes.geojson")
+        with open(path, "w") as f:
+            json.dump({"type": "FeatureCollection", "features": [
+                {"type": "Feature", "properties": {"NOMBRE": "Ring", "COD_DIS": "01"},
+                 "geometry": {"type": "MultiPolygon", "coordinates": [[square, hole], [[[10, 0], [11, 0], [11, 1], [10, 0]]]]}},
+                {"type": "Feature", "properties": {"NOMBRE": "Inner", "COD_DIS": "02"},
+                 "geometry": {"type": "Polygon", "coordinates": [hole]}},
+            ]}, f)
+        boundaries = load_district_boundaries(path)
+        self.assertEqual(boundaries.codes, ["1", "2"])
+        self.assertEqual(boundaries.locate([0.5, 2, 0.2, 5], [0.5, 2, 10.8, 5]).tolist(), [0, 1, 0, -1])
+
+        rng = np.random.default_rng(0)
+        corners = rng.uniform(0, 1, (3000, 2))
+        boxes = np.column_stack([corners, corners + rng.uniform(0, 0.05, (3000, 2))])
+        x, y = rng.uniform(0, 1, (2, 2000))
+        points, items = STRtree(boxes).query_points(x, y)
+        brute = ((boxes[None, :, 0] <= x[:, None]) & (x[:, None] <= boxes[None, :, 2])
+                 & (boxes[None, :, 1] <= y[:, None]) & (y[:, None] <= boxes[None, :, 3]))
+        self.assertEqual(sorted(zip(points.tolist(), items.tolist())), sorted(zip(*map(np.ndarray.tolist, np.nonzero(brute)))))
+
+    def test_ingestion_overrides_or_validates_the_text_district(self):
+        health_center_file, population_file = generate_synthetic_dataset(self.tmp.name, 500)
+        boundaries_file = generate_district_boundaries(os.path.join(self.tmp.name, "districts.geojson"))
+        raw = pl.read_csv(health_center_file, separator=";", infer_schema=False)
+        raw = raw.with_columns(
+            pl.when(pl.int_range(pl.len()) % 10 == 0).then(pl.lit("DISTRITO")).otherwise("DISTRITO").alias("DISTRITO"),
+            pl.when(pl.int_range(pl.len()) % 10 == 0).then(pl.lit(None)).otherwise("COD-DISTRITO").alias("COD-DISTRITO"),
+        )
+        raw.write_csv(health_center_file, separator=";")
+
+        df, counts = assign_districts(pl.read_csv(health_center_file, separator=";"),
+                                      load_district_boundaries(boundaries_file), mode="validate")
+        self.assertEqual(counts, {"agree": 450, "disagree": 50, "outside": 0})
+        self.assertEqual(df["DISTRITO"].to_list().count("DISTRITO"), 50)
+
+        insert_hospitals_into_object(health_center_file, population_file, district_boundaries=boundaries_file)
+        self.assertFalse(MedicalCenter.objects.filter(city_district="DISTRITO").exists())
+        names = np.array(district_names(21))
+        for center in MedicalCenter.objects.all()[:50]:
+            index = district_of(np.array([center.latitude]), np.array([center.longitude]), 21)[0]
+            self.assertEqual(center.city_district, names[index])
+        self.assertEqual(MedicalCenter.objects.count(), raw.filter(
+            pl.col("NOMBRE").str.contains("^(Centro de Salud|CMSc|Hospital|Centro de Especialidades)")).height)
+
+
+class SummaryTests(StorageTestCase):
+    def test_summary_matches_the_centers_and_tracks_changes(self):
+        insert_hospitals_into_object(*generate_synthetic_dataset(self.tmp.name, 1000))
+        insert_proposed_hospitals_into_object()
+        response = self.client.get("/api/summary")
+        summary = response.json()
+        self.assertLess(len(response.content), 1024)
+
+        centers = MedicalCenter.objects.filter(is_suggested=False)
+        self.assertEqual(summary["version"], current_dataset_version())
+        self.assertEqual(summary["centers"], centers.count())
+        self.assertEqual(summary["proposals"], MedicalCenter.objects.filter(is_suggested=True).count())
+        self.assertEqual(summary["by_type"]["hospital"], centers.filter(type_of_center="hospital").count())
+        self.assertEqual(sum(summary["by_district"].values()), summary["centers"])
+        population = sum(centers.filter(city_district=d).first().population_in_district for d in summary["by_district"])
+        self.assertEqual(summary["population"], population)
+        self.assertEqual(summary["change"]["centers"], 0)
+        self.assertEqual(summary["change"]["proposals"], summary["proposals"])
+
+        sync_centers([{**row, "is_suggested": False} for row in centers.values(*CENTER_FIELDS)[:10]],
+                     is_suggested=False, reason="test")
+        after = self.client.get("/api/summary").json()
+        self.assertEqual((after["previous_version"], after["centers"]), (summary["version"], 10))
+        self.assertEqual(after["change"]["centers"], 10 - summary["centers"])
+        self.assertEqual(sorted(DatasetSummary.objects.values_list("version", flat=True).distinct()),
+                         [summary["version"], after["version"]])
+
+    def test_missing_summary_is_computed_on_request(self):
+        self.assertEqual(self.client.get("/api/summary").json()["centers"], 0)
+        _center(name="A")
+        bump_dataset_version("test")
+        summary = self.client.get("/api/summary").json()
+        self.assertEqual((summary["centers"], summary["change"]), (1, None))
+
+
+class MaximalCoveringTests(StorageTestCase):
+    def test_lazy_greedy_matches_the_plain_greedy(self):
+        rng = np.random.default_rng(3)
+        demand, candidates = rng.uniform(0, 5000, (1500, 2)), rng.uniform(0, 5000, (200, 2))
+        weights = rng.uniform(1, 10, 1500)
+        already = rng.random(1500) < 0.1
+        sets = CoverageSets(demand[:, 0], demand[:, 1], candidates[:, 0], candidates[:, 1], 700)
+        result = maximal_covering(sets, 8, weights, covered=already)
+
+        within = np.hypot(*(demand[:, None, :] - candidates[None, :, :]).transpose(2, 0, 1)) <= 700
+        covered, picks = already.copy(), []
+        for _ in range(8):
+            pick = int(np.argmax((within & ~covered[:, None]).T @ weights))
+            picks.append(pick)
+            covered |= within[:, pick]
+        self.assertEqual(result["sites"], picks)
+        self.assertTrue((result["covered"] == covered).all())
+        self.assertAlmostEqual(result["covered_weight"], weights[covered].sum())
+        self.assertLess(result["evaluations"], 200 * 8)
+        with self.assertRaises(CoverageError):
+            maximal_covering(sets, 0)
+
+    def test_proposals_can_maximize_coverage(self):
+        insert_hospitals_into_object(*generate_synthetic_dataset(self.tmp.name, 100, barrios_per_district=4))
+        response = self.client.get("/api/get_proposed_medical_centers?method=mclp&sites=5&radius=1000")
+
+        self.assertEqual(response.status_code, 200)
+        proposals = MedicalCenter.objects.filter(is_suggested=True)
+        self.assertEqual(proposals.count(), 5)
+        districts = set(BarrioPopulation.objects.values_list("city_district", flat=True))
+        self.assertTrue(set(proposals.values_list("city_district", flat=True)) <= districts)
+        self.assertEqual(self.client.get("/api/get_proposed_medical_centers?method=median").status_code, 400)
+        for query in ("radius=10", "radius=nan", "radius=inf", "sites=0", "sites=100000"):
+            response = self.client.get(f"/api/get_proposed_medical_centers?method=mclp&{query}")
+            self.assertEqual(response.status_code, 400, query)
+        self.assertEqual(MedicalCenter.objects.filter(is_suggested=True).count(), 5)
+
+    def test_candidate_grid_is_bounded(self):
+        lat, lon = np.array([40.40, 40.45]), np.array([-3.75, -3.65])
+        self.assertEqual(len(candidate_grid(lat, lon, 1000, max_candidates=100)[0]), 10 * 7)
+        with self.assertRaises(CoverageError):
+            candidate_grid(lat, lon, 100, max_candidates=100)
+
+
+class ExportTests(StorageTestCase):
+    def setUp(self):
+        super().setUp()
+        _center(name="Inside", latitude=40.42, longitude=-3.70)
+        _center(name="Outside", latitude=40.60, longitude=-3.70)
+        _center(name="Proposal", latitude=40.41, longitude=-3.71, is_suggested=True)
+
+    def _export(self, query):
+        response = self.client.get(f"/api/export?{query}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def test_formats_hold_the_same_rows(self):
+        query = "layers=centers,proposals&bbox=-3.8,40.3,-3.6,40.5"
+        response, body = self._export(f"format=geojson&{query}")
+        self.assertEqual(response["Content-Type"], "application/geo+json")
+        features = json.loads(body)["features"]
+        self.assertEqual(sorted(f["properties"]["name"] for f in features), ["Inside", "Proposal"])
+        self.assertEqual(features[0]["geometry"]["coordinates"], [-3.70, 40.42])
+
+        _, body = self._export(f"format=csv&{query}&fields=name,latitude")
+        self.assertEqual(list(csv.reader(io.StringIO(body.decode()))), [["name", "latitude"], ["Inside", "40.42"],
+                                                                         ["Proposal", "40.41"]])
+
+        _, body = self._export(f"format=geoparquet&{query}")
+        table = pq.read_table(io.BytesIO(body))
+        self.assertEqual(table.column("name").to_pylist(), ["Inside", "Proposal"])
+        self.assertEqual(json.loads(table.schema.metadata[b"geo"])["primary_column"], "geometry")
+        self.assertEqual(np.frombuffer(table.column("geometry")[0].as_py()[5:], dtype="<f8").tolist(), [-3.70, 40.42])
+
+    def test_streams_in_chunks_and_rejects_bad_parameters(self):
+        _, body = self._export("format=geojson")
+        self.assertEqual(len(json.loads(body)["features"]), 2)
+        body, _, _ = export_centers("geojson", layers=("centers", "proposals"), chunk_size=1)
+        self.assertEqual(len(list(body)), 3 + 2)  # one part per row plus the opening and closing
+        self.assertEqual(self.client.get("/api/export?format=xml").status_code, 400)
+        self.assertEqual(self.client.get("/api/export?layers=roads").status_code, 400)
+
+    def test_asgi_sends_each_chunk_as_it_is_encoded(self):
+        pulled = []
+
+        def counting_chunks(queryset, fields, chunk_size):
+            for chunk in export_chunks(queryset, fields, 1):
+                pulled.append(chunk)
+                yield chunk
+
+        async def scenario():
+            incoming, sent = asyncio.Queue(), []
+            await incoming.put({"type": "http.request", "body": b"", "more_body": False})
+
+            async def send(message):
+                if message.get("body"):
+                    sent.append((len(pulled), message["body"]))
+
+            scope = {"type": "http", "method": "GET", "path": "/api/export", "headers": [(b"host", b"testserver")],
+                     "query_string": b"format=csv&layers=centers,proposals&fields=name"}
+            await ASGIHandler()(scope, incoming.get, send)
+            return sent
+
+        # As the test client does: the handler's signals would close the test transaction's connection
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        try:
+            with mock.patch("Backend.export.export_chunks", counting_chunks):
+                sent = async_to_sync(scenario)()
+        finally:
+            request_started.connect(close_old_connections)
+            request_finished.connect(close_old_connections)
+        # The first row went out before the second was read from the database
+        self.assertEqual([count for count, _ in sent], [1, 2, 3])
+        self.assertEqual(b"".join(body for _, body in sent).decode().split(), ["name", "Inside", "Outside", "Proposal"])
 
-# Create your tests here.
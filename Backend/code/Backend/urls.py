@@ -1,8 +1,27 @@
 from .views import  get_proposed_medical_centers
-from .views import  get_medical_centers
+from .views import  get_medical_centers, get_nearest_medical_centers
+from .views import  get_accessibility, get_changes, get_population, get_summary
+from .views import  scenarios, scenario_detail, scenario_sites, scenario_site_detail
+from .views import  get_raster_layers, get_raster_tile, get_raster_zonal_stats
+from .views import  get_vector_tile, get_heatmap_grid, export_medical_centers
 from django.urls import path
 
 urlpatterns = [
     path('get_proposed_medical_centers', get_proposed_medical_centers.as_view(), name = "get_proposed_medical_centers"),
     path('get_medical_centers', get_medical_centers.as_view(), name = "get_medical_centers"),
+    path('get_nearest_medical_centers', get_nearest_medical_centers.as_view(), name = "get_nearest_medical_centers"),
+    path('get_accessibility', get_accessibility.as_view(), name = "get_accessibility"),
+    path('changes', get_changes.as_view(), name = "get_changes"),
+    path('population', get_population.as_view(), name = "get_population"),
+    path('summary', get_summary.as_view(), name = "get_summary"),
+    path('scenarios', scenarios.as_view(), name = "scenarios"),
+    path('scenarios/<str:scenario_id>', scenario_detail.as_view(), name = "scenario_detail"),
+    path('scenarios/<str:scenario_id>/sites', scenario_sites.as_view(), name = "scenario_sites"),
+    path('scenarios/<str:scenario_id>/sites/<str:site_id>', scenario_site_detail.as_view(), name = "scenario_site_detail"),
+    path('rasters', get_raster_layers.as_view(), name = "get_raster_layers"),
+    path('rasters/<str:layer>/zonal', get_raster_zonal_stats.as_view(), name = "get_raster_zonal_stats"),
+    path('rasters/<str:layer>/<int:z>/<int:x>/<int:y>', get_raster_tile.as_view(), name = "get_raster_tile"),
+    path('tiles/<int:z>/<int:x>/<int:y>.mvt', get_vector_tile.as_view(), name = "get_vector_tile"),
+    path('heatmap', get_heatmap_grid.as_view(), name = "get_heatmap"),
+    path('export', export_medical_centers.as_view(), name = "export_medical_centers"),
 ]
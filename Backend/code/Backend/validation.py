@@ -0,0 +1,107 @@
+import math
+
+import polars as pl
+
+# Generous box around the municipality of Madrid (west, south, east, north)
+VALID_BBOX = (-3.90, 40.30, -3.50, 40.65)
+# Same facility listed twice: same type and name, within this distance
+DEFAULT_DEDUP_RADIUS_M = 25.0
+# The cell of a row and its eight neighbours hold every row within one cell size of it
+NEIGHBOUR_CELLS = pl.DataFrame({"dx": [-1, -1, -1, 0, 0, 0, 1, 1, 1], "dy": [-1, 0, 1, -1, 0, 1, -1, 0, 1]})
+
+METERS_PER_DEGREE_LAT = 110_540.0
+METERS_PER_DEGREE_LON = 111_320.0
+
+ACCENTS = ["á", "é", "í", "ó", "ú", "ü", "à", "è", "ì", "ò", "ù", "ñ", "ç"]
+PLAIN = ["a", "e", "i", "o", "u", "u", "a", "e", "i", "o", "u", "n", "c"]
+
+
+def normalized_name(column):
+    """Lowercase, accent-free, punctuation-free version of a name column, for duplicate matching."""
+    return (
+        pl.col(column).str.to_lowercase()
+        .str.replace_many(ACCENTS, PLAIN)
+        .str.replace_all(r"[^a-z0-9]+", " ")
+        .str.strip_chars()
+    )
+
+
+def has_valid_coordinates(bbox=VALID_BBOX, latitude="latitude", longitude="longitude"):
+    """Expression true for rows whose coordinates are present, not NaN and inside ``bbox``."""
+    west, south, east, north = bbox
+    lat, lon = pl.col(latitude), pl.col(longitude)
+    return (lat.is_not_null() & lon.is_not_null() & lat.is_not_nan() & lon.is_not_nan()
+            & lon.is_between(west, east) & lat.is_between(south, north))
+
+
+def rejection_reason(bbox=VALID_BBOX):
+    """Expression with why a row is invalid, null for valid rows. The first failing check wins."""
+    west, south, east, north = bbox
+    lat, lon = pl.col("latitude"), pl.col("longitude")
+    return (
+        pl.when(lat.is_null() | lon.is_null() | lat.is_nan() | lon.is_nan()).then(pl.lit("missing_coordinates"))
+        .when((lon < west) | (lon > east) | (lat < south) | (lat > north)).then(pl.lit("out_of_bbox"))
+        .when(pl.col("name").is_null() | (pl.col("name").str.strip_chars() == "")).then(pl.lit("missing_name"))
+        .when(pl.col("population_in_district").is_null()).then(pl.lit("missing_population"))
+        .otherwise(pl.lit(None, dtype=pl.Utf8))
+    )
+
+
+def validate_centers(df, bbox=VALID_BBOX, radius_m=DEFAULT_DEDUP_RADIUS_M):
+    """
+    Splits the joined centers into rows to insert and rows to reject.
+
+    Rows without coordinates, outside ``bbox``, without a name or without a
+    district population are rejected. Among the rest, a row with the same
+    type and normalized name as an earlier row at most ``radius_m`` away is
+    the same facility and is rejected as a duplicate. Rows are bucketed in
+    a ``radius_m`` grid and only compared with the rows of their own and
+    the eight neighbouring cells (hash joins), so the pass stays linear in
+    the number of rows.
+
+    Returns:
+        tuple[pl.DataFrame, pl.DataFrame]: The valid rows, and the rejected
+        rows with a ``reject_reason`` column.
+    """
+    origin_lat = math.radians((bbox[1] + bbox[3]) / 2)
+    meters_lon = METERS_PER_DEGREE_LON * math.cos(origin_lat)
+
+    df = df.with_columns(
+        pl.col("latitude").cast(pl.Float64, strict=False),
+        pl.col("longitude").cast(pl.Float64, strict=False),
+    ).with_columns(rejection_reason(bbox).alias("reject_reason")).with_row_index("_row")
+
+    points = df.filter(pl.col("reject_reason").is_null()).select(
+        "_row",
+        pl.col("type_of_center").fill_null("").alias("_type"),
+        normalized_name("name").alias("_name"),
+        (pl.col("longitude") * meters_lon).alias("_x"),
+        (pl.col("latitude") * METERS_PER_DEGREE_LAT).alias("_y"),
+    ).with_columns(
+        (pl.col("_x") / radius_m).floor().cast(pl.Int64).alias("_cx"),
+        (pl.col("_y") / radius_m).floor().cast(pl.Int64).alias("_cy"),
+    )
+    nearby = points.join(NEIGHBOUR_CELLS, how="cross").with_columns(
+        pl.col("_cx") + pl.col("dx"), pl.col("_cy") + pl.col("dy"),
+    ).join(points, on=["_type", "_name", "_cx", "_cy"], suffix="_other")
+    duplicates = nearby.filter(
+        (pl.col("_row_other") < pl.col("_row"))
+        & ((pl.col("_x") - pl.col("_x_other")) ** 2 + (pl.col("_y") - pl.col("_y_other")) ** 2 <= radius_m ** 2)
+    ).get_column("_row").unique()
+
+    df = df.with_columns(
+        pl.when(pl.col("_row").is_in(duplicates.implode()))
+        .then(pl.lit("duplicate"))
+        .otherwise(pl.col("reject_reason"))
+        .alias("reject_reason")
+    ).drop("_row")
+
+    accepted = df.filter(pl.col("reject_reason").is_null()).drop("reject_reason")
+    rejected = df.filter(pl.col("reject_reason").is_not_null())
+    return accepted, rejected
+
+
+def write_rejects(rejected, path):
+    """Writes the rejected rows (with their reason) as CSV so they can be reviewed or reported upstream."""
+    rejected.write_csv(path, separator=";")
+    return path
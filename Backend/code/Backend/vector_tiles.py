@@ -0,0 +1,249 @@
+import math
+import os
+import shutil
+import struct
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Max, Min
+
+from .center_snapshot import current_snapshot
+from .dataset_version import current_dataset_version
+from .models import MedicalCenter
+
+EXTENT = 4096
+# Points are thinned to one per THIN_CELL x THIN_CELL tile units (16 -> 256x256 cells per tile)
+THIN_CELL = 16
+# Fraction of a tile added around it so symbols on the edge are not clipped
+BUFFER = 1 / 64
+LAYERS = {
+    "medical_centers": False,
+    "proposed_sites": True,
+}
+ATTRIBUTES = ("name", "type_of_center", "city_district", "street")
+MADRID_BBOX = (-3.89, 40.31, -3.52, 40.56)
+DEFAULT_SEED_MAX_ZOOM = 13
+
+
+# --- Tile math ------------------------------------------------------------
+
+def tile_bounds(z, x, y):
+    """(west, south, east, north) in degrees of a Web Mercator (XYZ) tile."""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y)
+
+
+def mercator_y(latitudes):
+    latitudes = np.clip(np.asarray(latitudes, dtype=np.float64), -85.0511, 85.0511)
+    return np.log(np.tan(np.pi / 4 + np.radians(latitudes) / 2))
+
+
+def tiles_covering(bbox, z):
+    west, south, east, north = bbox
+    n = 2 ** z
+
+    def column(lon):
+        return min(n - 1, max(0, int((lon + 180) / 360 * n)))
+
+    def row(lat):
+        return min(n - 1, max(0, int((1 - float(mercator_y(lat)) / math.pi) / 2 * n)))
+
+    for x in range(column(west), column(east) + 1):
+        for y in range(row(north), row(south) + 1):
+            yield x, y
+
+
+# --- Protobuf encoding (vector_tile.proto v2) ------------------------------
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, payload):
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _packed(field, values):
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _value(value):
+    if isinstance(value, bool):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        return _key(6, 0) + _varint(_zigzag(value)) if value < 0 else _key(5, 0) + _varint(value)
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack("<d", value)
+    return _bytes_field(1, str(value).encode("utf-8"))
+
+
+def encode_layer(name, features, extent=EXTENT):
+    """
+    Encodes one MVT layer of point features.
+
+    Args:
+        features: iterable of (id, x, y, properties) with x/y in tile units.
+    """
+    keys, values = {}, {}
+    encoded = []
+    for feature_id, x, y, properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        geometry = (9, _zigzag(int(x)), _zigzag(int(y)))  # MoveTo(1), dx, dy
+        feature = (_key(1, 0) + _varint(feature_id) + _packed(2, tags)
+                   + _key(3, 0) + _varint(1) + _packed(4, geometry))
+        encoded.append(_bytes_field(2, feature))
+
+    layer = _key(15, 0) + _varint(2) + _bytes_field(1, name.encode("utf-8")) + b"".join(encoded)
+    layer += b"".join(_bytes_field(3, key.encode("utf-8")) for key in keys)
+    layer += b"".join(_bytes_field(4, _value(value)) for _, value in values)
+    layer += _key(5, 0) + _varint(extent)
+    return _bytes_field(3, layer)
+
+
+# --- Tile generation -------------------------------------------------------
+
+def layer_features(z, x, y, is_suggested):
+    """
+    Points of one layer inside the (buffered) tile, thinned to one per grid cell.
+
+    A kept point carries ``point_count`` with how many points it stands for,
+    so clients can size symbols at low zoom.
+    """
+    west, south, east, north = tile_bounds(z, x, y)
+    pad_lon = (east - west) * BUFFER
+    pad_lat = (north - south) * BUFFER
+    box = (west - pad_lon, south - pad_lat, east + pad_lon, north + pad_lat)
+
+    snapshot = current_snapshot()
+    if snapshot is not None:
+        indices = snapshot.bbox(*box, is_suggested=is_suggested)
+        lat = snapshot.table["latitude"][indices]
+        lon = snapshot.table["longitude"][indices]
+    else:
+        rows = list(
+            MedicalCenter.objects.filter(
+                is_suggested=is_suggested,
+                longitude__gte=box[0], latitude__gte=box[1], longitude__lte=box[2], latitude__lte=box[3],
+            ).order_by("pk").values_list("pk", "latitude", "longitude", *ATTRIBUTES)
+        )
+        lat = np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows))
+        lon = np.fromiter((r[2] for r in rows), dtype=np.float64, count=len(rows))
+    if not lat.size:
+        return []
+
+    top, bottom = mercator_y(north), mercator_y(south)
+    px = np.round((lon - west) / (east - west) * EXTENT).astype(np.int64)
+    py = np.round((top - mercator_y(lat)) / (top - bottom) * EXTENT).astype(np.int64)
+
+    cells = (py // THIN_CELL) * (EXTENT // THIN_CELL * 4) + px // THIN_CELL
+    _, first, counts = np.unique(cells, return_index=True, return_counts=True)
+
+    if snapshot is not None:
+        kept = snapshot.records(indices[first], fields=("id", *ATTRIBUTES))
+    else:
+        kept = [dict(zip(("id", *ATTRIBUTES), (rows[index][0], *rows[index][3:]))) for index in first]
+
+    features = []
+    for index, count, properties in zip(first, counts, kept):
+        properties["point_count"] = int(count)
+        features.append((properties.pop("id"), px[index], py[index], properties))
+    return features
+
+
+def render_tile(z, x, y):
+    return b"".join(
+        encode_layer(name, layer_features(z, x, y, is_suggested))
+        for name, is_suggested in LAYERS.items()
+    )
+
+
+# --- On-disk cache ---------------------------------------------------------
+
+def cache_root():
+    return str(settings.TILE_CACHE_ROOT)
+
+
+def tile_path(version, z, x, y):
+    return os.path.join(cache_root(), f"v{version}", str(z), str(x), f"{y}.mvt")
+
+
+def get_tile(z, x, y, version=None):
+    """
+    Encoded tile for the current dataset version, rendered once and then read from disk.
+
+    Returns:
+        tuple[int, bytes]: The dataset version and the tile.
+    """
+    if version is None:
+        version = current_dataset_version()
+    path = tile_path(version, z, x, y)
+    try:
+        with open(path, "rb") as f:
+            return version, f.read()
+    except FileNotFoundError:
+        pass
+
+    tile = render_tile(z, x, y)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(tile)
+    os.replace(tmp, path)
+    return version, tile
+
+
+def purge_stale_versions(keep_version):
+    root = cache_root()
+    if not os.path.isdir(root):
+        return
+    for name in os.listdir(root):
+        if name != f"v{keep_version}":
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def seed_tile_cache(max_zoom=DEFAULT_SEED_MAX_ZOOM, bbox=None):
+    """
+    Renders every tile over the data's bounding box up to ``max_zoom`` and drops older versions.
+
+    Returns:
+        int: Number of tiles seeded.
+    """
+    if bbox is None:
+        box = MedicalCenter.objects.aggregate(
+            west=Min("longitude"), south=Min("latitude"), east=Max("longitude"), north=Max("latitude"))
+        bbox = MADRID_BBOX if box["west"] is None else (box["west"], box["south"], box["east"], box["north"])
+
+    version = current_dataset_version()
+    purge_stale_versions(version)
+    seeded = 0
+    for z in range(max_zoom + 1):
+        for x, y in tiles_covering(bbox, z):
+            get_tile(z, x, y, version)
+            seeded += 1
+    return seeded
+
@@ -1,23 +1,313 @@
+import math
+
 from django.shortcuts import render
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .serializers import MedicalCenterSerializer
-from .models import MedicalCenter
-from .proposed_hospitals_algorithm import insert_proposed_hospitals_into_object
+from rest_framework import status
+from rest_framework.renderers import BrowsableAPIRenderer
+from .serializers import DistrictAccessibilitySerializer, medical_center_rows, parse_fields
+from .renderers import FastJSONRenderer, FirstRendererNegotiation
+from .export import AsyncChunks, export_centers, parse_layers
+from .models import MedicalCenter, DistrictAccessibility, BarrioPopulation
+from .vector_tiles import get_tile
+from .heatmap import DEFAULT_RESOLUTION, get_heatmap, parse_bbox
+from .center_snapshot import current_snapshot
+from .changes import changes_since, latest_change_seq
+from .population_store import PopulationError, get_population_store
+from .summary import dataset_summary
+from .rasters import RasterError, get_store, list_layers, zonal_mean, tile_png
+from .metrics import serializer_timer
+from .scenarios import DEFAULT_COVERAGE_RADIUS_M, ScenarioError, create_scenario, get_scenario
+from .proposed_hospitals_algorithm import DEFAULT_MCLP_SITES, insert_proposed_hospitals_into_object
 from .proposed_hospitals_database import insert_hospitals_into_object
 
+def _centers_data(request, is_suggested, fields):
+    snapshot = current_snapshot()
+    with serializer_timer(request):
+        if snapshot is not None:
+            return snapshot.records(snapshot.select(is_suggested), fields)
+        return medical_center_rows(MedicalCenter.objects.filter(is_suggested=is_suggested), fields)
+
 class get_medical_centers(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
     def get(self, request):
-        centers = MedicalCenter.objects.all()
-        centers = centers.filter(is_suggested=False)
-        serialized = MedicalCenterSerializer(centers, many=True)
-        return Response(serialized.data)
+        try:
+            fields = parse_fields(request.query_params.get("fields"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        # Read before the rows: a client syncing from here may replay a change, never miss one
+        seq = latest_change_seq()
+        return Response(_centers_data(request, is_suggested=False, fields=fields), headers={"X-Change-Seq": seq})
     
 class get_proposed_medical_centers(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request):
+        try:
+            fields = parse_fields(request.query_params.get("fields"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            year = int(request.query_params["year"]) if "year" in request.query_params else None
+            insert_proposed_hospitals_into_object(
+                demand=request.query_params.get("demand", "district"),
+                year=year,
+                method=request.query_params.get("method", "centroid"),
+                sites=int(request.query_params.get("sites", DEFAULT_MCLP_SITES)),
+                radius_m=float(request.query_params.get("radius", DEFAULT_COVERAGE_RADIUS_M)),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        seq = latest_change_seq()
+        return Response(_centers_data(request, is_suggested=True, fields=fields), headers={"X-Change-Seq": seq})
+
+class get_nearest_medical_centers(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request):
+        try:
+            latitude, longitude = float(request.query_params["lat"]), float(request.query_params["lon"])
+        except (KeyError, ValueError):
+            return Response({"error": "lat and lon are required numbers"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            k = int(request.query_params.get("k", 5))
+            if k < 1:
+                raise ValueError(k)
+        except ValueError:
+            return Response({"error": "k must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
+        k = min(k, 100)
+        try:
+            fields = parse_fields(request.query_params.get("fields"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        snapshot = current_snapshot()
+        if snapshot is None:
+            return Response({"error": "No center snapshot available; run download_db first"},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        rows, distances = snapshot.nearest(latitude, longitude, k, is_suggested=False)
+        data = snapshot.records(rows, fields)
+        for row, distance in zip(data, distances.tolist()):
+            row["distance_m"] = distance
+        return Response(data)
+
+class get_changes(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request):
+        try:
+            since = int(request.query_params.get("since", 0))
+            fields = parse_fields(request.query_params.get("fields"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(changes_since(since, fields))
+
+class get_summary(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request):
+        return Response(dataset_summary())
+
+class get_accessibility(APIView):
+    def get(self, request):
+        rows = DistrictAccessibility.objects.order_by("city_district", "type_of_center")
+        with serializer_timer(request):
+            data = DistrictAccessibilitySerializer(rows, many=True).data
+        return Response(data)
+
+class get_population(APIView):
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request):
+        store = get_population_store()
+        if store is None:
+            return Response({"error": "No population data ingested yet"}, status=status.HTTP_404_NOT_FOUND)
+        level = request.query_params.get("level", "district")
+        try:
+            year = int(request.query_params["year"]) if "year" in request.query_params else None
+            district = request.query_params.get("district")
+            if level == "district":
+                rows = store.district_totals(year, district)
+            elif level == "barrio":
+                rows = store.barrios(year, district)
+            else:
+                raise PopulationError("level must be district or barrio")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"year": store.resolve_year(year), "years": store.years, "rows": rows.to_dicts()})
+
+def _coordinates(data):
+    try:
+        latitude, longitude = float(data["latitude"]), float(data["longitude"])
+    except (KeyError, TypeError, ValueError):
+        raise ScenarioError("latitude and longitude are required numbers")
+    if not (math.isfinite(latitude) and math.isfinite(longitude)):
+        raise ScenarioError("latitude and longitude must be finite")
+    return latitude, longitude
+
+class scenarios(APIView):
+    def post(self, request):
+        try:
+            scenario_id, scenario = create_scenario(
+                coverage_radius_m=float(request.data.get("coverage_radius_m", DEFAULT_COVERAGE_RADIUS_M)),
+                type_of_center=request.data.get("type_of_center"),
+            )
+        except (ScenarioError, ValueError) as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"scenario_id": scenario_id, **scenario.describe()}, status=status.HTTP_201_CREATED)
+
+class scenario_detail(APIView):
+    def get(self, request, scenario_id):
+        try:
+            scenario = get_scenario(scenario_id)
+        except ScenarioError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"scenario_id": scenario_id, **scenario.describe()})
+
+class scenario_sites(APIView):
+    def post(self, request, scenario_id):
+        try:
+            scenario = get_scenario(scenario_id)
+        except ScenarioError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            return Response(scenario.add_site(*_coordinates(request.data)), status=status.HTTP_201_CREATED)
+        except ScenarioError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+class scenario_site_detail(APIView):
+    def put(self, request, scenario_id, site_id):
+        try:
+            scenario = get_scenario(scenario_id)
+        except ScenarioError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            latitude, longitude = _coordinates(request.data)
+        except ScenarioError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(scenario.move_site(site_id, latitude, longitude))
+        except ScenarioError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+    def delete(self, request, scenario_id, site_id):
+        try:
+            return Response(get_scenario(scenario_id).remove_site(site_id))
+        except ScenarioError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+class get_raster_layers(APIView):
+    def get(self, request):
+        return Response(list_layers())
+
+class get_raster_tile(APIView):
+    def get(self, request, layer, z, x, y):
+        try:
+            store = get_store(layer)
+            tile = store.tile(z, x, y)
+        except RasterError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.query_params.get("format") == "png":
+            response = HttpResponse(tile_png(store, tile), content_type="image/png")
+        else:
+            # Raw little-endian float32, tile_size x tile_size, NaN where there is no data
+            response = HttpResponse(memoryview(tile), content_type="application/octet-stream")
+            response["X-Tile-Shape"] = f"{tile.shape[0]},{tile.shape[1]}"
+            response["X-Tile-Dtype"] = "float32"
+        response["X-Tile-Bounds"] = ",".join(str(v) for v in store.tile_bounds(z, x, y))
+        response["X-Layer-Version"] = store.metadata["version"]
+        return response
+
+_zonal_cache = {}
+
+class get_raster_zonal_stats(APIView):
+    def get(self, request, layer):
+        try:
+            store = get_store(layer)
+        except RasterError as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+        latest_year = BarrioPopulation.objects.order_by("-year").values_list("year", flat=True).first()
+        points = list(BarrioPopulation.objects.filter(year=latest_year, latitude__isnull=False)
+                      .order_by("pk").values_list("city_district", "latitude", "longitude"))
+        if not points:
+            return Response({"error": "No district points available; run download_db first"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        key = (store.metadata["version"], hash(tuple(points)))
+        if key not in _zonal_cache:
+            labels, lat, lon = zip(*points)
+            _zonal_cache.clear()
+            _zonal_cache[key] = [
+                {"city_district": row["zone"], "mean_potential": row["mean"], "pixels": row["pixels"]}
+                for row in zonal_mean(store, labels, lat, lon)
+            ]
+        return Response({"layer": layer, "version": store.metadata["version"], "districts": _zonal_cache[key]})
+
+class get_vector_tile(APIView):
+    def get(self, request, z, x, y):
+        if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return Response({"error": "Tile out of range"}, status=status.HTTP_404_NOT_FOUND)
+        version, tile = get_tile(z, x, y)
+        response = HttpResponse(tile, content_type="application/vnd.mapbox-vector-tile")
+        response["ETag"] = f'"v{version}-{z}-{x}-{y}"'
+        response["Cache-Control"] = "public, max-age=60"
+        return response
+
+class get_heatmap_grid(APIView):
     def get(self, request):
-        insert_proposed_hospitals_into_object()
-        centers = MedicalCenter.objects.all()
-        centers = centers.filter(is_suggested=True)
-        serialized = MedicalCenterSerializer(centers, many=True)
-        return Response(serialized.data)
-    
\ No newline at end of file
+        try:
+            entry = get_heatmap(
+                layer=request.query_params.get("layer", "centers"),
+                bbox=parse_bbox(request.query_params.get("bbox")),
+                resolution=int(request.query_params.get("resolution", DEFAULT_RESOLUTION)),
+                # Not "format": DRF reserves it for picking a renderer
+                fmt=request.query_params.get("output", "uint8"),
+                year=int(request.query_params["year"]) if "year" in request.query_params else None,
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Weak comparison: compressed responses carry the ETag as W/"..."
+        not_modified = get_conditional_response(request, etag=entry["etag"])
+        if not_modified is not None:
+            return not_modified
+        if entry["format"] == "png":
+            response = HttpResponse(entry["body"], content_type="image/png")
+        else:
+            # Row-major, row 0 at the north edge; uint8 values are fractions of X-Heatmap-Max
+            response = HttpResponse(entry["body"], content_type="application/octet-stream")
+            response["X-Heatmap-Dtype"] = entry["format"]
+        response["X-Heatmap-Shape"] = f"{entry['shape'][0]},{entry['shape'][1]}"
+        response["X-Heatmap-Max"] = entry["max"]
+        response["X-Heatmap-Total"] = entry["total"]
+        response["X-Heatmap-Bounds"] = ",".join(str(v) for v in entry["bounds"])
+        response["ETag"] = entry["etag"]
+        response["Cache-Control"] = "public, max-age=60"
+        return response
+
+class export_medical_centers(APIView):
+    renderer_classes = [FastJSONRenderer]
+    content_negotiation_class = FirstRendererNegotiation
+
+    def get(self, request):
+        try:
+            bbox = request.query_params.get("bbox")
+            body, content_type, extension = export_centers(
+                fmt=request.query_params.get("format", "geojson"),
+                layers=parse_layers(request.query_params.get("layers")),
+                bbox=parse_bbox(bbox) if bbox else None,
+                fields=parse_fields(request.query_params.get("fields")),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if isinstance(request._request, ASGIRequest):
+            body = AsyncChunks(body)
+        response = StreamingHttpResponse(body, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="medical_centers.{extension}"'
+        return response
+
@@ -9,8 +9,19 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'configs.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+if settings.DEBUG:
+    # runserver used to serve the admin and browsable API assets
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+    django_application = ASGIStaticFilesHandler(django_application)
+
+from Backend.events import DatasetEventsMiddleware  # noqa: E402  (needs the app registry)
+
+# /api/events (server-sent dataset updates) is served here; everything else goes to Django
+application = DatasetEventsMiddleware(django_application)
@@ -39,19 +39,65 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    'corsheaders',
     'Backend'
 ]
 
 MIDDLEWARE = [
+    'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'Backend.compression.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'Backend.metrics.MetricsMiddleware',
 ]
 
+# The Streamlit page fetches vector tiles from the browser, so they are served cross-origin to the frontend
+CORS_ALLOWED_ORIGINS = os.environ.get('FRONTEND_ORIGINS', 'http://localhost:8501,http://127.0.0.1:8501').split(',')
+CORS_URLS_REGEX = r'^/api/tiles/'
+
+# Responses below this size are not worth compressing
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+
+# Return per-request view/db/serializer timings in a Server-Timing header
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', 'false').lower() == 'true'
+
+# Tiled, memory-mapped raster layers (solar, wind, ...) written by ingest_rasters
+RASTER_ROOT = os.environ.get('RASTER_ROOT', BASE_DIR / 'rasters')
+
+# Memory-mapped snapshot of the MedicalCenter table shared by all workers
+CENTER_SNAPSHOT_ROOT = os.environ.get('CENTER_SNAPSHOT_ROOT', BASE_DIR / 'snapshots')
+
+# Dataset versions whose center changes stay in the change feed; older cursors must refetch everything
+CHANGE_LOG_RETENTION_VERSIONS = int(os.environ.get('CHANGE_LOG_RETENTION_VERSIONS', 20))
+
+# Center syncs writing at least this many rows load a staging table and swap it in (rollback_centers undoes one)
+CENTER_SWAP_MIN_CHANGES = int(os.environ.get('CENTER_SWAP_MIN_CHANGES', 1000))
+
+# How often the SSE broadcaster (/api/events) looks for versions committed by other processes
+DATASET_EVENTS_POLL_SECONDS = float(os.environ.get('DATASET_EVENTS_POLL_SECONDS', 2))
+
+# Raw sources converted to typed Parquet, keyed by checksum, so re-ingestion skips CSV parsing
+STAGING_ROOT = os.environ.get('STAGING_ROOT', BASE_DIR / 'staging')
+
+# Population history as Parquet partitioned by year and district (published like the center snapshot)
+POPULATION_ROOT = os.environ.get('POPULATION_ROOT', BASE_DIR / 'population')
+
+# Parquet dump of the ingested tables written after each ingestion; restored on boot by restore_db
+DB_SNAPSHOT_ROOT = os.environ.get('DB_SNAPSHOT_ROOT', BASE_DIR / 'db_snapshot')
+
+# District polygons (GeoJSON, WGS84) the centers are located in during ingestion; skipped when the file is missing.
+# 'override' replaces the free-text DISTRITO with the polygon's district, 'validate' only reports disagreements.
+DISTRICT_BOUNDARIES_FILE = os.environ.get('DISTRICT_BOUNDARIES_FILE', BASE_DIR / 'boundaries' / 'districts.geojson')
+DISTRICT_ASSIGNMENT = os.environ.get('DISTRICT_ASSIGNMENT', 'override')
+
+# On-disk cache of rendered vector tiles, one directory per dataset version
+TILE_CACHE_ROOT = os.environ.get('TILE_CACHE_ROOT', BASE_DIR / 'tile_cache')
+
 ROOT_URLCONF = 'configs.urls'
 
 TEMPLATES = [
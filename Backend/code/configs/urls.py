@@ -17,8 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 from django.urls import include
+from Backend.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/', include('Backend.urls'))
+    path('api/', include('Backend.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
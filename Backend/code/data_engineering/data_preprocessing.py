@@ -4,31 +4,15 @@ import os
 import polars as pl
 import os
 import pandas as pd
-import chardet
-import pandas as pd
 import numpy as np
-from geopy.distance import distance
 
-# Function to convert file to UTF-8
-def convert_to_utf8(input_file, output_file=None):
-    if output_file is None:
-        output_file = input_file.replace('.csv', '_utf8.csv')
-    
-    # Detect encoding
-    with open(input_file, 'rb') as f:
-        raw_data = f.read()
-        encoding = chardet.detect(raw_data)['encoding']
-        print(f"Detected encoding: {encoding}")
-    
-    # Read with detected encoding and save as UTF-8
-    with open(input_file, 'r', encoding=encoding, errors='replace') as f:
-        content = f.read()
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(content)
-    
-    print(f"File converted to UTF-8: {output_file}")
-    return output_file
+# Run from Backend/code (python -m data_engineering.data_preprocessing) so the Backend package is importable
+from Backend.staging import scan_staged, stage_source
+
+# Same staging directory as download_db by default (settings.STAGING_ROOT, BASE_DIR/staging), so either one
+# reuses what the other parsed, wherever the script is run from
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGING_ROOT = os.environ.get("STAGING_ROOT", os.path.join(BASE_DIR, "staging"))
 
 def download_file_urllib(url: str, local_filename: str = None) -> str:
     """
@@ -69,11 +53,11 @@ population_madrid_url = f"https://datos.madrid.es/egob/catalogo/300557-0-poblaci
 download_file_urllib(health_centers_url, "health_center.csv")
 download_file_urllib(population_madrid_url, "population.csv")
 
-utf8_file_health_centers = convert_to_utf8("health_center.csv")
-utf8_file_population_madrid = convert_to_utf8("population.csv")
+staged_health_centers, _ = stage_source("health_center.csv", "health_centers", STAGING_ROOT)
+staged_population, _ = stage_source("population.csv", "population", STAGING_ROOT)
 
-df = pl.read_csv(utf8_file_health_centers, separator=";")
-df_population = pl.read_csv(utf8_file_population_madrid, separator=";", infer_schema_length=None)
+df = scan_staged(staged_health_centers).collect()
+df_population = scan_staged(staged_population).collect()
 
 df_with_type = df.with_columns(
     pl.when(pl.col("NOMBRE").str.starts_with("Centro de Salud"))
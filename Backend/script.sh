@@ -6,7 +6,14 @@ python3 /Backend/code/manage.py	migrate --verbosity=3
 
 python /Backend/code/manage.py createsuperuser --username=${DJANGO_SUPERUSER} --email=${DJANGO_SUPERUSER_EMAIL} --noinput
 
-python /Backend/code/manage.py download_db
+# Serve the last ingestion's snapshot within seconds and refresh from the sources in the background;
+# without a usable snapshot the first ingestion has to finish before the server starts
+if python /Backend/code/manage.py restore_db; then
+    python /Backend/code/manage.py download_db &
+else
+    python /Backend/code/manage.py download_db
+fi
 
 #gunicorn --bind 0.0.0.0:8000 --workers 3 Register.code.configs.wsgi:application
-exec python3 /Backend/code/manage.py runserver 0.0.0.0:${BACKEND_PORT}
\ No newline at end of file
+# ASGI so /api/events can hold server-sent event streams open
+exec uvicorn configs.asgi:application --app-dir /Backend/code --host 0.0.0.0 --port ${BACKEND_PORT} --reload
\ No newline at end of file
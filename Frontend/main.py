@@ -7,6 +7,12 @@ from geopy.geocoders import Nominatim
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 import requests
 import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+from folium.plugins import VectorGridProtobuf
 from typing import List, Tuple
 
 # --- MADRID CONSTANTS ---
@@ -23,7 +29,7 @@ class MedicalCenter:
     def __init__(self, type_of_center: str = "Hospital", accesibility: str = "Total", name: str = "Center", city: str = "Madrid",
                  city_district: str = "Centro", latitude: float = MADRID_LAT, longitude: float = MADRID_LON,
                  population_in_district: int = 100000, street: str = "Default St", is_suggested: bool = False,
-                 lat: float = None, lon: float = None): # Added lat/lon as aliases for compatibility
+                 lat: float = None, lon: float = None, center_id: int | None = None): # Added lat/lon as aliases for compatibility
 
         # Prioritize 'latitude'/'longitude' if provided, fall back to 'lat'/'lon'
         self.latitude = latitude if latitude is not None else lat
@@ -39,6 +45,8 @@ class MedicalCenter:
         self.city_district = city_district
         self.population_in_district = population_in_district
         self.is_suggested = is_suggested
+        # Backend id, used to patch the cached layers from the change feed (None for simulated centers)
+        self.center_id = center_id
 
     def __str__(self):
         return self.name
@@ -79,7 +87,8 @@ class MedicalCenter:
                     accesibility=item.get('accesibility', 'Total'),
                     city=item.get('city', 'Madrid'),
                     city_district=item.get('city_district', 'Centro'),
-                    population_in_district=item.get('population_in_district', 100000)
+                    population_in_district=item.get('population_in_district', 100000),
+                    center_id=item.get('id')
                 ))
 
             if centers:
@@ -121,6 +130,34 @@ class MedicalCenter:
 
 API_ENDPOINT_MISSING = "http://Backend:8080/api/get_proposed_medical_centers"
 API_ENDPOINT_HOSPITALS = "http://Backend:8080/api/get_medical_centers"
+API_ENDPOINT_ACCESSIBILITY = "http://Backend:8080/api/get_accessibility"
+API_ENDPOINT_SUMMARY = "http://Backend:8080/api/summary"
+API_ENDPOINT_CHANGES = "http://Backend:8080/api/changes"
+API_ENDPOINT_EVENTS = "http://Backend:8080/api/events"
+
+# Columns each map layer renders; the backend only selects and sends these
+HOSPITAL_LAYER_FIELDS = "id,latitude,longitude,name,street"
+MISSING_LAYER_FIELDS = "id,latitude,longitude"
+CHANGE_FEED_FIELDS = HOSPITAL_LAYER_FIELDS
+
+# The browser fetches vector tiles itself, so it needs an address reachable from outside the compose network
+BACKEND_PUBLIC_URL = os.environ.get("BACKEND_PUBLIC_URL", "http://localhost:8080")
+USE_VECTOR_TILES = os.environ.get("USE_VECTOR_TILES", "1") == "1"
+# Server-side binned density overlays (/api/heatmap): a few KB per map instead of every point
+DENSITY_LAYERS = {"None": None, "Medical centers": "centers", "Population": "population", "Need (people per center)": "need"}
+HEATMAP_BBOX = (-3.90, 40.30, -3.50, 40.65)  # west, south, east, north
+# Downloads of the points in view, streamed by the backend (/api/export) straight to the browser
+EXPORT_FORMATS = {"GeoJSON": "geojson", "CSV": "csv", "GeoParquet": "geoparquet"}
+EXPORT_LAYERS = {"All": "centers,proposals", "Hospitals (Green)": "centers", "Missing Hospitals (Red)": "proposals"}
+
+# Layer data is held once per Streamlit process, not per browser session; these bound what it may hold
+LAYER_CACHE_BUDGET_MB = float(os.environ.get("LAYER_CACHE_BUDGET_MB", "256"))
+LAYER_CACHE_TTL_S = float(os.environ.get("LAYER_CACHE_TTL_S", "3600"))
+# Characters of the proposals payload shown in the sidebar log
+RAW_LOG_PREVIEW_CHARS = 2000
+# Stand-ins for layers this page did not download
+EMPTY_HOSPITALS = pd.DataFrame({"id": [], "lat": [], "lon": [], "name": [], "street": []})
+EMPTY_MISSING = pd.DataFrame({"id": [], "lat": [], "lon": []})
 
 @st.cache_data
 def geocode_location(location_name: str) -> Tuple[float, float] | None:
@@ -139,38 +176,40 @@ def geocode_location(location_name: str) -> Tuple[float, float] | None:
 
 # --- DATA ACQUISITION & PROCESSING FUNCTIONS ---
 
-@st.cache_data
-def fetch_and_process_hospitals(url: str) -> pd.DataFrame:
+def fetch_and_process_hospitals(url: str) -> Tuple[pd.DataFrame, int | None]:
     """
     Fetches existing medical centers (Hospitals - Green) from the API.
-    Returns a DataFrame for mapping.
+    Returns a DataFrame for mapping and the change feed position it reflects (None for simulated data).
     """
     st.info("Attempting to get Existing Hospitals (Green) from the backend...")
     raw_json_data = ""
 
     try:
         # 1. Fetch data from the API endpoint
-        response = requests.get(url, timeout=40)
+        response = requests.get(url, params={"fields": HOSPITAL_LAYER_FIELDS}, timeout=40)
         response.raise_for_status()
         raw_json_data = response.text
 
         st.success("✅ Existing Hospitals successfully retrieved from the backend.")
 
+        change_seq = int(response.headers.get("X-Change-Seq", 0))
+
         # 2. Convert JSON string to list of MedicalCenter objects
         centers: List[MedicalCenter] = MedicalCenter.from_json_list(raw_json_data, is_missing=False)
 
         # 3. Convert list of objects to a DataFrame for map rendering
         if not centers:
             # This case is handled by the fallback inside MedicalCenter.from_json_list
-            return pd.DataFrame({"lat": [], "lon": [], "name": [], "street": []})
+            return pd.DataFrame({"id": [], "lat": [], "lon": [], "name": [], "street": []}), change_seq
 
         data = {
+            "id": [center.center_id for center in centers],
             "lat": [center.latitude for center in centers],
             "lon": [center.longitude for center in centers],
             "name": [center.name for center in centers],
             "street": [center.street for center in centers]
         }
-        return pd.DataFrame(data)
+        return pd.DataFrame(data), change_seq
 
     except requests.exceptions.RequestException as e:
         st.warning(f"❌ Connection or API response failed for Existing Hospitals. Using simulated data: {e}")
@@ -179,47 +218,49 @@ def fetch_and_process_hospitals(url: str) -> pd.DataFrame:
         centers = MedicalCenter.from_json_list("", is_missing=False)
 
         data = {
+            "id": [center.center_id for center in centers],
             "lat": [center.latitude for center in centers],
             "lon": [center.longitude for center in centers],
             "name": [center.name for center in centers],
             "street": [center.street for center in centers]
         }
-        return pd.DataFrame(data)
+        return pd.DataFrame(data), None
 
     except Exception as e:
         st.error(f"❌ Error processing received Hospital data: {e}")
-        return pd.DataFrame({"lat": [], "lon": [], "name": [], "street": []})
+        return pd.DataFrame({"id": [], "lat": [], "lon": [], "name": [], "street": []}), None
 
 
-@st.cache_data
-def fetch_and_process_missing_points(url: str) -> Tuple[pd.DataFrame, str]:
+def fetch_and_process_missing_points(url: str) -> Tuple[pd.DataFrame, str, int | None]:
     """
     Fetches proposed medical centers (Missing Hospitals - Red) from the API.
-    Returns a DataFrame for mapping and the raw JSON data string.
+    Returns a DataFrame for mapping, the raw JSON data string and the change feed position (None for simulated data).
     """
     st.info("Attempting to get Missing Hospitals (Red) from the backend...")
     raw_json_data = ""
 
     try:
         # 1. Fetch data from the API endpoint
-        response = requests.get(url, timeout=40)
+        response = requests.get(url, params={"fields": MISSING_LAYER_FIELDS}, timeout=40)
         response.raise_for_status()
         raw_json_data = response.text
 
         st.success("✅ Missing Hospitals successfully retrieved from the backend.")
+        change_seq = int(response.headers.get("X-Change-Seq", 0))
 
         # 2. Convert JSON string to list of MedicalCenter objects
         centers: List[MedicalCenter] = MedicalCenter.from_json_list(raw_json_data, is_missing=True)
 
         # 3. Convert list of objects to a DataFrame for map rendering
         if not centers:
-            return pd.DataFrame({"lat": [], "lon": []}), raw_json_data
+            return pd.DataFrame({"id": [], "lat": [], "lon": []}), raw_json_data, change_seq
 
         data = {
+            "id": [center.center_id for center in centers],
             "lat": [center.latitude for center in centers],
             "lon": [center.longitude for center in centers]
         }
-        return pd.DataFrame(data), raw_json_data
+        return pd.DataFrame(data), raw_json_data, change_seq
 
     except requests.exceptions.RequestException as e:
         st.warning(f"❌ Connection or API response failed for Missing Hospitals. Using simulated data: {e}")
@@ -228,28 +269,366 @@ def fetch_and_process_missing_points(url: str) -> Tuple[pd.DataFrame, str]:
         centers = MedicalCenter.from_json_list("", is_missing=True)
 
         data = {
+            "id": [c.center_id for c in centers],
             "lat": [c.latitude for c in centers],
             "lon": [c.longitude for c in centers]
         }
-        return pd.DataFrame(data), f"Connection Failed: {e}"
+        return pd.DataFrame(data), f"Connection Failed: {e}", None
 
     except Exception as e:
         st.error(f"❌ Error processing received Missing Hospital data: {e}")
-        return pd.DataFrame({"lat": [], "lon": []}), f"Processing Error: {e}"
+        return pd.DataFrame({"id": [], "lat": [], "lon": []}), f"Processing Error: {e}", None
+
+@st.cache_data(ttl=600)
+def fetch_accessibility(url: str) -> pd.DataFrame:
+    """
+    Fetches the precomputed accessibility per district and center type.
+    Returns an empty DataFrame if the backend has none (or is unreachable).
+    """
+    try:
+        response = requests.get(url, timeout=40)
+        response.raise_for_status()
+        return pd.DataFrame(response.json())
+    except (requests.exceptions.RequestException, ValueError):
+        return pd.DataFrame()
+
+@st.cache_data(ttl=600)
+def fetch_summary(url: str) -> dict | None:
+    """
+    Fetches the backend's precomputed counts for the metric cards (well under 1 KB, no points).
+    Returns None if the backend is unreachable.
+    """
+    try:
+        response = requests.get(url, timeout=10)
+        response.raise_for_status()
+        return response.json()
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+# --- SHARED LAYER CACHE ---
+
+def compact_layer(df: pd.DataFrame) -> pd.DataFrame:
+    """Smallest dtypes that keep the map exact enough: float32 coordinates (under a meter), downcast ids, categorical text."""
+    columns = {}
+    for column in df.columns:
+        if column in ("lat", "lon"):
+            columns[column] = df[column].astype(np.float32)
+        elif column == "id":
+            columns[column] = pd.to_numeric(df[column], downcast="integer")
+        else:
+            columns[column] = df[column].astype("category")
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(df)))
+
+
+def log_preview(raw: str, limit: int = RAW_LOG_PREVIEW_CHARS) -> str:
+    """The start of a raw payload, with its full size when it had to be cut."""
+    if len(raw) <= limit:
+        return raw
+    return f"{raw[:limit]}\n... ({len(raw):,} characters in total, showing the first {limit:,})"
+
+
+class LayerCache:
+    """
+    Map layers shared by every session of the Streamlit process.
+
+    Entries are keyed by (layer, change feed position), so sessions at the
+    same position share one compact DataFrame and a session only keeps the
+    key. The cache holds at most ``budget_mb`` (least recently used
+    entries go first, the newest one always stays) and drops entries not
+    used for ``ttl_s``. A session whose entry was evicted picks up the
+    latest entry of the layer or fetches it again.
+    """
+
+    def __init__(self, budget_mb: float = LAYER_CACHE_BUDGET_MB, ttl_s: float = LAYER_CACHE_TTL_S):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.ttl_s = ttl_s
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl_s
+        for key in [key for key, entry in self._entries.items() if entry["used"] < cutoff]:
+            del self._entries[key]
+
+    def get(self, key: tuple | None) -> dict | None:
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["used"] = time.monotonic()
+                self._entries.move_to_end(key)
+            return entry
+
+    def latest(self, layer: str) -> dict | None:
+        """Most recently stored entry of ``layer`` that is still current (not retired by a dataset event)."""
+        with self._lock:
+            self._expire()
+            entries = [entry for (name, _), entry in self._entries.items() if name == layer and not entry["retired"]]
+            if not entries:
+                return None
+            entry = max(entries, key=lambda entry: entry["stored"])
+            entry["used"] = time.monotonic()
+            self._entries.move_to_end(entry["key"])
+            return entry
+
+    def put(self, layer: str, seq: int | None, df: pd.DataFrame, log: str = "") -> dict:
+        """Stores a layer at a change feed position; when another session got there first, its entry is returned."""
+        key = (layer, seq)
+        df = compact_layer(df)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["retired"]:
+                entry = {"key": key, "seq": seq, "df": df, "log": log, "retired": False, "stored": now,
+                         "bytes": int(df.memory_usage(deep=True).sum()) + len(log)}
+                self._entries[key] = entry
+            entry["used"] = now
+            self._entries.move_to_end(key)
+            self._expire()
+            while len(self._entries) > 1 and self.total_bytes() > self.budget_bytes:
+                self._entries.popitem(last=False)
+            return entry
+
+    def retire(self, layer: str) -> None:
+        """Stops handing the layer's entries to new sessions; sessions holding one keep patching it."""
+        with self._lock:
+            for (name, _), entry in self._entries.items():
+                if name == layer:
+                    entry["retired"] = True
+
+    def total_bytes(self) -> int:
+        return sum(entry["bytes"] for entry in self._entries.values())
+
+
+@st.cache_resource
+def layer_cache() -> LayerCache:
+    return LayerCache()
+
+
+def session_layer(layer: str) -> dict | None:
+    """This session's entry of a layer: the one it holds, else the latest shared one."""
+    entry = layer_cache().get(st.session_state.layer_keys.get(layer))
+    if entry is None:
+        entry = layer_cache().latest(layer)
+    st.session_state.layer_keys[layer] = entry["key"] if entry is not None else None
+    return entry
+
+# --- INCREMENTAL SYNC ---
+
+def apply_center_changes(df: pd.DataFrame, changes: list, is_suggested: bool) -> pd.DataFrame:
+    """
+    Patches one cached layer with a page of the change feed: every changed id is dropped
+    and the current version of inserted/updated centers is added back.
+    """
+    relevant = [change for change in changes if change["is_suggested"] == is_suggested]
+    if not relevant:
+        return df
+
+    kept = df[~df["id"].isin({change["id"] for change in relevant})]
+    rows = [
+        {"id": row["id"], "lat": row["latitude"], "lon": row["longitude"], "name": row.get("name"), "street": row.get("street")}
+        for row in (change["row"] for change in relevant) if row is not None
+    ]
+    added = pd.DataFrame(rows, columns=["id", "lat", "lon", "name", "street"])[list(df.columns)]
+    return pd.concat([kept, added], ignore_index=True)
+
+
+def sync_center_layers(hospitals: dict, missing: dict) -> Tuple[dict, dict]:
+    """
+    Brings both layers up to date through /api/changes instead of refetching them.
+    The patched layers go to the shared cache, so other sessions at the same position reuse them.
+    If the backend says the cursor is too old, both layers are retired and fetched again (None is returned for them).
+    """
+    if hospitals["seq"] is None or missing["seq"] is None:
+        return hospitals, missing
+    # Syncing from the older of the two positions may replay a change, but never skips one
+    seq = min(hospitals["seq"], missing["seq"])
+    df_hospitals, df_missing = hospitals["df"], missing["df"]
+
+    try:
+        while True:
+            response = requests.get(API_ENDPOINT_CHANGES, params={"since": seq, "fields": CHANGE_FEED_FIELDS}, timeout=10)
+            response.raise_for_status()
+            feed = response.json()
+            if feed["reset"]:
+                layer_cache().retire("centers")
+                layer_cache().retire("proposals")
+                st.session_state.layer_keys = {}
+                return None, None
+
+            df_hospitals = apply_center_changes(df_hospitals, feed["changes"], is_suggested=False)
+            df_missing = apply_center_changes(df_missing, feed["changes"], is_suggested=True)
+            seq = feed["latest"]
+            if not feed["more"]:
+                break
+    except (requests.exceptions.RequestException, ValueError, KeyError):
+        # Keep showing what we have; the next rerun tries again from the same cursor
+        return hospitals, missing
+
+    if seq != hospitals["seq"]:
+        hospitals = layer_cache().put("centers", seq, df_hospitals)
+    if seq != missing["seq"]:
+        missing = layer_cache().put("proposals", seq, df_missing, missing["log"])
+    st.session_state.layer_keys = {"centers": hospitals["key"], "proposals": missing["key"]}
+    return hospitals, missing
+
+class DatasetWatcher:
+    """
+    Listens to the backend's server-sent dataset events in a background thread.
+
+    There is one watcher per Streamlit server. On each event it retires the
+    shared entries of the layers that changed (new sessions fetch them
+    again) and records the version, so sessions know to patch theirs on
+    the next rerun.
+    """
+
+    def __init__(self, url: str, cache: LayerCache):
+        self.url = url
+        self.cache = cache
+        self.connected = False
+        # Dataset version at which each layer ("centers", "proposals") last changed
+        self.layer_versions: dict = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="dataset-events", daemon=True).start()
+
+    def seen(self) -> dict:
+        with self._lock:
+            return dict(self.layer_versions)
+
+    def _run(self) -> None:
+        last_version = None
+        while True:
+            headers = {"Last-Event-ID": str(last_version)} if last_version is not None else {}
+            try:
+                # The backend sends a keep-alive comment every 15 s, so a long read timeout means it is gone
+                with requests.get(self.url, headers=headers, stream=True, timeout=(5, 60)) as response:
+                    response.raise_for_status()
+                    self.connected = True
+                    data = []
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line.startswith("data:"):
+                            data.append(line[5:].strip())
+                        elif not line and data:
+                            event = json.loads("\n".join(data))
+                            data = []
+                            self._handle(event)
+                            last_version = event["version"]
+            except (requests.exceptions.RequestException, ValueError, KeyError):
+                pass
+            self.connected = False
+            time.sleep(3)
+
+    def _handle(self, event: dict) -> None:
+        layers = event.get("layers", [])
+        fetch_summary.clear()
+        if "centers" in layers:
+            self.cache.retire("centers")
+            fetch_accessibility.clear()
+        if "proposals" in layers:
+            self.cache.retire("proposals")
+        with self._lock:
+            for layer in layers:
+                self.layer_versions[layer] = event["version"]
+
+
+@st.cache_resource
+def dataset_watcher() -> DatasetWatcher:
+    return DatasetWatcher(API_ENDPOINT_EVENTS, layer_cache())
+
+
+@st.fragment(run_every=5)
+def watch_dataset_updates() -> None:
+    """Reruns the page when the backend has announced data this session has not applied yet."""
+    if dataset_watcher().seen() != st.session_state.dataset_layers_seen:
+        st.rerun()
 
 # --- METRICS FUNCTIONS ---
 
-def count_hospitals(df_hospitals: pd.DataFrame) -> int:
-    """Counts the total number of hospitals."""
+def count_hospitals(df_hospitals: pd.DataFrame, summary: dict | None = None) -> int:
+    """Counts the total number of hospitals, from the backend summary when available."""
+    if summary is not None:
+        return summary["centers"]
     return len(df_hospitals)
 
-def count_missing(df_missing: pd.DataFrame) -> int:
-    """Counts the total number of missing points."""
+def count_missing(df_missing: pd.DataFrame, summary: dict | None = None) -> int:
+    """Counts the total number of missing points, from the backend summary when available."""
+    if summary is not None:
+        return summary["proposals"]
     return len(df_missing)
 
+def change_label(summary: dict | None, key: str) -> str:
+    """E.g. "+3 since v41" for a count in the summary's change block; empty without a previous version."""
+    if summary is None or summary.get("change") is None:
+        return ""
+    return f"{summary['change'][key]:+d} since v{summary['previous_version']}"
+
+def accessibility_mean_km(df_accessibility: pd.DataFrame, type_of_center: str) -> float | None:
+    """City-wide population-weighted mean distance (km) to the nearest center of a type."""
+    if df_accessibility.empty:
+        return None
+    rows = df_accessibility[df_accessibility['type_of_center'] == type_of_center]
+    if rows.empty or rows['population'].sum() == 0:
+        return None
+    return float(np.average(rows['mean_distance_m'], weights=rows['population'])) / 1000
+
+def worst_p90_district(df_accessibility: pd.DataFrame, type_of_center: str) -> Tuple[str, float] | None:
+    """District with the largest 90th-percentile distance (km) to the nearest center of a type."""
+    if df_accessibility.empty:
+        return None
+    rows = df_accessibility[df_accessibility['type_of_center'] == type_of_center]
+    if rows.empty:
+        return None
+    worst = rows.loc[rows['p90_distance_m'].idxmax()]
+    return worst['city_district'], float(worst['p90_distance_m']) / 1000
+
 # --- MAP VISUALIZATION FUNCTION ---
 
-def create_map(df_hospitals: pd.DataFrame, df_missing: pd.DataFrame, point_filter: str, search_center: Tuple[float, float] | None = None) -> folium.Map:
+def add_vector_tile_layer(m: folium.Map, point_filter: str) -> None:
+    """Add the medical centers / proposed sites MVT layer, styled per source layer."""
+    hidden = {"radius": 0, "fill": False, "stroke": False}
+    centers = {"radius": 4, "fill": True, "fillColor": "#16a34a", "fillOpacity": 0.8, "color": "#14532d", "weight": 1}
+    proposed = {"radius": 5, "fill": True, "fillColor": "#dc2626", "fillOpacity": 0.8, "color": "#7f1d1d", "weight": 1}
+
+    options = {
+        "vectorTileLayerStyles": {
+            "medical_centers": centers if point_filter in ["All", "Hospitals (Green)"] else hidden,
+            "proposed_sites": proposed if point_filter in ["All", "Missing Hospitals (Red)"] else hidden,
+        },
+        "interactive": True,
+        "maxNativeZoom": 16,
+    }
+    VectorGridProtobuf(f"{BACKEND_PUBLIC_URL}/api/tiles/{{z}}/{{x}}/{{y}}.mvt", "Medical centers", options).add_to(m)
+
+
+def add_density_overlay(m: folium.Map, layer: str) -> None:
+    """Overlay the backend's binned heatmap of ``layer`` as a translucent PNG."""
+    west, south, east, north = HEATMAP_BBOX
+    url = (f"{BACKEND_PUBLIC_URL}/api/heatmap?layer={layer}&output=png&resolution=256"
+           f"&bbox={west},{south},{east},{north}")
+    folium.raster_layers.ImageOverlay(image=url, bounds=[[south, west], [north, east]], opacity=0.6,
+                                      name=f"Density: {layer}").add_to(m)
+
+
+def map_view_bbox(map_state: dict | None) -> Tuple[float, float, float, float] | None:
+    """(west, south, east, north) of what the map showed on the last rerun, None before it reported any."""
+    bounds = (map_state or {}).get("bounds") or {}
+    south_west, north_east = bounds.get("_southWest") or {}, bounds.get("_northEast") or {}
+    try:
+        return (float(south_west["lng"]), float(south_west["lat"]), float(north_east["lng"]), float(north_east["lat"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def export_url(fmt: str, point_filter: str, bbox: Tuple[float, float, float, float] | None) -> str:
+    """Backend export link for the displayed layers, limited to the map view when it is known."""
+    params = {"format": fmt, "layers": EXPORT_LAYERS[point_filter]}
+    if bbox is not None:
+        params["bbox"] = ",".join(f"{value:.6f}" for value in bbox)
+    return f"{BACKEND_PUBLIC_URL}/api/export?" + urlencode(params, safe=",")
+
+
+def create_map(df_hospitals: pd.DataFrame, df_missing: pd.DataFrame, point_filter: str, search_center: Tuple[float, float] | None = None,
+               density_layer: str | None = None) -> folium.Map:
     """Create a Folium map showing hospitals and missing points."""
 
     # 1. Determine Map Center and Zoom
@@ -269,6 +648,14 @@ def create_map(df_hospitals: pd.DataFrame, df_missing: pd.DataFrame, point_filte
     # Initialize the map
     m = folium.Map(location=[center_lat, center_lon], zoom_start=zoom_level, tiles="OpenStreetMap")
 
+    if density_layer:
+        add_density_overlay(m, density_layer)
+
+    # Vector tiles: the browser draws every point from the backend's MVT endpoint
+    if USE_VECTOR_TILES:
+        add_vector_tile_layer(m, point_filter)
+        return m
+
     # Draw Hospitals (Green Cross Icon)
     if point_filter in ["All", "Hospitals (Green)"]:
         for _, row in df_hospitals.iterrows():
@@ -301,6 +688,43 @@ def create_map(df_hospitals: pd.DataFrame, df_missing: pd.DataFrame, point_filte
 
 # --- STREAMLIT APP ---
 
+def load_point_layers(need_centers: bool) -> Tuple[pd.DataFrame, pd.DataFrame, str]:
+    """
+    The point layers this session shows, patched through the change feed or fetched when missing.
+    The existing centers are only downloaded when ``need_centers`` (folium draws the markers); the
+    proposals are always requested, since that request is what computes them on the backend.
+    Returns the hospitals and missing DataFrames and the raw log of the proposals response.
+    """
+    # Patch already loaded layers with whatever changed in the backend since.
+    # With the event stream up this only happens when an update was announced; without it, on every rerun.
+    watcher = dataset_watcher()
+    layers_seen = watcher.seen()
+    hospitals, missing = session_layer("centers"), session_layer("proposals")
+    if hospitals is not None and missing is not None:
+        if not watcher.connected or layers_seen != st.session_state.get('dataset_layers_seen'):
+            hospitals, missing = sync_center_layers(hospitals, missing)
+    elif missing is not None and missing["retired"]:
+        # Only the proposals are held (vector tiles), so there is nothing to patch them alongside: refetch
+        missing = None
+    st.session_state.dataset_layers_seen = layers_seen
+
+    # Missing Hospitals (Red Points)
+    if missing is None:
+        with st.spinner("⏳ Connecting to backend and loading missing hospitals (Red)..."):
+            df_missing_data, log_data, missing_seq = fetch_and_process_missing_points(API_ENDPOINT_MISSING)
+        missing = layer_cache().put("proposals", missing_seq, df_missing_data, log_preview(log_data))
+        st.session_state.layer_keys["proposals"] = missing["key"]
+
+    # Existing Hospitals (Green Points)
+    if hospitals is None and need_centers:
+        with st.spinner("⏳ Connecting to backend and loading existing hospitals (Green)..."):
+            df_hospitals_data, hospitals_seq = fetch_and_process_hospitals(API_ENDPOINT_HOSPITALS)
+        hospitals = layer_cache().put("centers", hospitals_seq, df_hospitals_data)
+        st.session_state.layer_keys["centers"] = hospitals["key"]
+
+    df_hospitals = hospitals["df"] if hospitals is not None else EMPTY_HOSPITALS
+    return df_hospitals, missing["df"], missing["log"]
+
 def main():
     st.set_page_config(
         page_title="VitalScan",
@@ -313,29 +737,24 @@ def main():
         st.session_state.search_location = ""
     if 'center_coords' not in st.session_state:
         st.session_state.center_coords = None
-    if 'df_missing_cached' not in st.session_state:
-        st.session_state.df_missing_cached = None
-    if 'raw_backend_log' not in st.session_state:
-        st.session_state.raw_backend_log = ""
+    if 'map_bounds' not in st.session_state:
+        st.session_state.map_bounds = None
+    if 'layer_keys' not in st.session_state:
+        # (layer, change feed position) of the shared LayerCache entries this session shows
+        st.session_state.layer_keys = {}
 
     # --- DATA LOADING ---
 
-    # 1. Load Missing Hospitals (Red Points)
-    if st.session_state.df_missing_cached is None:
-        with st.spinner("⏳ Connecting to backend and loading missing hospitals (Red)..."):
-            df_missing_data, log_data = fetch_and_process_missing_points(API_ENDPOINT_MISSING)
-
-        st.session_state.df_missing_cached = df_missing_data
-        st.session_state.raw_backend_log = log_data
+    # 1. Precomputed accessibility and counts for the metric cards: no points needed
+    df_accessibility = fetch_accessibility(API_ENDPOINT_ACCESSIBILITY)
+    summary = fetch_summary(API_ENDPOINT_SUMMARY)
 
-    # Use cached data
-    df_missing = st.session_state.df_missing_cached
-    raw_backend_log = st.session_state.raw_backend_log
-
-    # 2. Load Existing Hospitals (Green Points)
-    # This function uses st.cache_data, so we don't need manual session state caching here.
-    with st.spinner("⏳ Connecting to backend and loading existing hospitals (Green)..."):
-        df_hospitals = fetch_and_process_hospitals(API_ENDPOINT_HOSPITALS)
+    # 2. Points are loaded after the cards are drawn, unless the cards have to count them (no summary)
+    points_loaded = summary is None
+    if points_loaded:
+        df_hospitals, df_missing, raw_backend_log = load_point_layers(need_centers=True)
+    else:
+        df_hospitals, df_missing, raw_backend_log = EMPTY_HOSPITALS, EMPTY_MISSING, ""
     # -------------------------------------------------------------
 
     # --- INYECTAR TAILWIND CDN Y OVERRIDES CSS ---
@@ -415,13 +834,19 @@ def main():
             index=0,
             help="Select which types of points to display on the map."
         )
+        density_choice = st.selectbox(
+            "Density Overlay:",
+            options=list(DENSITY_LAYERS),
+            index=0,
+            help="Heatmap binned by the backend, drawn under the points."
+        )
 
         # --- RAW DATA LOG ---
         st.markdown("<hr class='border-gray-600'>", unsafe_allow_html=True)
         st.subheader("Backend Raw Data Log (Missing)")
 
-        # Log only the raw data from the missing points endpoint
-        st.code(raw_backend_log, language='json')
+        # Log only the raw data from the missing points endpoint; filled in once the points are loaded
+        raw_log_slot = st.empty()
 
 
     # --- MAIN CONTENT ---
@@ -431,6 +856,15 @@ def main():
 
     col_hosp_metric, col_missing_metric, col_search_controls = st.columns([2, 2, 4])
 
+    hospital_mean_km = accessibility_mean_km(df_accessibility, 'hospital')
+    hospital_detail = (f"Avg. {hospital_mean_km:.1f} km to nearest hospital"
+                       if hospital_mean_km is not None else "Accessibility not available")
+    worst_district = worst_p90_district(df_accessibility, 'hospital')
+    missing_detail = (f"P90 {worst_district[1]:.1f} km in {worst_district[0]}"
+                      if worst_district is not None else "Accessibility not available")
+    if summary is not None and summary["population_per_center"] is not None:
+        hospital_detail += f" · {summary['population_per_center']:,.0f} residents per center"
+
     with col_hosp_metric:
         st.markdown(
             f"""
@@ -438,8 +872,9 @@ def main():
                 <div class="text-sm text-gray-500 mb-1 flex items-center">
                     <i class="fas fa-hospital-alt text-lg mr-2 text-green-600"></i> Hospitals
                 </div>
-                <div class="text-4xl font-extrabold text-gray-900">{count_hospitals(df_hospitals)}</div>
-                <div class="text-xs font-semibold text-green-600 mt-2">+10 <i class="fas fa-arrow-up ml-1"></i></div>
+                <div class="text-4xl font-extrabold text-gray-900">{count_hospitals(df_hospitals, summary)}</div>
+                <div class="text-xs text-gray-500">{change_label(summary, "centers")}</div>
+                <div class="text-xs font-semibold text-green-600 mt-2">{hospital_detail} <i class="fas fa-route ml-1"></i></div>
             </div>
             """, unsafe_allow_html=True
         )
@@ -451,8 +886,9 @@ def main():
                 <div class="text-sm text-gray-500 mb-1 flex items-center">
                     <i class="fas fa-map-marker-slash text-lg mr-2 text-red-600"></i> Missing Hospitals
                 </div>
-                <div class="text-4xl font-extrabold text-gray-900">{count_missing(df_missing)}</div>
-                <div class="text-xs font-semibold text-red-600 mt-2">-5 <i class="fas fa-arrow-down ml-1"></i></div>
+                <div class="text-4xl font-extrabold text-gray-900">{count_missing(df_missing, summary)}</div>
+                <div class="text-xs text-gray-500">{change_label(summary, "proposals")}</div>
+                <div class="text-xs font-semibold text-red-600 mt-2">{missing_detail} <i class="fas fa-route ml-1"></i></div>
             </div>
             """, unsafe_allow_html=True
         )
@@ -500,6 +936,11 @@ def main():
     # 2. Interactive Map
     st.markdown("<h2 class='text-2xl font-semibold text-gray-900 mb-4 mt-8'>Interactive Map</h2>", unsafe_allow_html=True)
 
+    # With vector tiles the browser draws the centers itself, so only folium markers need the center list
+    if not points_loaded:
+        df_hospitals, df_missing, raw_backend_log = load_point_layers(need_centers=not USE_VECTOR_TILES)
+    raw_log_slot.code(raw_backend_log, language='json')
+
 
     map_toolbar_cols = st.columns([1, 1, 1, 1, 6])
     with map_toolbar_cols[0]:
@@ -509,10 +950,16 @@ def main():
     with map_toolbar_cols[2]:
         st.button("Draw", help="Draw shapes on the map")
     with map_toolbar_cols[3]:
-        st.button("Export", help="Export map view")
+        with st.popover("Export", help="Download the displayed points inside the map view"):
+            for label, fmt in EXPORT_FORMATS.items():
+                st.link_button(label, export_url(fmt, point_filter, st.session_state.map_bounds), use_container_width=True)
+
+    folium_map = create_map(df_hospitals, df_missing, point_filter, search_center=st.session_state.center_coords,
+                            density_layer=DENSITY_LAYERS[density_choice])
+    map_state = st_folium(folium_map, width='100%', height=500)
+    st.session_state.map_bounds = map_view_bbox(map_state) or st.session_state.map_bounds
 
-    folium_map = create_map(df_hospitals, df_missing, point_filter, search_center=st.session_state.center_coords)
-    st_folium(folium_map, width='100%', height=500)
+    watch_dataset_updates()
 
 # --- RUN APP ---
 